@@ -1,73 +1,120 @@
-import requests
 import pandas as pd
-from dateutil import parser
+from datetime import timedelta
+from urllib.parse import urlencode
 import logging
-
-logging.basicConfig(filename='scraper.log',
-                    format='%(asctime)s-%(levelname)s-FILE:%(filename)s-FUNC:%(funcName)s-LINE:%(lineno)d-%(message)s',
-                    level=logging.INFO)
+import http_client
+import fetcher
 
 logger = logging.getLogger(__name__)
 
 API_URL = "https://eonet.gsfc.nasa.gov/api/v3/events"
 
-
-def get_events_from_api(API_URL):
-    """ Calls a get requests form the URL of the API that will provide a json file.
-    This function returns a dataframe with the natural events stored in the json file."""
-
-    a = requests.get(API_URL)
-    logger.info('Got the json file from the API')
-    dico = a.json()
-    df_events = pd.DataFrame.from_dict(data=dico['events'], orient='columns')
-    return df_events
-
-
-def re_organise_df(df):
-    """ This function returns a dataframe with just the important columns : title, id and geometry """
-    df_new = df[['title', 'id', 'geometry']]
-    return df_new
-
-
-def get_info_from_geometry(df):
-    """ This function returns a dataframe with the information stored in the given geometry columns.
-    It creates 5 new columns to store the main informations of the natural event """
-    s_mag_value = df['geometry'].apply(lambda x: x[0]['magnitudeValue'])
-    s_mag_unit = df['geometry'].apply(lambda x: x[0]['magnitudeUnit'])
-    s_date = df['geometry'].apply(lambda x: x[0]['date'])
-    s_type = df['geometry'].apply(lambda x: x[0]['type'])
-    s_coord = df['geometry'].apply(lambda x: x[0]['coordinates'])
-
-    # copying df, adding the relevant columns and dropping the geometry one
-    df_new = df.join(pd.DataFrame({'magnitude_value': s_mag_value, 'magnitude_unit': s_mag_unit, 'date': s_date, 'coordinates': s_coord, 'type': s_type}))
-    df_new.drop(['geometry'], axis=1, inplace=True)
-    return df_new
+# the natural events kept from the API, and the id of their category in EONET. Each category is the one of a single
+# kind of event, the sea and lake ice events are the icebergs
+CATEGORIES = {'Drought': 'drought',
+              'Dust and Haze': 'dustHaze',
+              'Earthquake': 'earthquakes',
+              'Flood': 'floods',
+              'Iceberg': 'seaLakeIce',
+              'Landslide': 'landslides',
+              'Manmade': 'manmade',
+              'Severe Storms': 'severeStorms',
+              'Snow': 'snow',
+              'Temperature': 'tempExtremes',
+              'Volcano': 'volcanoes',
+              'Water Color': 'waterColor',
+              'Fire': 'wildfires'}
+EVENT_BY_CATEGORY = {category: event for event, category in CATEGORIES.items()}
+EVENT_COLUMNS = ['title', 'id', 'magnitude_value', 'magnitude_unit', 'date', 'coordinates', 'type']
+GEOMETRY_COLUMNS = {'magnitudeValue': 'magnitude_value', 'magnitudeUnit': 'magnitude_unit', 'date': 'date',
+                    'coordinates': 'coordinates', 'type': 'type'}
+DEFAULT_WORKERS = 4
+DEFAULT_WINDOW_DAYS = 30
+
+
+def date_windows(start, end, window_days=DEFAULT_WINDOW_DAYS):
+    """ splits the dates from start to end (datetime or date, today when end is None) into consecutive windows of at
+    most window_days days. Returns a list of (start, end) pairs, or [(None, end)] when there is no start date."""
+    if start is None:
+        return [(None, end)]
+    end = end or type(start).today()
+    windows = []
+    while start <= end:
+        window_end = min(start + timedelta(days=window_days - 1), end)
+        windows.append((start, window_end))
+        start = window_end + timedelta(days=1)
+    return windows
+
+
+def category_url(category, start=None, end=None, limit=None, status=None):
+    """ returns the url of the events of one EONET category, restricted to the dates from start to end"""
+    params = {'category': category}
+    if start is not None:
+        params['start'] = start.strftime('%Y-%m-%d')
+    if end is not None:
+        params['end'] = end.strftime('%Y-%m-%d')
+    if limit:
+        params['limit'] = limit
+    if status:
+        params['status'] = status
+    return API_URL + '?' + urlencode(params)
+
+
+def get_category_events(url):
+    """ returns the list of events of a category url, each event is tagged with the category that was queried"""
+    category = url.split('category=')[1].split('&')[0]
+    events = http_client.get(url).json()['events']
+    for event in events:
+        event['category'] = category
+    logger.info(f'Got {len(events)} events from {url}')
+    return events
+
+
+def get_events_by_category(start=None, end=None, limit=None, status=None, workers=DEFAULT_WORKERS,
+                           window_days=DEFAULT_WINDOW_DAYS):
+    """ queries the events of every category of CATEGORIES, in windows of window_days days between start and end,
+    with workers requests at the same time. Returns the list of all the events."""
+    urls = [category_url(category, window_start, window_end, limit, status)
+            for category in sorted(EVENT_BY_CATEGORY)
+            for window_start, window_end in date_windows(start, end, window_days)]
+    return [event for events in fetcher.fetch_in_order(get_category_events, urls, workers=workers)
+            for event in events]
+
+
+def flatten_events(events):
+    """ This function returns a dataframe with one row per event: its title, id and category, and the information of
+    its first geometry. All the geometries are flattened in a single pass with json_normalize."""
+    if not events:
+        return pd.DataFrame(columns=EVENT_COLUMNS + ['category'])
+    df = pd.json_normalize(events, record_path='geometry', meta=['id', 'title', 'category'])
+    df = df.drop_duplicates(['id', 'category'], keep='first').rename(columns=GEOMETRY_COLUMNS)
+    return df.reindex(columns=EVENT_COLUMNS + ['category']).reset_index(drop=True)
+
+
+def route_events(df):
+    """ Creates a dictionary of dataframe for each event of CATEGORIES, grouping the events by their EONET category"""
+    groups = {category: group.drop(columns='category') for category, group in df.groupby('category')}
+    empty = df.drop(columns='category').iloc[0:0]
+    return {event: groups.get(category, empty).reset_index(drop=True) for category, event in EVENT_BY_CATEGORY.items()}
 
 
-def find_event(df):
-    """ Creates a dictionary of dataframe for each event in the dataset"""
-    types_events2 = ['Drought', 'Dust and Haze', 'Earthquake', 'Flood', 'Iceberg', 'Landslide', 'Manmade', 'Sea',
-    'Severe Storms', 'Snow', 'Temperature', 'Volcano', 'Water Color', 'Fire']
-
-    dico = {event: df[df.title.str.contains('.*'+event+'.*', case=False, regex=True)] for event in types_events2}
-    return dico
-
 def change_date(df):
     """ This function changes the date format from string to a proper datatime format"""
-    df['date'] = df['date'].apply(lambda x: parser.parse(x))
+    dates = pd.to_datetime(df['date'], utc=True)
+    df['date'] = pd.Series(dates.dt.to_pydatetime(), index=df.index, dtype=object)
     return df
 
-def main():
-    """ This is the main function that runs the scraper for the API. It gets the event from the API and returns the
+
+def main(start=None, end=None, limit=None, status=None, workers=DEFAULT_WORKERS):
+    """ This is the main function that runs the scraper for the API. It gets the events of every category from the
+    API (between the start and end dates when they are given, at most limit events per request) and returns the
     dictionary of natural events """
-    df = get_events_from_api(API_URL)
-    data = re_organise_df(df)
-    data2 = get_info_from_geometry(data)
+    events = get_events_by_category(start, end, limit, status, workers)
+    data = flatten_events(events)
     logger.info(f'Create event dataframe with all event information')
-    dict_of_df = find_event(data2)
+    dict_of_df = route_events(data)
     logger.info(f'create dict_of_df with key as event type and value as event dataframe')
 
-    # converting time string to datetime object, raise an error but its still working
     dict_of_df['Volcano'] = change_date(dict_of_df['Volcano'])
     dict_of_df['Iceberg'] = change_date(dict_of_df['Iceberg'])
     dict_of_df['Fire'] = change_date(dict_of_df['Fire'])
@@ -78,8 +125,3 @@ def main():
 if __name__ == '__main__':
     dict_of_df = main()
     print('dict_of_df: ', dict_of_df)
-
-
-
-
-
@@ -0,0 +1,117 @@
+""" Micro benchmark of the cached parsers of the cells (see cell_parsers).
+For each parser it takes the column of --cells synthetic earthquakes and times, in nanoseconds per cell: the former
+pandas version (str.extract on the whole column), the cached parser with an empty cache (cold, each distinct text of
+the column parsed once) and with the cache filled by the first run (warm, a batch of texts already seen). It prints the
+number of distinct texts, the hit rate of the cold run and checks that the results are the ones of the pandas version.
+With --distinct N the cells are drawn from N texts of the column only, to see the cost when the texts repeat (the same
+town list, the same data source...), and --cache_size sets the size of the caches.
+
+Usage:
+python -m benchmarks.bench_cell_parsers [--cells 100000] [--distinct 1000] [--cache_size 4096] [--repeat 3]
+"""
+import argparse
+import time
+import warnings
+import numpy as np
+import cell_parsers
+from benchmarks.synthetic import detail_records, quake_ids
+from scraper import build_detailed_table
+
+
+def pandas_coordinates(series):
+    """ the former parsing of a column of coordinates (cleaning_converting before cell_parsers)"""
+    parts = series.str.extract(cell_parsers.COORD_PATTERN)
+    lat = parts[0].astype(float).to_numpy() * np.where(parts[1].to_numpy() == 'S', -1, 1)
+    long = parts[2].astype(float).to_numpy() * np.where(parts[3].to_numpy() == 'W', -1, 1)
+    return cell_parsers.object_array(list(zip(lat.tolist(), long.tolist())))
+
+
+def pandas_energy(series):
+    """ the former parsing of a column of energies"""
+    parts = series.astype(object).str.extract(cell_parsers.ENERGY_PATTERN)
+    notnull = parts[0].notnull().to_numpy()
+    energy = np.full(len(series), np.nan)
+    energy[notnull] = parts[0][notnull].astype(float).to_numpy() * np.power(10, parts[1][notnull].astype(np.int64))
+    return energy
+
+
+def pandas_cities(series):
+    """ the former parsing of a column of nearby towns and cities"""
+    cells = series.astype(object).reset_index(drop=True)
+    notnull = cells.notnull()
+    result = cell_parsers.object_array([[] if present else np.nan for present in notnull])
+    cities = cells[notnull].str.replace(r'^.*}}', '', regex=True)
+    cities = cities.str.split(cell_parsers.CITY_SEPARATOR, regex=False).explode()
+    matches = cities.str.extract(cell_parsers.CITY_PATTERN).dropna(subset=[0])
+    population = (1000 * matches[2].astype(int) + matches[3].astype(int)).tolist()
+    for position, info in zip(matches.index, zip(matches[0].astype(int).tolist(), matches[1].tolist(), population)):
+        result[position].append(info)
+    return result
+
+
+def pandas_felt(series):
+    """ the former parsing of a column of felt reports"""
+    felt = series.where(series.notnull(), '0').astype(str)
+    return felt.str.extract(r'^(\d*)', expand=False).astype(int).to_numpy()
+
+
+# the parser, the column it parses, the former pandas version and the value of the missing cells of each benchmark
+BENCHES = [(cell_parsers.coordinates, 'Epicenter latitude / longitude', pandas_coordinates,
+            cell_parsers.MISSING_COORDINATES),
+           (cell_parsers.energy, 'Estimated seismic energy released', pandas_energy, np.nan),
+           (cell_parsers.cities, 'Nearby towns and cities', pandas_cities, np.nan),
+           (cell_parsers.felt, 'Felt', pandas_felt, 0)]
+
+
+def normalized(cell):
+    """ the cell with None for NaN and tuples for lists, to compare the outputs of the parsers"""
+    if isinstance(cell, (list, tuple)):
+        return tuple(normalized(item) for item in cell)
+    return None if isinstance(cell, float) and cell != cell else cell
+
+
+def best_time(func, repeat):
+    """ returns the output of func() and the shortest of repeat runs, in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return result, min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='micro benchmark of the cached parsers of the cells')
+    parser.add_argument('--cells', type=int, default=100000)
+    parser.add_argument('--distinct', type=int, default=None, help='draw the cells from this number of texts')
+    parser.add_argument('--cache_size', type=int, default=cell_parsers.DEFAULT_CACHE_SIZE)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    table = build_detailed_table(detail_records(args.cells), quake_ids(args.cells))
+    if args.distinct:
+        draws = np.random.default_rng(0).integers(0, min(args.distinct, args.cells), args.cells)
+        table = table.iloc[draws].reset_index(drop=True)
+    cell_parsers.set_cache_size(args.cache_size)
+    print(f'{args.cells} cells, caches of {args.cache_size} texts')
+    print(f'{"parser":>12} {"distinct":>9} {"pandas ns":>10} {"cold ns":>9} {"warm ns":>9} {"hit rate":>9}')
+    for cached, column, pandas_version, missing in BENCHES:
+        series = table[column]
+        expected, pandas_seconds = best_time(lambda: pandas_version(series), args.repeat)
+        cold_times = []
+        for _ in range(args.repeat):
+            cached.clear()
+            found, seconds = best_time(lambda: cached.column(series, missing=missing), 1)
+            cold_times.append(seconds)
+        hit_rate = cached.stats()['hit_rate']
+        _, warm_seconds = best_time(lambda: cached.column(series, missing=missing), args.repeat)
+        if list(map(normalized, expected)) != list(map(normalized, found)):
+            raise AssertionError(f'the {cached.name} parser and its pandas version disagree')
+        per_cell = [seconds / len(series) * 1e9 for seconds in (pandas_seconds, min(cold_times), warm_seconds)]
+        print(f'{cached.name:>12} {series.nunique():>9} {per_cell[0]:>10.0f} {per_cell[1]:>9.0f} {per_cell[2]:>9.0f} '
+              f'{hit_rate:>9.1%}')
+
+
+if __name__ == '__main__':
+    main()
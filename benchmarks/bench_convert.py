@@ -0,0 +1,54 @@
+""" Benchmark of cleaning_converting.convert.
+It converts synthetic detailed tables with the vectorized convert and with convert_rowwise (the first version, frozen
+in benchmarks.reference_convert, that parses the cells one by one), and checks that both give the same output.
+
+Usage:
+python -m benchmarks.bench_convert [--sizes 1000 10000 100000] [--no_rowwise]
+"""
+import argparse
+import time
+import warnings
+import pandas as pd
+from benchmarks.synthetic import detail_records, quake_ids
+from benchmarks.reference_convert import convert_rowwise
+from cleaning_converting import convert
+from scraper import build_detailed_table
+
+
+def check_parity(rowwise, vectorized):
+    """ raises an AssertionError if the two converted tables are different. convert_rowwise leaves the energy column
+    as object, convert makes it float, the values must be the same."""
+    rowwise = rowwise.copy()
+    rowwise['Estimated seismic energy released'] = rowwise['Estimated seismic energy released'].astype(float)
+    pd.testing.assert_frame_equal(rowwise, vectorized)
+
+
+def timed(func, table):
+    """ returns the output of func on a copy of table and the number of seconds it took"""
+    table = table.copy()
+    start = time.perf_counter()
+    result = func(table)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark of the conversion of the detailed table')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000])
+    parser.add_argument('--no_rowwise', action='store_true', help='only time the vectorized convert')
+    args = parser.parse_args()
+    warnings.simplefilter('ignore', pd.errors.SettingWithCopyWarning)
+
+    print(f'{"rows":>8} {"vectorized (s)":>15} {"rowwise (s)":>12} {"speedup":>8} {"parity":>7}')
+    for size in args.sizes:
+        table = build_detailed_table(detail_records(size), quake_ids(size))
+        vectorized, vectorized_time = timed(convert, table)
+        line = f'{size:>8} {vectorized_time:>15.3f}'
+        if not args.no_rowwise:
+            rowwise, rowwise_time = timed(convert_rowwise, table)
+            check_parity(rowwise, vectorized)
+            line += f' {rowwise_time:>12.3f} {rowwise_time / vectorized_time:>7.1f}x {"ok":>7}'
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+""" Benchmark of the assembly of the table of all the detailed pages.
+It compares scraper.build_detailed_table, which builds the dataframe once from all the records, with the previous
+pd.concat per earthquake, on synthetic detailed pages.
+
+Usage:
+python -m benchmarks.bench_detail_assembly [--sizes 100 1000 10000 50000] [--legacy_max 10000]
+"""
+import argparse
+import time
+import pandas as pd
+from benchmarks.synthetic import detail_records, quake_ids
+from scraper import build_detailed_table
+
+
+def concat_in_loop(records, id_list):
+    """ the previous way of building the table: one pd.concat per earthquake, O(n²)"""
+    table = pd.DataFrame()
+    for record in records:
+        table = pd.concat([table, pd.DataFrame.from_records([record])])
+    table['eq_id'] = id_list
+    return table
+
+
+def timed(func, *args):
+    """ returns the number of seconds taken by func(*args)"""
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark of the assembly of the detailed table')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[100, 1000, 10000, 50000])
+    parser.add_argument('--legacy_max', type=int, default=10000,
+                        help='the pd.concat loop is only timed up to this number of pages')
+    args = parser.parse_args()
+
+    print(f'{"pages":>8} {"batched (s)":>12} {"us/page":>9} {"concat loop (s)":>16} {"speedup":>8}')
+    for size in args.sizes:
+        records, ids = detail_records(size), quake_ids(size)
+        batched = timed(build_detailed_table, records, ids)
+        line = f'{size:>8} {batched:>12.3f} {1e6 * batched / size:>9.1f}'
+        if size <= args.legacy_max:
+            legacy = timed(concat_in_loop, records, ids)
+            line += f' {legacy:>16.3f} {legacy / batched:>7.1f}x'
+        else:
+            line += f' {"skipped":>16}'
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+""" End to end benchmark of the scraper against a local fixture server (see fixture_server).
+For each size it serves synthetic archive days (--quakes_per_day earthquakes each) from another process and runs the
+stages of the scraper one after the other, timing each one:
+- crawl: the archive and "show more" pages of the days (scraper.scrapper_main_pages_by_dates)
+- fetch: waiting for the detailed pages, downloaded by --workers threads
+- parse: parsing the detailed pages and building the detailed table
+- convert: cleaning_converting.convert
+- load: writing the earthquakes to a local database (--backend sqlite or parquet)
+- events: getting the EONET events of the period and writing them
+Each size runs in a new process, so the peak RSS (the high water mark of the process after each stage) of a size does
+not depend on the previous ones. The results are written as json with the git commit, to compare two runs with
+--compare. With --fixtures the pages recorded by fixture_server --record are replayed instead of synthetic ones.
+
+Usage:
+python -m benchmarks.bench_end_to_end [--sizes 1000 10000 100000] [--workers 8] [--output results.json]
+python -m benchmarks.bench_end_to_end --fixtures DIR
+python -m benchmarks.bench_end_to_end --compare OLD.json NEW.json [--tolerance 0.1]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from types import SimpleNamespace
+import API_scraper_v1
+import fetcher
+import html_parsing
+import http_client
+import scraper
+import storage
+from benchmarks.fixture_server import FixtureProcess, RecordedSite, SyntheticSite, patch_urls
+from cleaning_converting import convert
+from records import QuakeBatch
+
+STAGES = ('crawl', 'fetch', 'parse', 'convert', 'load', 'events')
+RESULTS_DIR = os.path.join('benchmarks', 'results')
+
+
+def peak_rss_mb():
+    """ returns the peak resident memory of this process in MB (ru_maxrss is in KB on linux, in bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def git_commit():
+    """ returns the hash of the current commit and whether the tree has uncommitted changes"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                                text=True, check=True).stdout
+        return commit.strip(), bool(status.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+class StageTimer:
+    """ records the time, number of items and peak RSS of each stage"""
+    def __init__(self):
+        self.stages = {}
+
+    def record(self, stage, seconds, items):
+        self.stages[stage] = {'seconds': round(seconds, 4), 'items': items,
+                              'per_second': round(items / seconds, 1) if seconds else None,
+                              'peak_rss_mb': round(peak_rss_mb(), 1)}
+
+
+def run_stages(options, dates, site):
+    """ runs all the stages of the scraper against a fixture server of site, for the archive days of dates (start,
+    end), and returns the results of each stage"""
+    warnings.simplefilter('ignore')
+    html_parsing.set_backend(options['parser'])
+    http_client.configure(pool_size=max(options['workers'], options['day_workers']))
+    timer = StageTimer()
+    server = FixtureProcess(site, latency=options['latency'])
+    with server, patch_urls(server.base_url), tempfile.TemporaryDirectory() as directory:
+        args = SimpleNamespace(date=dates, magnitude=None, n_rows=None, day_workers=options['day_workers'],
+                               rate=None)
+        start = time.perf_counter()
+        ids, links = scraper.scrapper_main_pages_by_dates(args)
+        timer.record('crawl', time.perf_counter() - start, len(ids))
+
+        records = []
+        fetch_time = parse_time = 0.0
+        pages = fetcher.imap_ordered(scraper.fetch_detail_page, [scraper.MAIN_URL + link for link in links],
+                                     workers=options['workers'])
+        waited = time.perf_counter()
+        for page in pages:
+            parsed = time.perf_counter()
+            fetch_time += parsed - waited
+            records.append(html_parsing.detail_record(page))
+            waited = time.perf_counter()
+            parse_time += waited - parsed
+        start = time.perf_counter()
+        table = scraper.build_detailed_table(records, ids)
+        parse_time += time.perf_counter() - start
+        timer.record('fetch', fetch_time, len(records))
+        timer.record('parse', parse_time, len(records))
+        del records
+
+        start = time.perf_counter()
+        data = convert(table)
+        timer.record('convert', time.perf_counter() - start, len(data))
+        del table
+
+        path = os.path.join(directory, 'earthquakes.db' if options['backend'] == 'sqlite' else 'parquet')
+        with storage.make_storage(options['backend'], path, chunk_size=options['chunk_size']) as backend:
+            start = time.perf_counter()
+            data = QuakeBatch.from_frame(data)
+            backend.write_earthquakes(data)
+            timer.record('load', time.perf_counter() - start, len(data))
+
+            start = time.perf_counter()
+            dict_of_df = API_scraper_v1.main(dates[0], dates[1], workers=options['workers'])
+            backend.write_all_events(dict_of_df)
+            timer.record('events', time.perf_counter() - start, sum(len(df) for df in dict_of_df.values()))
+    return {'quakes': len(ids), 'requests': server.requests, 'downloaded_mb': round(server.bytes / 1e6, 2),
+            'total_seconds': round(sum(stage['seconds'] for stage in timer.stages.values()), 4),
+            'peak_rss_mb': round(peak_rss_mb(), 1), 'stages': timer.stages}
+
+
+def run_synthetic(size, options):
+    """ runs the stages on size synthetic earthquakes, split in archive days of options['quakes_per_day']"""
+    n_days = max(1, -(-size // options['quakes_per_day']))
+    site = SyntheticSite(n_days, min(size, options['quakes_per_day']))
+    result = run_stages(options, (site.days[0], site.days[-1]), site)
+    result['size'] = size
+    return result
+
+
+def run_recorded(directory, options):
+    """ runs the stages on the pages recorded in directory"""
+    site = RecordedSite(directory)
+    dates = [datetime.strptime(day, '%d/%m/%Y') for day in site.manifest['dates']]
+    result = run_stages(options, (dates[0], dates[-1]), site)
+    result['size'] = result['quakes']
+    result['fixtures'] = directory
+    return result
+
+
+def in_new_process(func, *args):
+    """ runs func(*args) in a new process and returns its result"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+        return executor.submit(func, *args).result()
+
+
+def print_results(results):
+    print(f'{"size":>8} ' + ' '.join(f'{stage + " (s)":>12}' for stage in STAGES) + f' {"quakes/s":>9} {"RSS MB":>7}')
+    for result in results:
+        stages = result['stages']
+        print(f'{result["size"]:>8} ' + ' '.join(f'{stages[stage]["seconds"]:>12.2f}' for stage in STAGES) +
+              f' {result["quakes"] / result["total_seconds"]:>9.0f} {result["peak_rss_mb"]:>7.0f}')
+
+
+def compare(old_path, new_path, tolerance):
+    """ prints the time of each stage of two result files side by side, and returns the number of stages that are
+    slower by more than tolerance (a fraction) in the new one"""
+    with open(old_path) as file:
+        old = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+    print(f'old: {old["commit"]} ({old["date"]}), new: {new["commit"]} ({new["date"]})')
+    print(f'{"size":>8} {"stage":>8} {"old (s)":>9} {"new (s)":>9} {"change":>8}')
+    old_results = {result['size']: result for result in old['results']}
+    regressions = 0
+    for result in new['results']:
+        if result['size'] not in old_results:
+            continue
+        for stage in list(STAGES) + ['peak_rss_mb']:
+            if stage == 'peak_rss_mb':
+                before, after = old_results[result['size']]['peak_rss_mb'], result['peak_rss_mb']
+            else:
+                before = old_results[result['size']]['stages'][stage]['seconds']
+                after = result['stages'][stage]['seconds']
+            change = (after - before) / before if before else 0.0
+            flag = ' <- slower' if change > tolerance else ''
+            regressions += change > tolerance
+            print(f'{result["size"]:>8} {stage[:8]:>8} {before:>9.2f} {after:>9.2f} {change:>+7.0%}{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='end to end benchmark of the scraper on a local fixture server')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000])
+    parser.add_argument('--quakes_per_day', type=int, default=500)
+    parser.add_argument('--fixtures', help='folder of pages recorded with fixture_server --record')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--day_workers', type=int, default=4)
+    parser.add_argument('--parser', choices=html_parsing.BACKENDS, default='targeted')
+    parser.add_argument('--backend', choices=['sqlite', 'parquet'], default='sqlite')
+    parser.add_argument('--chunk_size', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to each response of the server')
+    parser.add_argument('--output', help=f'json file of the results (default {RESULTS_DIR}/<date>-<commit>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two json files of results')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='slowdown reported as a regression')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.tolerance) else 0)
+
+    options = {name: getattr(args, name) for name in ('quakes_per_day', 'workers', 'day_workers', 'parser',
+                                                      'backend', 'chunk_size', 'latency')}
+    if args.fixtures:
+        results = [in_new_process(run_recorded, args.fixtures, options)]
+    else:
+        results = [in_new_process(run_synthetic, size, options) for size in args.sizes]
+    print_results(results)
+
+    commit, dirty = git_commit()
+    output = args.output or os.path.join(RESULTS_DIR, f'{datetime.now():%Y%m%d-%H%M%S}-{(commit or "nogit")[:8]}.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump({'commit': commit, 'dirty': dirty, 'date': datetime.now().isoformat(timespec='seconds'),
+                   'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+                   'options': options, 'results': results}, file, indent=2)
+    print(f'results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
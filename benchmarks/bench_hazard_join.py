@@ -0,0 +1,104 @@
+""" Benchmark of the proximity join between the earthquakes and the natural events (see hazard_join).
+It generates --quakes random earthquakes and --events random fire events over --days_range days, all uniform on the
+sphere, and times hazard_join.join_chunk over the earthquakes in date order, in chunks like join_storage. The naive
+way (every pair of a sample of the earthquakes and all the events, in pandas) is timed on --sample earthquakes and
+extrapolated, and both must find the same pairs on that sample. With --sqlite the whole join_storage (reading the
+earthquakes by pages and writing the links) is also timed on a temporary sqlite file.
+
+Usage:
+python -m benchmarks.bench_hazard_join [--quakes 1000000] [--events 1000000] [--distance_km 100] [--days 7] [--sqlite]
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import hazard_join
+import storage
+from benchmarks.bench_spatial_index import random_points
+
+
+def synthetic_tables(n_quakes, n_events, days_range, rng):
+    """ returns the earthquakes (link_id, date_time, epicenter_latitude, epicenter_longitude) in date order and the
+    events (eonet_id, date_time, latitude, longitude) of the benchmark"""
+    start = np.datetime64('2022-01-01T00:00:00')
+    quake_times = np.sort(start + rng.integers(0, days_range * 86400, n_quakes).astype('timedelta64[s]'))
+    lats, lons = random_points(n_quakes, rng)
+    quakes = pd.DataFrame({'link_id': np.arange(n_quakes), 'date_time': quake_times.astype(str),
+                           'epicenter_latitude': lats, 'epicenter_longitude': lons})
+    event_days = start.astype('datetime64[D]') + rng.integers(0, days_range, n_events).astype('timedelta64[D]')
+    lats, lons = random_points(n_events, rng)
+    events = pd.DataFrame({'eonet_id': np.arange(n_events), 'date_time': event_days.astype(str),
+                           'latitude': lats, 'longitude': lons})
+    return quakes, events
+
+
+def naive_join(quakes, events, distance_km, days, block_rows=5000000):
+    """ the join comparing every pair: a cartesian product of the earthquakes and the events in pandas, a few
+    earthquakes at a time so that a product has at most about block_rows rows"""
+    found = set()
+    step = max(1, block_rows // max(len(events), 1))
+    for first in range(0, len(quakes), step):
+        pairs = quakes.iloc[first:first + step].merge(events, how='cross')
+        apart = hazard_join.to_days(pairs['date_time_x']) - hazard_join.to_days(pairs['date_time_y'])
+        quake_points = hazard_join.unit_vectors(pairs['epicenter_latitude'], pairs['epicenter_longitude'])
+        event_points = hazard_join.unit_vectors(pairs['latitude'], pairs['longitude'])
+        distances = 2 * hazard_join.EARTH_RADIUS_KM * np.arcsin(
+            np.minimum(np.linalg.norm(quake_points - event_points, axis=1) / 2, 1.0))
+        close = (np.abs(apart) <= days) & (distances <= distance_km)
+        found.update(zip(pairs['link_id'][close], pairs['eonet_id'][close]))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark of the proximity join of earthquakes and events')
+    parser.add_argument('--quakes', type=int, default=1000000)
+    parser.add_argument('--events', type=int, default=1000000)
+    parser.add_argument('--days_range', type=int, default=365, help='number of days the rows are spread over')
+    parser.add_argument('--distance_km', type=float, default=hazard_join.DEFAULT_DISTANCE_KM)
+    parser.add_argument('--days', type=float, default=hazard_join.DEFAULT_DAYS)
+    parser.add_argument('--chunk_size', type=int, default=hazard_join.DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--sample', type=int, default=50, help='earthquakes joined the naive way')
+    parser.add_argument('--sqlite', action='store_true', help='also time join_storage on a sqlite file')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    quakes, events = synthetic_tables(args.quakes, args.events, args.days_range, rng)
+    start = time.perf_counter()
+    hazards = hazard_join.Hazards('fire', events)
+    prepared = time.perf_counter() - start
+    start = time.perf_counter()
+    pairs = 0
+    for first in range(0, len(quakes), args.chunk_size):
+        pairs += len(hazard_join.join_chunk(quakes.iloc[first:first + args.chunk_size], hazards,
+                                            args.distance_km, args.days))
+    elapsed = time.perf_counter() - start
+    print(f'{args.quakes} quakes x {args.events} events, {args.distance_km} km and {args.days} days: '
+          f'{pairs} pairs')
+    print(f'sweep join: {prepared:.2f} s to sort the events, {elapsed:.2f} s to join '
+          f'({args.quakes / elapsed:.0f} quakes/s)')
+
+    sample = quakes.sample(min(args.sample, len(quakes)), random_state=0)
+    start = time.perf_counter()
+    expected = naive_join(sample, events, args.distance_km, args.days)
+    naive = time.perf_counter() - start
+    found = hazard_join.join_chunk(sample.sort_values('date_time'), hazards, args.distance_km, args.days)
+    if set(zip(found['link_id'], found['eonet_id'])) != expected:
+        raise AssertionError('the sweep join and the naive join disagree')
+    print(f'naive join: {naive:.2f} s for {len(sample)} quakes, about {naive * args.quakes / len(sample):.0f} s for '
+          f'all of them ({naive * args.quakes / len(sample) / elapsed:.0f}x slower)')
+
+    if args.sqlite:
+        with tempfile.TemporaryDirectory() as directory:
+            with storage.SQLiteStorage(os.path.join(directory, 'earthquakes.db')) as backend:
+                with backend.connection:
+                    quakes.to_sql('earthquakes', backend.connection, if_exists='append', index=False)
+                    events.to_sql('fire', backend.connection, if_exists='append', index=False)
+                start = time.perf_counter()
+                written = hazard_join.join_storage(backend, ['fire'], args.distance_km, args.days, args.chunk_size)
+                print(f'join_storage on sqlite: {time.perf_counter() - start:.2f} s, {written} links written')
+
+
+if __name__ == '__main__':
+    main()
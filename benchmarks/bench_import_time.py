@@ -0,0 +1,85 @@
+""" Benchmark of the startup time of the scraper.
+For each module (--modules, default cli and scraper) it runs python -X importtime -c "import <module>" in a new
+interpreter --repeat times and prints the median time to import it with everything it imports, and the slowest
+imports below it. It also times python cli.py --help from start to exit, and checks that importing cli does not load
+any of the heavy libraries (HEAVY). The exit code is 1 when cli imports one of them or takes more than --max_ms to
+import, so a startup regression is visible.
+
+Usage:
+python -m benchmarks.bench_import_time [--modules cli scraper] [--repeat 5] [--top 10] [--max_ms 150]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY = ('pandas', 'numpy', 'bs4', 'lxml', 'requests', 'pymysql', 'pyarrow', 'tqdm')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module):
+    """ returns {imported module: cumulative microseconds} of the modules imported by python -X importtime -c
+    'import module' below module (not the ones of the start of the interpreter), and the total microseconds of
+    module"""
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT,
+                             capture_output=True, text=True, check=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        if name.strip() == module and len(name) - len(name.lstrip()) == 1:
+            return times, int(cumulative_us)
+        if len(name) - len(name.lstrip()) == 1:
+            times = {}  # a module imported at the start of the interpreter, before module
+        else:
+            times[name.strip()] = int(cumulative_us)
+    raise ValueError(f'{module} not found in the output of -X importtime')
+
+
+def loaded_modules(module):
+    """ returns the HEAVY libraries found in sys.modules after importing module in a new interpreter"""
+    code = f'import sys, {module}; print(" ".join(name for name in {HEAVY!r} if name in sys.modules))'
+    process = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return process.stdout.split()
+
+
+def help_seconds(repeat):
+    """ returns the median seconds of python cli.py --help, from the start of the interpreter to its exit"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, 'cli.py', '--help'], cwd=ROOT, capture_output=True, check=True)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark of the import time of the scraper')
+    parser.add_argument('--modules', nargs='+', default=['cli', 'scraper'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='number of slowest imports printed for each module')
+    parser.add_argument('--max_ms', type=float, default=150, help='import time of cli reported as a regression')
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        runs = [import_times(module) for _ in range(args.repeat)]
+        total_ms = statistics.median(total for _, total in runs) / 1000
+        heavy = loaded_modules(module)
+        print(f'import {module}: {total_ms:.1f} ms (median of {args.repeat}), '
+              f'heavy libraries: {" ".join(heavy) or "none"}')
+        times = runs[-1][0]
+        for name in sorted(times, key=times.get, reverse=True)[:args.top]:
+            print(f'  {times[name] / 1000:>8.1f} ms  {name}')
+        if module == 'cli' and (heavy or total_ms > args.max_ms):
+            print(f'cli regression: it must import no heavy library and take at most {args.max_ms} ms')
+            failed = True
+    print(f'python cli.py --help: {help_seconds(args.repeat) * 1000:.0f} ms (median of {args.repeat})')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+""" Benchmark of the html parsing backends (see html_parsing).
+It parses saved html pages with every backend: the main pages and "show more" pages (soup + rows of earthquakes +
+ids) and the detailed pages (fields of the first table). It also checks that the targeted extraction of the detailed
+pages gives the same fields as pd.read_html.
+
+The fixtures folder holds archive/*.html, show_more/*.html and detail/*.html. Without --fixtures, synthetic pages are
+generated in a temporary folder.
+
+Usage:
+python -m benchmarks.bench_parsing [--fixtures DIR] [--days 3] [--quakes_per_day 50] [--repeat 3]
+"""
+import argparse
+import glob
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+import html_parsing
+from benchmarks.synthetic import write_fixtures
+from scraper import get_eq, extract_ids_filter_by_mag
+
+NO_FILTER = SimpleNamespace(magnitude=None)
+
+
+def read_pages(directory, folder):
+    """ returns the content of all the pages of a folder of the fixtures as bytes"""
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, folder, '*.html'))):
+        with open(path, 'rb') as page:
+            pages.append(page.read())
+    return pages
+
+
+def parse_main_pages(pages, backend):
+    for page in pages:
+        extract_ids_filter_by_mag(get_eq(html_parsing.make_soup(page, backend)), NO_FILTER)
+
+
+def parse_detail_pages(pages, backend):
+    for page in pages:
+        html_parsing.detail_record(page.decode('utf-8'), backend)
+
+
+def same_record(first, second):
+    """ returns True if the two records have the same fields and values, NaN being equal to NaN"""
+    return first.keys() == second.keys() and all(first[key] == second[key] or
+                                                 (first[key] != first[key] and second[key] != second[key])
+                                                 for key in first)
+
+
+def timed(func, pages, backend, repeat):
+    """ returns the best time of repeat runs of func on all the pages"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(pages, backend)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark of the html parsing backends')
+    parser.add_argument('--fixtures', help='folder of saved pages, synthetic pages are generated without it')
+    parser.add_argument('--days', type=int, default=3)
+    parser.add_argument('--quakes_per_day', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        directory = args.fixtures or tmp_dir
+        if not args.fixtures:
+            write_fixtures(directory, args.days, args.quakes_per_day)
+        main_pages = read_pages(directory, 'archive') + read_pages(directory, 'show_more')
+        detail_pages = read_pages(directory, 'detail')
+
+    main_mb = sum(map(len, main_pages)) / 1e6
+    detail_mb = sum(map(len, detail_pages)) / 1e6
+    print(f'{len(main_pages)} main pages ({main_mb:.1f} MB), {len(detail_pages)} detailed pages ({detail_mb:.1f} MB)')
+    print(f'{"backend":>12} {"main pages/s":>13} {"main MB/s":>10} {"detail pages/s":>15} {"detail MB/s":>12}')
+    for backend in html_parsing.BACKENDS:
+        main_time = timed(parse_main_pages, main_pages, backend, args.repeat)
+        detail_time = timed(parse_detail_pages, detail_pages, backend, args.repeat)
+        print(f'{backend:>12} {len(main_pages) / main_time:>13.1f} {main_mb / main_time:>10.2f} '
+              f'{len(detail_pages) / detail_time:>15.1f} {detail_mb / detail_time:>12.2f}')
+
+    different = [index for index, page in enumerate(detail_pages)
+                 if not same_record(html_parsing.detail_record_read_html(page.decode('utf-8')),
+                                    html_parsing.detail_record_lxml(page.decode('utf-8')))]
+    print(f'targeted extraction matches pd.read_html on {len(detail_pages) - len(different)}/{len(detail_pages)} '
+          f'detailed pages')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+""" Benchmark of the process pool mode (see parallel_convert).
+It parses and converts synthetic detailed pages in the main process, then with pools of 1, 2, 4... processes up to
+the number of cores, and prints the speedup of each pool against the main process. The pools are started and warmed
+up before they are timed, like in a long run.
+
+Usage:
+python -m benchmarks.bench_process_pool [--pages 2000] [--shard_size 100] [--parser targeted]
+"""
+import argparse
+import os
+import time
+import html_parsing
+import parallel_convert
+from benchmarks.synthetic import detail_records, detail_page_html, quake_ids
+
+
+def process_counts(max_processes):
+    """ returns 1, 2, 4... up to max_processes, and max_processes itself"""
+    counts = [1]
+    while counts[-1] * 2 < max_processes:
+        counts.append(counts[-1] * 2)
+    if max_processes > 1:
+        counts.append(max_processes)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark of the process pool parsing and conversion')
+    parser.add_argument('--pages', type=int, default=2000)
+    parser.add_argument('--shard_size', type=int, default=parallel_convert.DEFAULT_SHARD_SIZE)
+    parser.add_argument('--parser', choices=html_parsing.BACKENDS, default='targeted')
+    parser.add_argument('--max_processes', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    html_parsing.set_backend(args.parser)
+
+    ids = quake_ids(args.pages)
+    pages = [detail_page_html(record) for record in detail_records(args.pages)]
+
+    start = time.perf_counter()
+    parallel_convert.parse_and_convert((ids, pages))
+    single = time.perf_counter() - start
+    print(f'{args.pages} pages, parser {args.parser}, {os.cpu_count()} cores')
+    print(f'{"processes":>10} {"time (s)":>9} {"pages/s":>8} {"speedup":>8}')
+    print(f'{"main":>10} {single:>9.2f} {args.pages / single:>8.0f} {1:>7.1f}x')
+    for processes in process_counts(args.max_processes):
+        with parallel_convert.make_pool(processes) as pool:
+            parallel_convert.parse_and_convert_all(ids[:processes], pages[:processes], shard_size=1, pool=pool)
+            start = time.perf_counter()
+            parallel_convert.parse_and_convert_all(ids, pages, shard_size=args.shard_size, pool=pool)
+            elapsed = time.perf_counter() - start
+        print(f'{processes:>10} {elapsed:>9.2f} {args.pages / elapsed:>8.0f} {single / elapsed:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
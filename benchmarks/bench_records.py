@@ -0,0 +1,113 @@
+""" Benchmark of the in memory form of the converted earthquakes (see records).
+It converts --quakes synthetic earthquakes, and measures the memory kept by the former form (the converted dataframe
+of python objects, with None for the missing values) and by a QuakeBatch (tracemalloc, bytes per earthquake), the size
+of both once pickled (what the workers of parallel_convert send back), and the time to make the rows of the
+earthquakes and cities tables from each. The rows must be the same, except the energies that the former form kept
+with float64 rounding errors (919999999999.9999 for 9.2 x 10^11).
+
+Usage:
+python -m benchmarks.bench_records [--quakes 20000]
+"""
+import argparse
+import gc
+import math
+import pickle
+import time
+import tracemalloc
+import warnings
+import pandas as pd
+import uptade_database
+from benchmarks.synthetic import detail_records, quake_ids
+from cleaning_converting import convert
+from records import QuakeBatch
+from scraper import build_detailed_table
+
+
+def object_frame(table):
+    """ the former form of the converted earthquakes, ready for the row by row writers"""
+    df = convert(table.copy())
+    return df.astype(object).where(pd.notnull(df), None)
+
+
+def quake_batch(table):
+    """ the converted earthquakes as a QuakeBatch"""
+    return QuakeBatch.from_frame(convert(table.copy()))
+
+
+def frame_rows(data):
+    """ the rows of the earthquakes and cities tables made from the former form, one dictionary per earthquake"""
+    earthquakes, cities = [], []
+    for row in data.to_dict('records'):
+        link_id = uptade_database.get_link_id(row['eq_id'])
+        earthquakes.append((link_id, row['Date & time'], row['Local time at epicenter'], int(row['Status']),
+                            row['Magnitude'], row['Depth'], *row['Epicenter latitude / longitude'], *row['Antipode'],
+                            row['Shaking intensity'], row['Felt'], row['Primary data source'], row['Nearest volcano'],
+                            row['Estimated seismic energy released']))
+        cities.extend((link_id, city[1], int(city[2]), int(city[0])) for city in row['Nearby towns and cities'] or [])
+    return earthquakes, cities
+
+
+def batch_rows(batch):
+    """ the rows of the earthquakes and cities tables made from a QuakeBatch"""
+    return batch.earthquake_rows(), batch.city_rows()
+
+
+def kept_bytes(build, table):
+    """ returns the object made by build(table) and the number of bytes it keeps allocated, the cells it shares with
+    the detailed table (the texts kept as they are) are not counted"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build(table)
+    gc.collect()  # the intermediate dataframes of convert are freed by the garbage collector
+    kept = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, kept
+
+
+def timed(func, data):
+    """ returns the output of func(data) and the number of seconds it took"""
+    start = time.perf_counter()
+    result = func(data)
+    return result, time.perf_counter() - start
+
+
+def same_value(former, value):
+    """ True if the value of a row of the batch is the value of the row of the former form"""
+    if former is None or (isinstance(former, float) and math.isnan(former)):
+        return value is None
+    if isinstance(former, float):
+        return math.isclose(former, value, rel_tol=1e-6)
+    if isinstance(former, pd.Timestamp):
+        return former.to_pydatetime() == value
+    return former == value
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark of the in memory form of the converted earthquakes')
+    parser.add_argument('--quakes', type=int, default=20000)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    table = build_detailed_table(detail_records(args.quakes), quake_ids(args.quakes))
+    for build in (object_frame, quake_batch):
+        build(table.iloc[:100])  # the caches of pandas and of the regular expressions are not counted
+    data, frame_bytes = kept_bytes(object_frame, table)
+    batch, batch_bytes = kept_bytes(quake_batch, table)
+    print(f'{args.quakes} earthquakes, {len(batch.city_codes)} nearby cities ({len(batch.city_names)} names)')
+    print(f'{"form":>10} {"bytes/quake":>12} {"pickled":>9} {"rows (s)":>9}')
+    (former_quakes, former_cities), frame_seconds = timed(frame_rows, data)
+    (quakes, cities), batch_seconds = timed(batch_rows, batch)
+    for name, kept, obj, seconds in (('dataframe', frame_bytes, data, frame_seconds),
+                                     ('QuakeBatch', batch_bytes, batch, batch_seconds)):
+        pickled = len(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)) / len(batch)
+        print(f'{name:>10} {kept / len(batch):>12.0f} {pickled:>9.0f} {seconds:>9.3f}')
+    print(f'{frame_bytes / batch_bytes:.1f}x less memory, rows {frame_seconds / batch_seconds:.1f}x faster')
+
+    if former_cities != cities or any(not all(map(same_value, former, row))
+                                      for former, row in zip(former_quakes, quakes)):
+        raise AssertionError('the rows of the QuakeBatch are not the rows of the dataframe')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+""" Benchmark of the spatial index of the earthquakes (see spatial_index).
+It builds a SpatialIndex of --points random epicenters (uniform on the sphere), then times the radius queries at a few
+radiuses, the bounding box and k nearest queries, each against a brute force haversine over all the points (numpy),
+and checks that both find the same earthquakes. It also times adding batches of new earthquakes (the incremental
+update of the stream mode) and the memory of the arrays of the index.
+
+Usage:
+python -m benchmarks.bench_spatial_index [--points 1000000] [--queries 200] [--cell_degrees 1.0]
+"""
+import argparse
+import time
+import numpy as np
+import spatial_index
+
+RADIUSES_KM = (10, 100, 1000)
+
+
+def random_points(n, rng):
+    """ returns the latitudes and longitudes of n points uniform on the sphere"""
+    return np.degrees(np.arcsin(rng.uniform(-1, 1, n))), rng.uniform(-180, 180, n)
+
+
+def timed(func, queries):
+    """ returns the results of func on each query and the number of queries per second"""
+    start = time.perf_counter()
+    results = [func(*query) for query in queries]
+    return results, len(queries) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark of the spatial index')
+    parser.add_argument('--points', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--cell_degrees', type=float, default=spatial_index.DEFAULT_CELL_DEGREES)
+    parser.add_argument('--batch_size', type=int, default=500, help='earthquakes of each incremental update')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    lats, lons = random_points(args.points, rng)
+    ids = np.arange(args.points, dtype=np.int64)
+    start = time.perf_counter()
+    index = spatial_index.SpatialIndex(cell_degrees=args.cell_degrees).build(ids, lats, lons)
+    memory = sum(array.nbytes for array in (index.ids, index.lats, index.lons, index.keys, index.alive)) / 1e6
+    print(f'build {args.points} points: {time.perf_counter() - start:.2f} s, {memory:.0f} MB')
+
+    def brute_within(lat, lon, radius):
+        distances = spatial_index.haversine_km(lat, lon, lats, lons)
+        return ids[distances <= radius]
+
+    def brute_box(south, west, north, east):
+        return ids[(lats >= south) & (lats <= north) & (lons >= west) & (lons <= east)]
+
+    def brute_nearest(lat, lon, k):
+        return ids[np.argsort(spatial_index.haversine_km(lat, lon, lats, lons), kind='stable')[:k]]
+
+    centers = list(zip(*random_points(args.queries, rng)))
+    print(f'{"query":>16} {"index q/s":>10} {"brute q/s":>10} {"speedup":>8} {"mean hits":>10}')
+    benches = [(f'within {radius} km', [(lat, lon, radius) for lat, lon in centers],
+                lambda lat, lon, radius: index.within(lat, lon, radius)[0], brute_within) for radius in RADIUSES_KM]
+    benches.append(('box 2x2 deg', [(lat - 1, lon - 1, lat + 1, lon + 1) for lat, lon in centers
+                                    if abs(lat) < 89 and abs(lon) < 179], index.in_box, brute_box))
+    benches.append(('nearest 10', [(lat, lon, 10) for lat, lon in centers],
+                    lambda lat, lon, k: index.nearest(lat, lon, k)[0], brute_nearest))
+    for name, queries, query_index, query_brute in benches:
+        found, index_rate = timed(query_index, queries)
+        expected, brute_rate = timed(query_brute, queries)
+        if any(set(got.tolist()) != set(want.tolist()) for got, want in zip(found, expected)):
+            raise AssertionError(f'the index and the brute force disagree on {name}')
+        hits = sum(len(got) for got in found) / len(found)
+        print(f'{name:>16} {index_rate:>10.0f} {brute_rate:>10.1f} {index_rate / brute_rate:>7.0f}x {hits:>10.1f}')
+
+    batches = 100
+    new_lats, new_lons = random_points(batches * args.batch_size, rng)
+    start = time.perf_counter()
+    for batch in range(batches):
+        part = slice(batch * args.batch_size, (batch + 1) * args.batch_size)
+        index.add(ids[part] + args.points, new_lats[part], new_lons[part])
+    elapsed = time.perf_counter() - start
+    print(f'add {batches} batches of {args.batch_size}: {elapsed / batches * 1000:.1f} ms per batch, '
+          f'{len(index)} points')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+""" Benchmark of the storage backends (see storage).
+It writes the same converted synthetic earthquakes to each backend, in batches like the stream mode, and prints the
+earthquakes written per second. The sqlite and parquet backends write to a temporary folder. The mysql backend is
+only timed with --mysql, it writes to the database of db_pool.load_settings (use a local test database).
+
+Usage:
+python -m benchmarks.bench_storage [--rows 20000] [--batch_size 500] [--backends sqlite parquet] [--mysql]
+"""
+import argparse
+import os
+import tempfile
+import time
+import warnings
+import pandas as pd
+import storage
+from benchmarks.synthetic import detail_records, quake_ids
+from cleaning_converting import convert
+from records import QuakeBatch
+from scraper import build_detailed_table
+
+
+def converted_batches(rows, batch_size):
+    """ returns the converted tables of rows synthetic earthquakes, in batches of batch_size, ready to be written"""
+    data = QuakeBatch.from_frame(convert(build_detailed_table(detail_records(rows), quake_ids(rows))))
+    return [data[start:start + batch_size] for start in range(0, rows, batch_size)]
+
+
+def folder_size(path):
+    """ returns the size in MB of a file or of all the files of a folder"""
+    if os.path.isfile(path):
+        return os.path.getsize(path) / 1e6
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names) / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark of the storage backends')
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--batch_size', type=int, default=500)
+    parser.add_argument('--backends', nargs='+', choices=['sqlite', 'parquet'], default=['sqlite', 'parquet'])
+    parser.add_argument('--mysql', action='store_true', help='also time the mysql backend')
+    args = parser.parse_args()
+    warnings.simplefilter('ignore', pd.errors.SettingWithCopyWarning)
+
+    batches = converted_batches(args.rows, args.batch_size)
+    print(f'{args.rows} earthquakes in batches of {args.batch_size}')
+    print(f'{"backend":>8} {"time (s)":>9} {"rows/s":>9} {"size (MB)":>10}')
+    with tempfile.TemporaryDirectory() as directory:
+        backends = args.backends + (['mysql'] if args.mysql else [])
+        for name in backends:
+            path = os.path.join(directory, 'earthquakes.db' if name == 'sqlite' else 'parquet')
+            with storage.make_storage(name, path, chunk_size=args.batch_size) as backend:
+                start = time.perf_counter()
+                for batch in batches:
+                    backend.write_earthquakes(batch)
+                elapsed = time.perf_counter() - start
+            size = f'{folder_size(path):>10.1f}' if name != 'mysql' else f'{"-":>10}'
+            print(f'{name:>8} {elapsed:>9.2f} {args.rows / elapsed:>9.0f} {size}')
+
+
+if __name__ == '__main__':
+    main()
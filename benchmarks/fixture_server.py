@@ -0,0 +1,249 @@
+""" A local http server that replays the website and the EONET API for the benchmarks.
+SyntheticSite generates the pages of any number of synthetic archive days on the fly (see synthetic), RecordedSite
+replays pages saved by record_fixtures from the real website. FixtureServer serves them from a thread, FixtureProcess
+from another process, patch_urls points the scraper at the server.
+
+Recording real pages (needs the network):
+python -m benchmarks.fixture_server --record DIR --date 14/11/2022 [--quakes 50]
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+import API_scraper_v1
+import http_client
+import scraper
+from benchmarks.synthetic import (START_DATE, archive_page_html, detail_page_html, detail_record, eonet_events,
+                                  quake_ids, show_more_html)
+
+# the host written in the fixtures in place of the real websites, the server replaces it with its own address
+FIXTURE_HOST = 'http://fixtures'
+REAL_HOSTS = ('https://www.allquakes.com', 'https://www.volcanodiscovery.com')
+ARCHIVE_PATH = '/earthquakes/archive/'
+TODAY_PATH = '/earthquakes/today.html'
+SHOW_MORE_PATH = '/show_more/'
+DETAIL_PATH = '/earthquakes/quake-info/'
+API_PATH = '/api/v3/events'
+MANIFEST = 'manifest.json'
+
+
+def day_name(day):
+    """ returns the name of a day in the urls of the archive, ex: 2022-nov-14"""
+    return day.strftime('%Y-%b-%d').lower()
+
+
+class SyntheticSite:
+    """ the pages of n_days synthetic archive days of quakes_per_day earthquakes each, starting at synthetic.START_DATE,
+    and events_per_category events for each EONET category. Half of the earthquakes of a day are on its archive page,
+    the other half on its "show more" page. The pages are generated when they are requested."""
+    def __init__(self, n_days, quakes_per_day, events_per_category=50):
+        self.n_days = n_days
+        self.quakes_per_day = quakes_per_day
+        self.events_per_category = events_per_category
+        self.days = [START_DATE + timedelta(days=index) for index in range(n_days)]
+        self._index = {day_name(day): index for index, day in enumerate(self.days)}
+
+    def day_quakes(self, name):
+        """ returns the ids and magnitudes of the earthquakes of an archive day"""
+        first = self._index[name] * self.quakes_per_day
+        eq_ids = quake_ids(first + self.quakes_per_day)[first:]
+        return eq_ids, [detail_record(int(eq_id.split('-')[-1]) - 1000000)['Magnitude'] for eq_id in eq_ids]
+
+    def response(self, path, query):
+        """ returns the (content type, text) of the page at path, None if there is none"""
+        if path == TODAY_PATH:
+            path = ARCHIVE_PATH + day_name(self.days[-1]) + '.html'
+        name = path.rsplit('/', 1)[-1].replace('.html', '')
+        if path.startswith(ARCHIVE_PATH) and name in self._index:
+            eq_ids, magnitudes = self.day_quakes(name)
+            half = len(eq_ids) // 2
+            return 'text/html', archive_page_html(eq_ids[:half], magnitudes[:half],
+                                                  f'{FIXTURE_HOST}{SHOW_MORE_PATH}{name}.html')
+        if path.startswith(SHOW_MORE_PATH) and name in self._index:
+            eq_ids, magnitudes = self.day_quakes(name)
+            half = len(eq_ids) // 2
+            return 'text/html', show_more_html(eq_ids[half:], magnitudes[half:])
+        if path.startswith(DETAIL_PATH) and name.isdigit():
+            return 'text/html', detail_page_html(detail_record(int(name) - 1000000))
+        if path == API_PATH:
+            category = query.get('category', [''])[0]
+            return 'application/json', json.dumps({'events': eonet_events(category, self.events_per_category)})
+        return None
+
+
+class RecordedSite:
+    """ the pages saved by record_fixtures in directory: each page is stored at the path of its url, the EONET
+    responses at api/v3/events/<category>.json. The dates recorded are listed in manifest.json."""
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST)) as file:
+            self.manifest = json.load(file)
+
+    def response(self, path, query):
+        if path == API_PATH:
+            path = f'{API_PATH}/{query.get("category", [""])[0]}.json'
+        root = os.path.abspath(self.directory)
+        file_path = os.path.abspath(os.path.join(root, path.lstrip('/')))
+        if not file_path.startswith(root + os.sep) or not os.path.isfile(file_path):
+            return None
+        with open(file_path, encoding='utf-8') as file:
+            content = file.read()
+        return ('application/json' if file_path.endswith('.json') else 'text/html'), content
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        response = self.server.site.response(url.path, parse_qs(url.query))
+        if response is None:
+            self.send_error(404)
+            return
+        content_type, content = response
+        body = content.replace(FIXTURE_HOST, self.server.base_url).encode('utf-8')
+        self.server.count(len(body))
+        self.send_response(200)
+        self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """ serves a SyntheticSite or a RecordedSite on a free port of localhost, in a background thread. latency is the
+    number of seconds each response is delayed, to imitate the network. Use it with: with FixtureServer(site) as
+    server: ..."""
+    daemon_threads = True
+
+    def __init__(self, site, latency=0.0):
+        super().__init__(('127.0.0.1', 0), FixtureHandler)
+        self.site = site
+        self.latency = latency
+        self.base_url = f'http://127.0.0.1:{self.server_address[1]}'
+        self.requests = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, name='fixture-server', daemon=True)
+
+    def count(self, size):
+        with self._lock:
+            self.requests += 1
+            self.bytes += size
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+def serve(site, latency, connection):
+    """ runs a FixtureServer in this process until it receives a message on connection (a Pipe), sends its url
+    first and its number of requests and bytes served at the end"""
+    with FixtureServer(site, latency) as server:
+        connection.send(server.base_url)
+        connection.recv()
+        connection.send((server.requests, server.bytes))
+
+
+class FixtureProcess:
+    """ runs a FixtureServer in another process, so that generating the pages does not take the GIL of the process
+    being measured. base_url is its address, requests and bytes are set when it stops. Use it with: with
+    FixtureProcess(site) as server: ..."""
+    def __init__(self, site, latency=0.0):
+        self.site = site
+        self.latency = latency
+        self.base_url = None
+        self.requests = 0
+        self.bytes = 0
+
+    def __enter__(self):
+        context = get_context('spawn')
+        self._connection, child = context.Pipe()
+        self._process = context.Process(target=serve, args=(self.site, self.latency, child), daemon=True)
+        self._process.start()
+        self.base_url = self._connection.recv()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._connection.send('stop')
+        self.requests, self.bytes = self._connection.recv()
+        self._process.join()
+
+
+@contextmanager
+def patch_urls(base_url):
+    """ points the urls of the website and of the EONET API used by scraper and API_scraper_v1 at base_url"""
+    saved = scraper.MAIN_URL, scraper.LINK, scraper.TODAY_URL, API_scraper_v1.API_URL
+    scraper.MAIN_URL = base_url + '/'
+    scraper.LINK = base_url + ARCHIVE_PATH
+    scraper.TODAY_URL = base_url + TODAY_PATH
+    API_scraper_v1.API_URL = base_url + API_PATH
+    try:
+        yield
+    finally:
+        scraper.MAIN_URL, scraper.LINK, scraper.TODAY_URL, API_scraper_v1.API_URL = saved
+
+
+def save_page(directory, url, content):
+    """ saves the content of a real page at the path of its url, the real hosts replaced by FIXTURE_HOST"""
+    for host in REAL_HOSTS:
+        content = content.replace(host, FIXTURE_HOST)
+    path = os.path.join(directory, urlparse(url).path.lstrip('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(content)
+
+
+def record_fixtures(directory, day, n_quakes=50):
+    """ downloads from the real website the archive page of day, its "show more" page and the detailed pages of its
+    first n_quakes earthquakes, and the EONET events of every category for that day, to replay them with RecordedSite"""
+    url = scraper.LINK + day_name(day) + '.html'
+    page = http_client.get(url).text
+    save_page(directory, url, page)
+    soup = scraper.html_parsing.make_soup(page)
+    show_more_url = scraper.get_show_more_url(soup)
+    show_more_page = http_client.get(show_more_url).text
+    save_page(directory, show_more_url, show_more_page)
+    quakes = scraper.get_eq(soup) + scraper.get_eq(scraper.html_parsing.make_soup(show_more_page))
+    id_to_url = scraper.extract_ids_filter_by_mag(quakes, SimpleNamespace(magnitude=None))
+    for link in list(id_to_url.values())[:n_quakes]:
+        detail_url = scraper.MAIN_URL + link
+        save_page(directory, detail_url, http_client.get(detail_url).text)
+    for category in sorted(API_scraper_v1.EVENT_BY_CATEGORY):
+        events = API_scraper_v1.get_category_events(API_scraper_v1.category_url(category, day, day))
+        for event in events:
+            event.pop('category')
+        save_page(directory, f'{API_PATH}/{category}.json', json.dumps({'events': events}))
+    with open(os.path.join(directory, MANIFEST), 'w') as file:
+        json.dump({'dates': [day.strftime('%d/%m/%Y')], 'recorded': datetime.now().isoformat(),
+                   'quakes': min(n_quakes, len(id_to_url))}, file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='record real pages to replay them in the benchmarks')
+    parser.add_argument('--record', required=True, help='folder where the pages are saved')
+    parser.add_argument('--date', required=True, help='day to record, dd/mm/yyyy')
+    parser.add_argument('--quakes', type=int, default=50, help='number of detailed pages to record')
+    args = parser.parse_args()
+    record_fixtures(args.record, datetime.strptime(args.date, '%d/%m/%Y'), args.quakes)
+    print(f'pages of {args.date} recorded in {args.record}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import os
+import random
+from datetime import datetime, timedelta
+
+### this file generates synthetic earthquakes that look like the data scraped from the website. They are used by the
+### benchmarks so that they can run at any size without the network.
+
+INTENSITIES = ['Not felt', 'Very weak shaking', 'Weak shaking near epicenter', 'Light shaking near epicenter',
+               'Light shaking', 'Weak shaking', 'Moderate shaking near epicenter', 'Moderate shaking',
+               'Strong shaking near epicenter', 'Strong shaking', 'Very strong shaking near epicenter',
+               'Very strong shaking', 'Severe shaking near epicenter', 'Severe shaking',
+               'Violent shaking near epicenter', 'Violent shaking']
+SOURCES = ['EMSC', 'USGS', 'GFZ', 'INGV', 'Japan Meteorological Agency', 'Instituto Geofisico del Peru']
+TOWNS = ['Athens', 'Patra', 'Izmir', 'Tokyo', 'Lima', 'Napoli', 'Catania', 'Santiago', 'Manila', 'Anchorage',
+         'Reykjavik', 'Wellington', 'Jakarta', 'Kathmandu', 'Tehran', 'Mexico City', 'Quito', 'Suva']
+VOLCANOES = ['Santorini', 'Etna', 'Vesuvius', 'Fuji', 'Misti', 'Taal', 'Redoubt', 'Hekla', 'Ruapehu', 'Merapi']
+START_DATE = datetime(2022, 11, 1)
+# the EONET categories queried by API_scraper_v1
+CATEGORY_IDS = ['drought', 'dustHaze', 'earthquakes', 'floods', 'seaLakeIce', 'landslides', 'manmade',
+                'severeStorms', 'snow', 'tempExtremes', 'volcanoes', 'waterColor', 'wildfires']
+
+
+def coordinates(lat, long):
+    """ returns the coordinates as they are written in the detailed page"""
+    return f"{abs(lat):.4f}°{'N' if lat >= 0 else 'S'} / {abs(long):.4f}°{'E' if long >= 0 else 'W'}"
+
+
+def towns_and_cities(rng):
+    """ returns the "Nearby towns and cities" cell of a detailed page"""
+    cities = []
+    for _ in range(rng.randint(1, 5)):
+        distance = rng.randint(1, 300)
+        cities.append(f"{distance} km ({int(distance * 0.62)} mi) {rng.choice(['N', 'S', 'E', 'W', 'NW', 'SE'])} "
+                      f"of {rng.choice(TOWNS)} (pop: {rng.randint(1, 999)},{rng.randint(0, 999):03d}) ")
+    return '{{towns}}' + '| Show on map | Quakes nearby'.join(cities) + '| Show on map | Quakes nearby'
+
+
+def detail_record(i, rng=None):
+    """ returns the fields of the detailed page of the synthetic earthquake number i, as parsed by
+    scraper.parse_detail_record"""
+    rng = rng or random.Random(i)
+    lat, long = rng.uniform(-90, 90), rng.uniform(-180, 180)
+    when = START_DATE + timedelta(seconds=rng.randint(0, 30 * 24 * 3600))
+    magnitude = f'{rng.uniform(1, 8):.1f}' if rng.random() > 0.02 else 'unknown'
+    felt = f'{rng.randint(1, 500)} reports' if rng.random() > 0.5 else float('nan')
+    energy = f'{rng.uniform(1, 9.9):.1f} x 10{rng.randint(8, 16)} joules' if rng.random() > 0.1 else float('nan')
+    return {'Date & time': when.strftime('%b %d, %Y %H:%M:%S') + ' UTC -',
+            'Local time at epicenter': when.strftime('%A, %b %d, %Y %I:%M %p') + ' (GMT +2)',
+            'Status': rng.choice(['Confirmed', 'Preliminary', 'Verified']),
+            'Magnitude': magnitude,
+            'Depth': f'{rng.uniform(0, 600):.1f} km',
+            'Epicenter latitude / longitude': coordinates(lat, long) + ' Somewhere',
+            'Antipode': coordinates(-lat, long - 180 if long > 0 else long + 180),
+            'Nearest volcano': f'{rng.choice(VOLCANOES)} ({rng.randint(1, 900)} km / {rng.randint(1, 560)} mi)',
+            'Shaking intensity': rng.choice(INTENSITIES),
+            'Felt': felt,
+            'Primary data source': rng.choice(SOURCES),
+            'Nearby towns and cities': towns_and_cities(rng),
+            'Weather at epicenter (at time of quake)': f'Clear Sky {rng.randint(-20, 40)}°C',
+            'Estimated seismic energy released': energy}
+
+
+def detail_records(n, seed=0):
+    """ returns the list of the records of n synthetic earthquakes"""
+    rng = random.Random(seed)
+    return [detail_record(i, rng) for i in range(n)]
+
+
+def quake_ids(n):
+    """ returns the ids of n synthetic earthquakes, like the ids of the rows of the main pages"""
+    return [f'quake-{1000000 + i}' for i in range(n)]
+
+
+PAGE_HEADER = ('<!DOCTYPE html><html><head><title>Latest earthquakes</title>'
+               '<script>var config = {"lang": "en", "ads": true};</script>'
+               '<style>.q3{color:green}.q4{color:orange}</style></head><body>'
+               '<div class="nav">' + ''.join(f'<a href="/region/{i}.html">Region {i}</a> ' for i in range(150)) + '</div>')
+PAGE_FOOTER = ('<div class="footer">' + ''.join(f'<p>Footer paragraph {i} with <b>some</b> text.</p>'
+                                                for i in range(60)) + '</div></body></html>')
+
+
+def quake_row(eq_id, magnitude, link):
+    """ returns the row of an earthquake in a main page or a "show more" page"""
+    level = int(float(magnitude)) if magnitude != 'unknown' else 0
+    return (f'<tr class="q{level}" id="{eq_id}"><td class="time">Nov 14, 2022 10:23</td>'
+            f'<td><span class="mag">{magnitude}</span></td><td>Somewhere</td>'
+            f'<td>10 km</td><td><a href="{link}">Details</a></td></tr>')
+
+
+def detail_link(eq_id):
+    """ returns the link of the detailed page of an earthquake, relative to the website"""
+    return f'earthquakes/quake-info/{eq_id.split("-")[-1]}.html'
+
+
+def archive_page_html(eq_ids, magnitudes, show_more_url):
+    """ returns a main page (today.html or an archive day) listing the given earthquakes, whose "show more" button
+    points to show_more_url"""
+    base, page = show_more_url.rsplit('/', 1)
+    rows = ''.join(quake_row(eq_id, magnitude, detail_link(eq_id)) for eq_id, magnitude in zip(eq_ids, magnitudes))
+    return (PAGE_HEADER + f'<div class="table-wrap"><script>var url="{base}/"+"{page}";</script>'
+            f'<table><tr><th>Date</th><th>Mag</th><th>Region</th><th>Depth</th><th></th></tr>{rows}</table></div>'
+            + PAGE_FOOTER)
+
+
+def show_more_html(eq_ids, magnitudes):
+    """ returns a "show more" page listing the given earthquakes"""
+    return ''.join(quake_row(eq_id, magnitude, detail_link(eq_id)) for eq_id, magnitude in zip(eq_ids, magnitudes))
+
+
+def detail_page_html(record):
+    """ returns the detailed page of an earthquake whose first table holds the fields of record"""
+    rows = ''.join(f'<tr><td>{field}</td><td>{"" if value != value else value}</td></tr>'
+                   for field, value in record.items())
+    related = ''.join(f'<tr><td>Nov {i}, 2022</td><td>M 4.{i}</td><td>Nearby quake {i}</td></tr>' for i in range(30))
+    return (PAGE_HEADER + f'<h1>Earthquake details</h1><table class="eq-details">{rows}</table>'
+            f'<h2>Previous quakes nearby</h2><table class="related">{related}</table>' + PAGE_FOOTER)
+
+
+def write_fixtures(directory, n_days=3, quakes_per_day=50, show_more_base='http://127.0.0.1/show_more'):
+    """ writes the html pages of n_days synthetic archive days in directory: archive/<day>.html, show_more/<day>.html
+    (half of the earthquakes of the day each) and detail/<id>.html for every earthquake. Returns the list of days."""
+    for folder in ('archive', 'show_more', 'detail'):
+        os.makedirs(os.path.join(directory, folder), exist_ok=True)
+    rng = random.Random(0)
+    days = []
+    for day_index in range(n_days):
+        day = (START_DATE + timedelta(days=day_index)).strftime('%Y-%b-%d').lower()
+        days.append(day)
+        first = day_index * quakes_per_day
+        eq_ids = [f'quake-{1000000 + i}' for i in range(first, first + quakes_per_day)]
+        records = [detail_record(i, rng) for i in range(first, first + quakes_per_day)]
+        magnitudes = [record['Magnitude'] for record in records]
+        half = quakes_per_day // 2
+        with open(os.path.join(directory, 'archive', f'{day}.html'), 'w') as page:
+            page.write(archive_page_html(eq_ids[:half], magnitudes[:half], f'{show_more_base}/{day}.html'))
+        with open(os.path.join(directory, 'show_more', f'{day}.html'), 'w') as page:
+            page.write(show_more_html(eq_ids[half:], magnitudes[half:]))
+        for eq_id, record in zip(eq_ids, records):
+            with open(os.path.join(directory, 'detail', f'{eq_id.split("-")[-1]}.html'), 'w') as page:
+                page.write(detail_page_html(record))
+    return days
+
+
+def eonet_events(category, n, seed=0):
+    """ returns n synthetic events of an EONET category, as listed in the "events" of the API"""
+    rng = random.Random(f'{category}-{seed}')
+    first = 100000 + 10000 * CATEGORY_IDS.index(category) if category in CATEGORY_IDS else 900000
+    events = []
+    for i in range(n):
+        when = START_DATE + timedelta(seconds=rng.randint(0, 30 * 24 * 3600))
+        events.append({'id': f'EONET_{first + i}',
+                       'title': f'Synthetic {category} event {i}',
+                       'geometry': [{'magnitudeValue': round(rng.uniform(10, 900), 1) if rng.random() > 0.3 else None,
+                                     'magnitudeUnit': 'NM^2' if category == 'seaLakeIce' else None,
+                                     'date': when.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                                     'type': 'Point',
+                                     'coordinates': [round(rng.uniform(-180, 180), 4),
+                                                     round(rng.uniform(-90, 90), 4)]}]})
+    return events
@@ -0,0 +1,161 @@
+import re
+import logging
+import threading
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import metrics
+
+logger = logging.getLogger(__name__)
+
+### this file stores the parsers of the cells of the detailed pages used by cleaning_converting. The regular
+### expressions are compiled once. The parsers of the cells that cost the most to parse (coordinates, energy, nearby
+### cities, felt reports) are memoized on the raw text of the cell in a bounded lru cache: a column is parsed one
+### distinct text at a time, and the texts already seen (the same town list, the same energy, the same number of
+### reports) are not parsed again, in the same batch or in the next ones. Each parser counts the cells it was given and
+### the ones it had to parse, see stats.
+
+COORD_PATTERN = r"([\d\.]+)°([SN])[^\d]+([\d\.]+)°([EW])"
+ENERGY_PATTERN = r"([\d.]+) x 10(\d+)"
+CITY_PATTERN = r'(^\d+) .*\) (.*) \(pop: (\d+),(\d+)'
+COORD_RE = re.compile(COORD_PATTERN)
+ENERGY_RE = re.compile(ENERGY_PATTERN)
+CITY_RE = re.compile(CITY_PATTERN)
+CITIES_PREFIX_RE = re.compile(r'^.*}}')
+CITY_SEPARATOR = '| Show on map | Quakes nearby'
+UTC_SUFFIX_RE = re.compile('UTC.*')
+FELT_RE = re.compile(r'^\d*')
+DEFAULT_CACHE_SIZE = 4096  # distinct cell texts kept by each parser
+MISSING_COORDINATES = (np.nan, np.nan)
+
+
+def object_array(items):
+    """ returns a 1 dimension numpy array of python objects, even when the items are tuples"""
+    array = np.empty(len(items), dtype=object)
+    for position, item in enumerate(items):
+        array[position] = item
+    return array
+
+
+def parse_coordinates(text):
+    """ returns the (latitude, longitude) floats of a coordinates cell, ex: 12.3°S / 45.6°E, NaN when it does not
+    match"""
+    result = COORD_RE.search(text)
+    if result is None:
+        return MISSING_COORDINATES
+    lat = float(result[1]) * (-1 if result[2] == 'S' else 1)
+    long = float(result[3]) * (-1 if result[4] == 'W' else 1)
+    return lat, long
+
+
+def parse_energy(text):
+    """ returns the energy of a cell like 1.2 x 1015 joules as a float, NaN when it does not match"""
+    result = ENERGY_RE.search(text)
+    if result is None:
+        return np.nan
+    return float(result[1]) * 10.0 ** int(result[2])
+
+
+def parse_cities(text):
+    """ returns the (distance, city, population) of each city of a "Nearby towns and cities" cell, as a tuple"""
+    cities = CITIES_PREFIX_RE.sub('', text).split(CITY_SEPARATOR)
+    matches = [CITY_RE.match(city) for city in cities]
+    return tuple((int(m[1]), m[2], 1000 * int(m[3]) + int(m[4])) for m in matches if m)
+
+
+def parse_felt(text):
+    """ returns the number of reports of a felt cell, ex: 12 reports, 0 when it has none"""
+    digits = FELT_RE.match(text)[0]
+    return int(digits) if digits else 0
+
+
+class CachedParser:
+    """ This class memoizes a parser of cells on the text of the cell, in an lru cache of at most max_size texts.
+    column parses a whole column, each distinct text once. It counts the cells given (cells) and the ones actually
+    parsed (parsed), the others were found in the column or in the cache. It can be shared by threads."""
+    def __init__(self, name, parse, max_size=DEFAULT_CACHE_SIZE):
+        self.name = name
+        self.parse = parse
+        self.max_size = max_size
+        self._cached = lru_cache(maxsize=max_size)(parse)
+        self._lock = threading.Lock()
+        self.cells = 0
+        self.parsed = 0
+
+    def __call__(self, text):
+        return self.column([text])[0]
+
+    def column(self, values, missing=np.nan):
+        """ returns the object array of the parsed cells of values, missing for the missing cells (not counted)"""
+        codes, texts = pd.factorize(pd.Series(values, dtype=object))
+        misses = self._cached.cache_info().misses
+        results = [self._cached(text) for text in texts]
+        parsed = self._cached.cache_info().misses - misses  # approximate when threads share the cache
+        cells = int(np.count_nonzero(codes >= 0))
+        with self._lock:
+            self.cells += cells
+            self.parsed += parsed
+        metrics.inc('parser_cache_total', cells - parsed, parser=self.name, result='hit')
+        metrics.inc('parser_cache_total', parsed, parser=self.name, result='miss')
+        return object_array(results + [missing])[codes]
+
+    def resize(self, max_size):
+        """ empties the cache and keeps at most max_size texts from now on"""
+        self.max_size = max_size
+        self._cached = lru_cache(maxsize=max_size)(self.parse)
+
+    def clear(self):
+        """ empties the cache and resets the counters"""
+        self._cached.cache_clear()
+        with self._lock:
+            self.cells = 0
+            self.parsed = 0
+
+    def stats(self):
+        """ returns the number of cells, of cells parsed, the hit rate (the cells not parsed) and the size of the
+        cache"""
+        return {'cells': self.cells, 'parsed': self.parsed,
+                'hit_rate': (self.cells - self.parsed) / self.cells if self.cells else 0.0,
+                'size': self._cached.cache_info().currsize}
+
+
+coordinates = CachedParser('coordinates', parse_coordinates)
+energy = CachedParser('energy', parse_energy)
+cities = CachedParser('cities', parse_cities)
+felt = CachedParser('felt', parse_felt)
+PARSERS = (coordinates, energy, cities, felt)
+
+
+def set_cache_size(max_size):
+    """ sets the number of distinct texts kept by each parser"""
+    for parser in PARSERS:
+        parser.resize(max_size)
+
+
+def get_cache_size():
+    return coordinates.max_size
+
+
+def clear():
+    """ empties the caches and resets the counters of all the parsers"""
+    for parser in PARSERS:
+        parser.clear()
+
+
+def stats():
+    """ returns {parser name: stats} of all the parsers, see CachedParser.stats"""
+    return {parser.name: parser.stats() for parser in PARSERS}
+
+
+def counts():
+    """ returns {parser name: (cells, parsed)} of all the parsers"""
+    return {parser.name: (parser.cells, parser.parsed) for parser in PARSERS}
+
+
+def add_counts(parser_counts):
+    """ adds the cells and cells parsed counted by the parsers of another process (see counts) to the parsers"""
+    for parser in PARSERS:
+        cells, parsed = parser_counts.get(parser.name, (0, 0))
+        with parser._lock:
+            parser.cells += cells
+            parser.parsed += parsed
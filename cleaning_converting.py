@@ -1,107 +1,123 @@
-from datetime import datetime
 import numpy as np
-import re
 import pandas as pd
+import cell_parsers
+import metrics
+from cell_parsers import UTC_SUFFIX_RE, object_array
 
 
 ### this file stores all the functions needed to clean and convert the data from unusable formats to format fit to use
-### in a SQL database.
+### in a SQL database. The regular expressions and the cached parsers of the cells are in cell_parsers.
+
+DATE_FORMAT = '%b %d, %Y %H:%M:%S UTC'
+INTENSITY_STR_TO_NBR = {'Not felt': 0,
+                        'Very weak shaking': 1,
+                        'Weak shaking near epicenter': 1,
+                        'Light shaking near epicenter': 1,
+                        'Light shaking': 1,
+                        'Weak shaking': 2,
+                        'Moderate shaking near epicenter': 3,
+                        'Moderate shaking': 3,
+                        'Strong shaking near epicenter': 4,
+                        'Strong shaking': 4,
+                        'Very strong shaking near epicenter': 5,
+                        'Very strong shaking': 5,
+                        'Severe shaking near epicenter': 6,
+                        'Severe shaking': 6,
+                        'Violent shaking near epicenter': 7,
+                        'Violent shaking': 7}
 
-def set_epicenter_coord(str_epicenter):
-    """ this function convert the epicenter coordinates from string to a tuple of coordinates as floats  """
-    pattern = r"([\d\.]+)°([SN])[^\d]+([\d\.]+)°([EW])"
-    result = re.search(pattern, str_epicenter)
-
-    grp1 = result[1]  # value of longitude
-    grp2 = result[2]  # letter or longitude
-    grp3 = result[3]  # value of latitude
-    grp4 = result[4]  # letter or latitude
 
-    lat = float(grp1)
-    long = float(grp3)
-    lat *= -1 if "S" in grp2 else 1
-    long *= -1 if "W" in grp4 else 1
-    coord = (lat, long)
-    # there is also the information on the country and region, do we need this ? its stored in grp5 if needed.
-    return coord
+def set_epicenter_coord(str_epicenter):
+    """ this function convert the epicenter coordinates from string to a tuple of coordinates as floats, (NaN, NaN)
+    when the cell does not hold coordinates (see cell_parsers.parse_coordinates)"""
+    return cell_parsers.parse_coordinates(str_epicenter)
 
 
 def energy_release(e):
-    """ this function convert the energy released from a string to a float in scientific notation"""
-    result = re.search(r"([\d.]+) x 10(\d+)", e)
-    mantis = float(result[1])
-    exponent = int(result[2])
-    return mantis * np.power(10, exponent)
+    """ this function convert the energy released from a string to a float in scientific notation, NaN when the cell
+    does not hold an energy (see cell_parsers.parse_energy)"""
+    return cell_parsers.parse_energy(e)
 
 
 def extract_cities_info(city_string):
     """ This function extracts the cities information stored as a string and separates into cities names, population
-    and distance to the earthquake. It returns a list mentioned data for each earthquake"""
+    and distance to the earthquake. It returns a list mentioned data for each earthquake (see
+    cell_parsers.parse_cities)"""
     if city_string is np.nan:
         return np.nan
-    city_string = re.sub(r'^.*}}', '', city_string)
-    cities = city_string.split('| Show on map | Quakes nearby')
-    matches = [re.match(r'(^\d+) .*\) (.*) \(pop: (\d+),(\d+)', city) for city in cities]
-    info = [(int(m.group(1)), m.group(2), 1000 * int(m.group(3)) + int(m.group(4))) for m in matches if m]
-    return info
+    return list(cell_parsers.parse_cities(city_string))
+
+
+def set_epicenter_coord_vectorized(series):
+    """ column version of set_epicenter_coord: converts a whole column of coordinates to tuples (latitude, longitude)
+    of floats, each distinct text is parsed once (see cell_parsers)"""
+    return cell_parsers.coordinates.column(series, missing=cell_parsers.MISSING_COORDINATES)
+
+
+def energy_release_vectorized(series):
+    """ column version of energy_release: converts a whole column of energies to floats, the empty cells stay NaN"""
+    return cell_parsers.energy.column(series).astype(float)
+
+
+def extract_cities_info_vectorized(series):
+    """ column version of extract_cities_info: the (distance, city, population) of the cities of each cell are
+    gathered in a list, each distinct text is parsed once (see cell_parsers). The empty cells stay NaN."""
+    return object_array([list(cities) if isinstance(cities, tuple) else np.nan
+                         for cities in cell_parsers.cities.column(series)])
 
 
 def convert(df):
     """ When called on a dataframe, this function performs all converting and cleaning needed to parse the scraped data
-    into to a sql-databse format """
-    columns_to_drop = ["Local time at epicenter"]
-    df.drop(columns_to_drop, axis=1)
-
+    into to a sql-databse format. Every column is converted at once with pandas string methods and numpy arithmetic,
+    or with the cached parsers of cell_parsers that parse each distinct text once. The output is the same as
+    the first version (benchmarks/reference_convert.py, the energy column is float instead of object), except the
+    cells that do not match their pattern, which become NaN instead of raising an error. The time spent on each column
+    is recorded in the metrics (see metrics)."""
     # Status
-    df['Status'] = df['Status'] == "Confirmed"
+    with metrics.timer('convert_column_seconds', column='Status'):
+        df['Status'] = df['Status'] == "Confirmed"
 
     # Date & time
-    df['Date & time'] = df['Date & time'].apply(
-        lambda x: datetime.strptime(re.sub('UTC.*', 'UTC', x), '%b %d, %Y %H:%M:%S UTC'))
+    with metrics.timer('convert_column_seconds', column='Date & time'):
+        df['Date & time'] = pd.to_datetime(df['Date & time'].str.replace(UTC_SUFFIX_RE, 'UTC', regex=True),
+                                           format=DATE_FORMAT).to_numpy()
 
     # Magnitude
-    df['Magnitude'] = df['Magnitude'].where(~df['Magnitude'].str.startswith("unknown"), np.nan)
-    df['Magnitude'] = df['Magnitude'].astype(float)
+    with metrics.timer('convert_column_seconds', column='Magnitude'):
+        df['Magnitude'] = df['Magnitude'].where(~df['Magnitude'].str.startswith("unknown"), np.nan)
+        df['Magnitude'] = df['Magnitude'].astype(float)
 
     # Depth
-    df['Depth'] = df['Depth'].str.replace(" km", '')  # just to get rid of the km str at the end
-    df['Depth'] = df['Depth'].astype(float)
+    with metrics.timer('convert_column_seconds', column='Depth'):
+        df['Depth'] = df['Depth'].str.replace(" km", '', regex=False).astype(float)
 
     # Epicenter latitude / longitude
-    df["Epicenter latitude / longitude"] = df["Epicenter latitude / longitude"].apply(set_epicenter_coord)
+    with metrics.timer('convert_column_seconds', column='Epicenter latitude / longitude'):
+        df["Epicenter latitude / longitude"] = set_epicenter_coord_vectorized(df["Epicenter latitude / longitude"])
 
     # Antipode
-    df["Antipode"] = df["Antipode"].apply(set_epicenter_coord)
+    with metrics.timer('convert_column_seconds', column='Antipode'):
+        df["Antipode"] = set_epicenter_coord_vectorized(df["Antipode"])
 
     # Shaking intensity
-    intensity_str_to_nbr = {'Not felt': 0,
-                            'Very weak shaking': 1,
-                            'Weak shaking near epicenter': 1,
-                            'Light shaking near epicenter': 1,
-                            'Light shaking': 1,
-                            'Weak shaking': 2,
-                            'Moderate shaking near epicenter': 3,
-                            'Moderate shaking': 3,
-                            'Strong shaking near epicenter': 4,
-                            'Strong shaking': 4,
-                            'Very strong shaking near epicenter': 5,
-                            'Very strong shaking': 5,
-                            'Severe shaking near epicenter': 6,
-                            'Severe shaking': 6,
-                            'Violent shaking near epicenter': 7,
-                            'Violent shaking': 7}
-    df["Shaking intensity"] = df["Shaking intensity"].apply(lambda x: intensity_str_to_nbr[x])
+    with metrics.timer('convert_column_seconds', column='Shaking intensity'):
+        intensity = df["Shaking intensity"].map(INTENSITY_STR_TO_NBR)
+        unknown = intensity.isnull()
+        if unknown.any():  # like the first version, a label that is not in INTENSITY_STR_TO_NBR is an error
+            raise KeyError(f'unknown shaking intensity: {sorted(set(map(str, df["Shaking intensity"][unknown])))}')
+        df["Shaking intensity"] = intensity.to_numpy()
 
     # Felt
-    df["Felt"] = df["Felt"].where(df["Felt"].notnull(), "0")
-    df["Felt"] = df["Felt"].apply(lambda x: int(re.search(r'^\d*', x)[0]))
+    with metrics.timer('convert_column_seconds', column='Felt'):
+        df["Felt"] = cell_parsers.felt.column(df["Felt"], missing=0).astype(np.int64)
 
     # Estimated seismic energy released
-    df["Estimated seismic energy released"] = df["Estimated seismic energy released"].where(
-        df["Estimated seismic energy released"].notnull(), np.nan)
-    df["Estimated seismic energy released"][df["Estimated seismic energy released"].notnull()] = \
-        df["Estimated seismic energy released"][df["Estimated seismic energy released"].notnull()].apply(energy_release)
-    df['Nearby towns and cities'] = df['Nearby towns and cities'].apply(extract_cities_info)
+    with metrics.timer('convert_column_seconds', column='Estimated seismic energy released'):
+        df["Estimated seismic energy released"] = energy_release_vectorized(df["Estimated seismic energy released"])
+
+    # Nearby towns and cities
+    with metrics.timer('convert_column_seconds', column='Nearby towns and cities'):
+        df['Nearby towns and cities'] = extract_cities_info_vectorized(df['Nearby towns and cities'])
     return df
 
 
@@ -0,0 +1,238 @@
+# coding=utf-8
+""" The command line of the scraper. This module only imports the standard library and the light modules of the
+project, so --help, a wrong argument or the validation of the dates and magnitudes answer at once. The heavy
+modules (pandas, bs4, requests, pymysql) are imported by scraper, which is only loaded once the arguments are valid.
+
+Usage: python cli.py [options] (python scraper.py [options] does the same, after importing everything)
+"""
+import argparse
+import sys
+import logging
+from datetime import datetime
+import state_store
+import journal
+import daemon
+
+LOG_FILE = 'scraper.log'
+LOG_FORMAT = '%(asctime)s-%(levelname)s-FILE:%(filename)s-FUNC:%(funcName)s-LINE:%(lineno)d-%(message)s'
+# the choices of --parser and --backend, the same as html_parsing.BACKENDS and storage.BACKENDS (those modules import
+# pandas). The options whose default comes from a heavy module are None here, scraper.apply_defaults sets them.
+PARSERS = ('html.parser', 'lxml', 'targeted')
+BACKENDS = ('mysql', 'sqlite', 'parquet')
+
+HELP_MESSAGE = """This is a CLI to scrape specific information about earthquakes.
+the program will scrape all the relevant information (by date, magnitude) and will update the information
+in the database.
+
+Usage:
+scraper.py [-h] [--date DATE]
+            [--magnitude MAGNITUDE]
+            [--n_rows NUMBER]
+            [--workers NUMBER] [--day_workers NUMBER] [--rate NUMBER]
+            [--timeout SECONDS] [--retries NUMBER]
+            [--chunk_size NUMBER] [--preload_cities]
+            [--incremental] [--state_file PATH]
+            [--cache_dir PATH] [--cache_size MB] [--offline]
+            [--parser {html.parser,lxml,targeted}] [--parser_cache_size NUMBER]
+            [--stream] [--batch_size NUMBER] [--processes NUMBER]
+            [--db_writers NUMBER] [--db_config PATH]
+            [--backend {mysql,sqlite,parquet}] [--storage_path PATH]
+            [--metrics_out PATH]
+            [--resume] [--journal_file PATH]
+            [--daemon] [--quakes_interval SECONDS] [--events_interval SECONDS]
+            [--refresh_interval SECONDS] [--jitter FRACTION] [--events_days NUMBER]
+
+options:
+  -h, --help            show this help message and exit
+  --date START_DATE END_DATE(optional) 
+  --magnitude FROM_MAGNITUDE TO_MAGNITUDE(optional)
+  --n_rows NUMBER
+  --workers NUMBER      number of detailed pages downloaded at the same time (default 1)
+  --day_workers NUMBER  number of days of the date range crawled at the same time (default 1)
+  --rate NUMBER         maximum number of requests per second sent to each host (default no limit)
+  --timeout SECONDS     timeout of each http request (default 30)
+  --retries NUMBER      number of retries of the requests failing with 429 or 5xx (default 3)
+  --chunk_size NUMBER   number of earthquakes written to the database in each transaction (default 500)
+  --preload_cities      load the cities of the database in the city cache before writing (mysql only)
+  --incremental         skip the quakes already final in the database and the closed archive days
+  --state_file PATH     file storing the state of the incremental mode (default scraper_state.json)
+  --cache_dir PATH      keep the downloaded pages in a local cache in this folder
+  --cache_size MB       maximum size of the cache, the least recently used pages are removed (default 512)
+  --offline             replay the pages from the cache without using the network (default folder .http_cache)
+  --parser NAME         html parser: html.parser (default), lxml or targeted (lxml parsing only the needed tags)
+  --parser_cache_size NUMBER  distinct cell texts kept by each cached cell parser, 0 to disable (default 4096)
+  --stream              download, convert and write the quakes in batches instead of all at once
+  --batch_size NUMBER   number of quakes in each batch of the stream mode (default 200)
+  --processes NUMBER    parse and convert the detailed pages with a pool of processes (default 1, not with --stream)
+  --db_writers NUMBER   number of connections writing batches to the database at the same time (default 1)
+  --db_config PATH      json file of the database settings (default db_config.json, see db_pool)
+  --backend NAME        where the data is written: mysql (default), sqlite or parquet (needs pyarrow)
+  --storage_path PATH   sqlite file (default earthquakes.db) or parquet folder (default earthquakes_parquet)
+  --metrics_out PATH    write the metrics of the run to this file: json if it ends with .json, Prometheus otherwise
+  --resume              journal the run and continue the last unfinished run with the same arguments where it stopped
+  --journal_file PATH   file storing the journal of the resumable runs (default scraper_journal.sqlite)
+  --daemon              keep running: poll today.html and EONET and write only the new or changed quakes and events
+  --quakes_interval SECONDS  seconds between two polls of today.html in daemon mode (default 60)
+  --events_interval SECONDS  seconds between two polls of EONET in daemon mode (default 600)
+  --refresh_interval SECONDS seconds after which a quake not confirmed yet is downloaded again (default 900)
+  --jitter FRACTION     random change of each interval of the daemon mode, as a fraction of it (default 0.1)
+  --events_days NUMBER  number of past days of events polled from EONET in daemon mode (default 2)
+
+Examples:
+1. scraper.py --date 12/11/2022 14/11/2022 -> will scrape all earthquakes from 12/11/2022 to 14/11/2022
+2. scraper.py --date 12/11/2022 --magnitude 3.6 8.1 ->
+    will scrape all earthquakes from 12/11/2022 until today that have magnitude between 3.6 to 8.1
+3. scraper.py --date 12/11/2022 --magnitude 3.6  ->
+    will srcape all earthquakes from 12/11/2022 until today
+    that have magnitude above 3.6
+4. scraper.py --magnitude 7 --n_rows 100 -> will scrape all earthquakes that have magnitude above 7
+    limited to 100 first earthquakes
+5. scraper.py --date 01/11/2022 30/11/2022 --workers 8 --rate 4 -> will download the detailed pages
+    8 at a time, with at most 4 requests per second to the website
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def setup_logging():
+    """ sends the logs of every module to scraper.log, called when the scraper runs and not when a module is
+    imported"""
+    logging.basicConfig(filename=LOG_FILE, format=LOG_FORMAT, level=logging.INFO)
+
+
+class DateAction(argparse.Action):
+    """ This class is used to select the dates of wanted earthquakes to scrape. It is used from the command line or in
+    configuration in the IDE"""
+    def __call__(self, parser, namespace, values, option_string=None):
+        if not values:
+            setattr(namespace, self.dest, None)
+            return
+
+        if len(values) > 2:
+            raise ValueError(f'expected start and end date values. got {len(values)} args: {values}\n')
+        # expected at most 2 values, got {len(values)}
+        try:
+            start_date = datetime.strptime(values[0], '%d/%m/%Y')
+        except ValueError as e:
+            raise ValueError(f'Could not convert {values[0]} to date.\n {e}')
+
+        end_date = start_date
+
+        if len(values) == 2:
+            try:
+                end_date = datetime.strptime(values[1], '%d/%m/%Y')
+            except ValueError as e:
+                raise ValueError(f'Could not convert {values[1]} to date.\n {e}')
+
+        if end_date < start_date:
+            raise ValueError(f'Start date {start_date} must be before end date {end_date}\n')
+        setattr(namespace, self.dest, (start_date, end_date))
+
+
+class MagnitudeAction(argparse.Action):
+    """ This class is used to select the wanted magnitude of earthquakes to scrop. It is used the command line or in
+    configuration from the IDE"""
+    def __call__(self, parser, namespace, values, option_string=None):
+        if not values:
+            setattr(namespace, self.dest, None)
+            return
+        if len(values) > 2:
+            raise ValueError(f'expected at most 2 values for magnitude range. got {len(values)} args: {values}\n')
+        try:
+            from_magnitude = float(values[0])
+            to_magnitude = float(values[1]) if len(values) == 2 else None
+        except ValueError:
+            raise ValueError(f'magnitude expected to be decimal number, got {values}')
+        if to_magnitude and from_magnitude > to_magnitude:
+            raise ValueError(f'{from_magnitude} must be less than {to_magnitude}')
+        if from_magnitude < 0 or (to_magnitude and to_magnitude < 0):
+            raise ValueError(f'magnitude must be positive, got {from_magnitude}, {to_magnitude}')
+        setattr(namespace, self.dest, (from_magnitude, to_magnitude))
+
+
+def build_parser():
+    """ returns the parser of the arguments of the scraper"""
+    parser = argparse.ArgumentParser(add_help=HELP_MESSAGE)
+    parser.add_argument('--date', nargs='+', action=DateAction)
+    parser.add_argument('--magnitude', nargs='+', action=MagnitudeAction)
+    parser.add_argument('--n_rows', type=int, action='store')
+    parser.add_argument('--workers', type=int, action='store', default=1)
+    parser.add_argument('--day_workers', type=int, action='store', default=1)
+    parser.add_argument('--rate', type=float, action='store', default=None)
+    parser.add_argument('--timeout', type=float, action='store', default=None)
+    parser.add_argument('--retries', type=int, action='store', default=None)
+    parser.add_argument('--chunk_size', type=int, action='store', default=None)
+    parser.add_argument('--preload_cities', action='store_true')
+    parser.add_argument('--incremental', action='store_true')
+    parser.add_argument('--state_file', action='store', default=state_store.DEFAULT_STATE_FILE)
+    parser.add_argument('--cache_dir', action='store', default=None)
+    parser.add_argument('--cache_size', type=float, action='store', default=None)
+    parser.add_argument('--offline', action='store_true')
+    parser.add_argument('--parser', action='store', choices=PARSERS, default=PARSERS[0])
+    parser.add_argument('--parser_cache_size', type=int, action='store', default=None)
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--batch_size', type=int, action='store', default=None)
+    parser.add_argument('--processes', type=int, action='store', default=1)
+    parser.add_argument('--db_writers', type=int, action='store', default=1)
+    parser.add_argument('--db_config', action='store', default=None)
+    parser.add_argument('--backend', action='store', choices=BACKENDS, default=BACKENDS[0])
+    parser.add_argument('--storage_path', action='store', default=None)
+    parser.add_argument('--metrics_out', action='store', default=None)
+    parser.add_argument('--resume', action='store_true')
+    parser.add_argument('--journal_file', action='store', default=journal.DEFAULT_JOURNAL_FILE)
+    parser.add_argument('--daemon', action='store_true')
+    parser.add_argument('--quakes_interval', type=float, action='store', default=daemon.DEFAULT_QUAKES_INTERVAL)
+    parser.add_argument('--events_interval', type=float, action='store', default=daemon.DEFAULT_EVENTS_INTERVAL)
+    parser.add_argument('--refresh_interval', type=float, action='store', default=daemon.DEFAULT_REFRESH_INTERVAL)
+    parser.add_argument('--jitter', type=float, action='store', default=daemon.DEFAULT_JITTER)
+    parser.add_argument('--events_days', type=int, action='store', default=daemon.DEFAULT_EVENTS_DAYS)
+    return parser
+
+
+def parse_args(argv=None):
+    """ parses and validates the arguments, prints the usage and exits when they are wrong"""
+    parser = build_parser()
+    try:
+        args = parser.parse_args(argv)
+        if args.workers < 1 or args.day_workers < 1:
+            raise ValueError(f'workers must be at least 1, got {args.workers} and {args.day_workers}')
+        if args.rate is not None and args.rate <= 0:
+            raise ValueError(f'rate must be positive, got {args.rate}')
+        if args.db_writers < 1:
+            raise ValueError(f'db_writers must be at least 1, got {args.db_writers}')
+        if args.parser_cache_size is not None and args.parser_cache_size < 0:
+            raise ValueError(f'parser_cache_size must be positive or 0, got {args.parser_cache_size}')
+        if any(size is not None and size < 1 for size in (args.chunk_size, args.batch_size)):
+            raise ValueError(f'chunk_size and batch_size must be at least 1, got {args.chunk_size}, {args.batch_size}')
+        if args.quakes_interval <= 0 or args.events_interval <= 0 or not 0 <= args.jitter < 1:
+            raise ValueError(f'the intervals must be positive and the jitter between 0 and 1, got '
+                             f'{args.quakes_interval}, {args.events_interval}, {args.jitter}')
+        if args.stream and args.processes > 1:
+            raise ValueError('--processes converts all the pages of the run at once, it can not be used with --stream')
+        if args.preload_cities and args.backend != 'mysql':
+            raise ValueError(f'--preload_cities fills the city cache of the mysql backend, not of {args.backend}')
+        if args.refresh_interval <= 0 or args.events_days < 0:
+            raise ValueError(f'refresh_interval must be positive and events_days positive or 0, got '
+                             f'{args.refresh_interval}, {args.events_days}')
+        if args.daemon and (args.date or args.resume):
+            raise ValueError('--daemon polls today.html, it can not be used with --date or --resume')
+        logger.info(f'Parse user args successfully. args are: date = {args.date},'
+                    f'magnitude = {args.magnitude}, num of rows = {args.n_rows}, '
+                    f'workers = {args.workers}, day workers = {args.day_workers}, rate = {args.rate}')
+    except Exception as e:
+        print(f'Wrong arguments passed:\n{e}\nUsage instructions:\n {HELP_MESSAGE}')
+        logger.error(f'Wrong arguments passed:\n{e}')
+        sys.exit()
+    return args
+
+
+def main(argv=None):
+    """ This is the main function of the program: it parses the arguments, then imports the scraper and runs it"""
+    setup_logging()
+    args = parse_args(argv)
+    import scraper
+    scraper.run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import random
+import signal
+import threading
+import time
+import logging
+import metrics
+
+logger = logging.getLogger(__name__)
+
+### this file stores the service mode of the scraper (--daemon): instead of one run from cron, the process stays up
+### with its http session and database pool open and runs its polls (today.html, EONET) on their own intervals, each
+### delay shifted by a random jitter so that several scrapers do not hit the website at the same time. SeenItems keeps
+### what the previous polls saw, so that only the new or changed quakes and events are fetched and written.
+### SIGTERM and SIGINT stop the daemon after the running poll.
+
+DEFAULT_QUAKES_INTERVAL = 60  # seconds between two polls of today.html
+DEFAULT_EVENTS_INTERVAL = 600  # seconds between two polls of EONET
+DEFAULT_REFRESH_INTERVAL = 900  # seconds after which a quake that is not final yet is downloaded again
+DEFAULT_JITTER = 0.1  # each delay is changed by at most this fraction, at random
+DEFAULT_EVENTS_DAYS = 2  # days of events polled from EONET, an event can be updated after the day it started
+ERROR_BACKOFF = 2  # the delay is multiplied by this after each failed poll in a row, up to MAX_BACKOFF
+MAX_BACKOFF = 8
+
+
+def jittered(interval, jitter=DEFAULT_JITTER):
+    """ returns interval changed by a random fraction between -jitter and +jitter"""
+    return interval * (1 + random.uniform(-jitter, jitter))
+
+
+class Task:
+    """ a poll run by the daemon every interval seconds: run() does one poll. failures is the number of polls in a row
+    that raised an error, the next delay is longer after each of them."""
+    def __init__(self, name, interval, run):
+        self.name = name
+        self.interval = interval
+        self.run = run
+        self.failures = 0
+        self.due = 0.0
+
+    def delay(self, jitter):
+        return jittered(self.interval * min(ERROR_BACKOFF ** self.failures, MAX_BACKOFF), jitter)
+
+
+class SeenItems:
+    """ remembers the signature of the items (quakes or events) seen by the last poll and when each one was written.
+    changed returns the items that are new (and not already final), whose signature changed, or that are not final and
+    were written more than refresh seconds ago. Only the items of the last poll are kept, so the memory follows the
+    size of the window polled and not the uptime."""
+    def __init__(self, refresh=None):
+        self.refresh = refresh
+        self.signatures = {}
+        self.written = {}
+
+    def is_changed(self, key, signature, is_final, now):
+        previous = self.signatures.get(key)
+        if previous is None:
+            return not is_final(key)
+        if previous != signature:
+            return True
+        return self.refresh is not None and not is_final(key) and now - self.written.get(key, 0) > self.refresh
+
+    def changed(self, signatures, is_final=lambda key: False, now=None):
+        """ returns the keys of signatures ({key: signature}) that must be fetched and written again"""
+        now = now or time.time()
+        changed = [key for key, signature in signatures.items() if self.is_changed(key, signature, is_final, now)]
+        self.signatures = dict(signatures)
+        self.written = {key: written for key, written in self.written.items() if key in signatures}
+        return changed
+
+    def mark_written(self, keys, now=None):
+        now = now or time.time()
+        self.written.update((key, now) for key in keys)
+
+    def forget(self, keys):
+        """ forgets keys whose write failed, so that the next poll tries them again"""
+        for key in keys:
+            self.signatures.pop(key, None)
+            self.written.pop(key, None)
+
+
+class Daemon:
+    """ This class runs tasks (see Task) until it is stopped by stop(), SIGTERM or SIGINT, or after max_polls polls
+    (to test it). A failed poll is logged and retried after a longer delay, it does not stop the daemon."""
+    def __init__(self, tasks, jitter=DEFAULT_JITTER):
+        self.tasks = tasks
+        self.jitter = jitter
+        self._stop = threading.Event()
+
+    def stop(self, *args):
+        if not self._stop.is_set():
+            logger.info('daemon stopping after the current poll')
+        self._stop.set()
+
+    def install_signal_handlers(self):
+        """ stops the daemon on SIGTERM and SIGINT, can only be called from the main thread"""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+    def run_task(self, task):
+        start = time.time()
+        try:
+            task.run()
+            task.failures = 0
+            metrics.inc('daemon_polls_total', task=task.name, result='ok')
+            metrics.set_gauge('daemon_last_success_timestamp', time.time(), task=task.name)
+        except Exception as error:
+            task.failures += 1
+            metrics.inc('daemon_polls_total', task=task.name, result='error')
+            logger.exception(f'poll {task.name} failed ({task.failures} in a row): {error}')
+        metrics.observe('daemon_poll_seconds', time.time() - start, task=task.name)
+
+    def run(self, max_polls=None, after_poll=None):
+        """ runs the tasks until the daemon is stopped, all of them once at the start. after_poll is called after each
+        poll (to export the metrics)."""
+        logger.info(f'daemon started: {", ".join(f"{task.name} every {task.interval}s" for task in self.tasks)}')
+        polls = 0
+        now = time.monotonic()
+        for task in self.tasks:
+            task.due = now
+        while not self._stop.is_set() and (max_polls is None or polls < max_polls):
+            task = min(self.tasks, key=lambda task: task.due)
+            if self._stop.wait(max(0.0, task.due - time.monotonic())):
+                break
+            self.run_task(task)
+            polls += 1
+            task.due = time.monotonic() + task.delay(self.jitter)
+            if after_poll:
+                after_poll()
+        logger.info(f'daemon stopped after {polls} polls')
+        return polls
@@ -0,0 +1,224 @@
+import json
+import os
+import queue
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+### this file stores the pool of database connections. The connections are opened on demand up to the size of the
+### pool and reused, each one is checked (ping) when it is taken from the pool and reopened if it was dropped by the
+### server. The settings of the database come from the environment or a json config file. The writer pool applies
+### independent batches in parallel, each worker thread writing through its own connection of the pool.
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_CONFIG_FILE = 'db_config.json'
+DEFAULT_WRITE_RETRIES = 3
+ENV_PREFIX = 'DM_EQ_DB_'
+# the settings of the database, each one is read from the config file or from the environment variable
+# DM_EQ_DB_<NAME>, ex: DM_EQ_DB_HOST=localhost. There are no default credentials, only the port has a default.
+SETTING_NAMES = ('host', 'port', 'user', 'password', 'database')
+REQUIRED_SETTINGS = ('host', 'user', 'password', 'database')
+DEFAULT_SETTINGS = {'port': 3306}
+# deadlock and lock wait timeout: the transaction was rolled back by the server and can be run again
+RETRYABLE_ERRORS = (1205, 1213)
+
+
+def load_settings(config_file=None):
+    """ returns the settings of the database: DEFAULT_SETTINGS, replaced by the ones of the json config file
+    (DEFAULT_CONFIG_FILE or the DM_EQ_DB_CONFIG environment variable, when it exists) and then by the DM_EQ_DB_<NAME>
+    environment variables. Raises a ValueError naming the settings that are given by none of them."""
+    settings = dict(DEFAULT_SETTINGS)
+    config_file = config_file or os.environ.get(ENV_PREFIX + 'CONFIG', DEFAULT_CONFIG_FILE)
+    if os.path.exists(config_file):
+        with open(config_file) as file:
+            settings.update(json.load(file))
+        logger.info(f'database settings loaded from {config_file}')
+    for name in SETTING_NAMES:
+        if ENV_PREFIX + name.upper() in os.environ:
+            settings[name] = os.environ[ENV_PREFIX + name.upper()]
+    missing = [name for name in REQUIRED_SETTINGS if name not in settings]
+    if missing:
+        raise ValueError(f'missing database settings {", ".join(missing)}: write them in {config_file} or set '
+                         f'{", ".join(ENV_PREFIX + name.upper() for name in missing)}')
+    settings['port'] = int(settings['port'])
+    return settings
+
+
+def mysql_connect(settings):
+    """ opens a pymysql connection with the given settings, the rows are returned as dictionaries"""
+    import pymysql
+    return pymysql.connect(cursorclass=pymysql.cursors.DictCursor, **settings)
+
+
+def is_alive(connection):
+    """ returns True if the connection still works. pymysql connections are pinged, the others (ex: sqlite3) run a
+    trivial query."""
+    try:
+        if hasattr(connection, 'ping'):
+            connection.ping(reconnect=False)
+        else:
+            connection.execute('select 1')
+        return True
+    except Exception:
+        return False
+
+
+def is_retryable(error):
+    """ returns True if the error is a deadlock or a lock wait timeout of MySQL"""
+    return bool(error.args) and error.args[0] in RETRYABLE_ERRORS
+
+
+class ConnectionPool:
+    """ This class is a pool of at most size connections to the database. connect is a function without arguments that
+    opens a new connection, by default a pymysql connection with the settings of load_settings (settings can be given
+    instead). A connection is checked when it is taken from the pool (when ping is True) and replaced if it was
+    dropped. Use it with: with pool.connection() as connection: ..."""
+    def __init__(self, connect=None, size=DEFAULT_POOL_SIZE, settings=None, ping=True):
+        if size < 1:
+            raise ValueError(f'the pool size must be at least 1, got {size}')
+        self.size = size
+        self.ping = ping
+        self._connect = connect or partial(mysql_connect, settings or load_settings())
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._closed = False
+        self.created = 0
+        self.reconnects = 0
+        self.checkouts = 0
+
+    def _open(self):
+        connection = self._connect()
+        with self._lock:
+            self._connections.add(connection)
+            self.created += 1
+        return connection
+
+    def _discard(self, connection):
+        with self._lock:
+            self._connections.discard(connection)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def acquire(self, timeout=None):
+        """ takes a connection from the pool, waits at most timeout seconds (forever by default) when all the
+        connections are used. Raises TimeoutError if none was released in time."""
+        if self._closed:
+            raise RuntimeError('the connection pool is closed')
+        if not self._slots.acquire(timeout=timeout if timeout is not None else -1):
+            raise TimeoutError(f'no database connection released in {timeout} seconds')
+        try:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self._open()
+            else:
+                if self.ping and not is_alive(connection):
+                    logger.warning('database connection dropped, reconnecting')
+                    self._discard(connection)
+                    connection = self._open()
+                    with self._lock:
+                        self.reconnects += 1
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.checkouts += 1
+        return connection
+
+    def release(self, connection, broken=False):
+        """ gives the connection back to the pool, a broken connection is closed and reopened at the next checkout"""
+        if broken or self._closed:
+            self._discard(connection)
+        else:
+            self._idle.put(connection)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """ context manager that takes a connection from the pool and gives it back at the end"""
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        except Exception:
+            self.release(connection, broken=not is_alive(connection))
+            raise
+        self.release(connection)
+
+    def stats(self):
+        """ returns the number of connections opened, reopened after being dropped and taken from the pool"""
+        with self._lock:
+            return {'size': self.size, 'open': len(self._connections), 'created': self.created,
+                    'reconnects': self.reconnects, 'checkouts': self.checkouts}
+
+    def close(self):
+        """ closes all the connections of the pool, the ones in use are closed when they are released"""
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        logger.info(f'database connection pool closed: {self.stats()}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class WriterPool:
+    """ This class applies independent batches to the database in parallel: write(batch, connection) is run by workers
+    threads (the size of the pool by default), each with its own connection of the pool. write must commit or roll
+    back its own transactions, a batch rolled back because of a deadlock or a lock wait timeout is written again up to
+    retries times. on_written(batch) is called by the worker thread after each batch written, once it is committed."""
+    def __init__(self, pool, write, workers=None, retries=DEFAULT_WRITE_RETRIES, on_written=None):
+        self.pool = pool
+        self.write = write
+        self.workers = min(workers or pool.size, pool.size)
+        self.retries = retries
+        self.on_written = on_written
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='db-writer')
+
+    def _apply(self, batch):
+        for attempt in range(self.retries + 1):
+            with self.pool.connection() as connection:
+                try:
+                    result = self.write(batch, connection)
+                    break
+                except Exception as error:
+                    if attempt == self.retries or not is_retryable(error):
+                        raise
+                    logger.warning(f'batch rolled back ({error}), writing it again')
+        if self.on_written:
+            self.on_written(batch)
+        return result
+
+    def submit(self, batch):
+        """ schedules the writing of one batch, returns its future"""
+        return self._executor.submit(self._apply, batch)
+
+    def map(self, batches):
+        """ writes all the batches and returns the results of write in the order of the batches. The first error is
+        raised once all the batches are done."""
+        futures = [self.submit(batch) for batch in batches]
+        wait(futures)
+        return [future.result() for future in futures]
+
+    def close(self, wait=True):
+        """ stops the workers, after the scheduled batches are written when wait is True"""
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -17,19 +17,40 @@ CREATE TABLE IF NOT EXISTS earthquakes(id INT AUTO_INCREMENT PRIMARY KEY,
                                                          felt INT,
                                                          primary_data_source VARCHAR(255),
                                                          nearest_volcano VARCHAR(255),
-                                                         estimated_seismic_energy VARCHAR(255)
+                                                         estimated_seismic_energy VARCHAR(255),
+                                                         epicenter POINT SRID 4326 GENERATED ALWAYS AS
+                                                             (ST_SRID(POINT(IFNULL(epicenter_longitude, 0),
+                                                                            IFNULL(epicenter_latitude, 0)), 4326))
+                                                             STORED NOT NULL,
+                                                         UNIQUE KEY uq_earthquakes_link_id (link_id),
+                                                         SPATIAL INDEX sx_earthquakes_epicenter (epicenter)
                                                          );
 
+-- the bulk writer (uptade_database.upsert_earthquakes) relies on this unique key, on a database created before it
+-- was added run: ALTER TABLE earthquakes ADD UNIQUE KEY uq_earthquakes_link_id (link_id);
+-- the epicenter POINT (MySQL 8) and its SPATIAL INDEX serve the radius queries of spatial_index.radius_query, the
+-- earthquakes without coordinates are stored at (0, 0) and filtered by the queries. On an older database run:
+-- ALTER TABLE earthquakes ADD COLUMN epicenter POINT SRID 4326 GENERATED ALWAYS AS
+--     (ST_SRID(POINT(IFNULL(epicenter_longitude, 0), IFNULL(epicenter_latitude, 0)), 4326)) STORED NOT NULL,
+--     ADD SPATIAL INDEX sx_earthquakes_epicenter (epicenter);
+
 CREATE TABLE IF NOT EXISTS eq_cities( id INT AUTO_INCREMENT PRIMARY KEY ,
                                                         eq_id INT,
                                                         city_id INT, 
-                                                        distance float
+                                                        distance float,
+                                                        UNIQUE KEY uq_eq_cities_eq_city (eq_id, city_id)
                                                         );
 
 CREATE TABLE IF NOT EXISTS cities( id INT AUTO_INCREMENT PRIMARY KEY ,
                                                     city_name VARCHAR(255),
-                                                    population INT
+                                                    population INT,
+                                                    UNIQUE KEY uq_cities_city_name (city_name)
                                                      );
+
+-- the batched city linking (uptade_database.link_cities) relies on these unique keys, on a database created before
+-- they were added run:
+-- ALTER TABLE cities ADD UNIQUE KEY uq_cities_city_name (city_name);
+-- ALTER TABLE eq_cities ADD UNIQUE KEY uq_eq_cities_eq_city (eq_id, city_id);
                                                      
 
 CREATE TABLE IF NOT EXISTS fire(id INT AUTO_INCREMENT PRIMARY KEY ,
@@ -37,7 +58,8 @@ CREATE TABLE IF NOT EXISTS fire(id INT AUTO_INCREMENT PRIMARY KEY ,
                                                     fire_name VARCHAR(255),
                                                     latitude FLOAT,
                                                     longitude FLOAT,
-                                                    date_time DATE
+                                                    date_time DATE,
+                                                    UNIQUE KEY uq_fire_eonet_id (eonet_id)
                                                     );
 
 CREATE TABLE IF NOT EXISTS iceberg(id INT AUTO_INCREMENT PRIMARY KEY,
@@ -45,7 +67,8 @@ CREATE TABLE IF NOT EXISTS iceberg(id INT AUTO_INCREMENT PRIMARY KEY,
                                                     iceberg_name VARCHAR(255),
                                                     magnitude_value FLOAT,
                                                     magnitude_unit VARCHAR(255),
-                                                    date_time DATE
+                                                    date_time DATE,
+                                                    UNIQUE KEY uq_iceberg_eonet_id (eonet_id)
                                                     );
 
 CREATE TABLE IF NOT EXISTS volcano( id INT AUTO_INCREMENT PRIMARY KEY ,
@@ -53,5 +76,21 @@ CREATE TABLE IF NOT EXISTS volcano( id INT AUTO_INCREMENT PRIMARY KEY ,
                                                     volcano_name VARCHAR(255),
                                                     latitude FLOAT,
                                                     longitude FLOAT,
-                                                    date_time DATE
-                                                    );
\ No newline at end of file
+                                                    date_time DATE,
+                                                    UNIQUE KEY uq_volcano_eonet_id (eonet_id)
+                                                    );
+
+CREATE TABLE IF NOT EXISTS eq_hazard_links( id INT AUTO_INCREMENT PRIMARY KEY ,
+                                                    link_id INT,
+                                                    hazard_table VARCHAR(16),
+                                                    eonet_id INT,
+                                                    distance_km FLOAT,
+                                                    days_apart FLOAT,
+                                                    UNIQUE KEY uq_eq_hazard_links (link_id, hazard_table, eonet_id)
+                                                    );
+
+-- the bulk writer of the natural events (uptade_database.upsert_events) relies on the unique keys on eonet_id, on a
+-- database created before they were added run:
+-- ALTER TABLE fire ADD UNIQUE KEY uq_fire_eonet_id (eonet_id);
+-- ALTER TABLE iceberg ADD UNIQUE KEY uq_iceberg_eonet_id (eonet_id);
+-- ALTER TABLE volcano ADD UNIQUE KEY uq_volcano_eonet_id (eonet_id);
@@ -0,0 +1,71 @@
+import itertools
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+### this file stores the helpers used to download many pages concurrently. The work is done by a bounded pool of
+### threads, the requests sent to each host are rate limited and the results always come back in input order.
+
+class HostRateLimiter:
+    """ This class limits the number of requests sent to each host to `rate` requests per second. It is shared between
+    all the worker threads, every host gets its own schedule. When rate is None there is no limit."""
+    def __init__(self, rate=None):
+        if rate is not None and rate <= 0:
+            raise ValueError(f'rate must be positive, got {rate}')
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, url):
+        """ Blocks the calling thread until a request to the host of url is allowed."""
+        if not self.rate:
+            return
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + 1 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def imap_ordered(func, urls, workers=1, rate=None, window=None):
+    """ Calls func on every url with at most `workers` calls running at the same time and yields the results in the
+    order of the input urls. At most `window` calls are submitted ahead of the consumer (2 * workers by default), so
+    a slow consumer slows down the downloads instead of filling the memory. Closing the generator cancels the calls
+    that did not start yet."""
+    limiter = HostRateLimiter(rate)
+
+    def task(url):
+        limiter.wait(url)
+        return func(url)
+
+    urls = iter(urls)
+    if workers <= 1:
+        for url in urls:
+            yield task(url)
+        return
+
+    window = window or 2 * workers
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque(executor.submit(task, url) for url in itertools.islice(urls, window))
+        try:
+            while pending:
+                result = pending.popleft().result()
+                for url in itertools.islice(urls, 1):
+                    pending.append(executor.submit(task, url))
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def fetch_in_order(func, urls, workers=1, rate=None):
+    """ Returns the list of func(url) for every url, computed by a pool of `workers` threads. See imap_ordered."""
+    return list(imap_ordered(func, urls, workers=workers, rate=rate))
@@ -0,0 +1,192 @@
+import argparse
+import math
+import logging
+import numpy as np
+import pandas as pd
+import db_pool
+import storage
+import uptade_database
+from spatial_index import EARTH_RADIUS_KM
+
+logger = logging.getLogger(__name__)
+
+### this file stores the proximity join between the earthquakes and the natural events of the API: it finds the
+### (earthquake, volcano or fire) pairs closer than a distance and a number of days, and writes them to the
+### eq_hazard_links table. Instead of comparing every pair, the earthquakes are read in chunks in date order (the stored
+### table is never loaded at once). For each chunk only the events of its time window are kept, and they are bucketed
+### in a 3d grid of points on the unit sphere (no special case at the poles or the date line). Each earthquake is then
+### compared with the events of its cell and of the 26 cells around it. The iceberg table has no coordinates, so it
+### can not be joined.
+
+HAZARD_TABLES = ('volcano', 'fire')
+DEFAULT_DISTANCE_KM = 100
+DEFAULT_DAYS = 7
+DEFAULT_CHUNK_SIZE = 100000  # earthquakes read and joined at a time
+LINK_COLUMNS = list(uptade_database.HAZARD_LINK_COLUMNS)
+NEIGHBOURS = np.array([(x, y, z) for x in (-1, 0, 1) for y in (-1, 0, 1) for z in (-1, 0, 1)])
+SECONDS_PER_DAY = 24 * 3600
+
+
+def to_days(dates):
+    """ returns the dates (text, date or datetime) as float days since 1970, NaN when they can not be read"""
+    times = pd.to_datetime(pd.Series(dates, dtype=object), errors='coerce')
+    return times.astype('int64').to_numpy() / 1e9 / SECONDS_PER_DAY * np.where(times.isna(), np.nan, 1)
+
+
+def unit_vectors(lats, lons):
+    """ returns the (n, 3) array of the points of the unit sphere at the latitudes and longitudes, in degrees"""
+    lats, lons = np.radians(np.asarray(lats, dtype=float)), np.radians(np.asarray(lons, dtype=float))
+    return np.column_stack([np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)])
+
+
+def chord(distance_km):
+    """ returns the straight line distance on the unit sphere between two points distance_km apart on the earth"""
+    return 2 * math.sin(min(distance_km / EARTH_RADIUS_KM, math.pi) / 2)
+
+
+def cell_keys(cells, size):
+    """ returns one integer per row of the (n, 3) array of cells (each coordinate from 0 to size - 1)"""
+    return (cells[:, 0] * size + cells[:, 1]) * size + cells[:, 2]
+
+
+class Hazards:
+    """ the events of one table with coordinates, sorted by date: eonet ids, days (see to_days) and unit vectors"""
+    def __init__(self, table, df):
+        df = df.dropna(subset=['latitude', 'longitude'])
+        days = to_days(df['date_time'])
+        order = np.argsort(days, kind='stable')
+        keep = order[~np.isnan(days[order])]
+        self.table = table
+        self.ids = df['eonet_id'].to_numpy()[keep].astype(np.int64)
+        self.days = days[keep]
+        self.points = unit_vectors(df['latitude'].to_numpy()[keep], df['longitude'].to_numpy()[keep])
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def join_chunk(quakes, hazards, distance_km=DEFAULT_DISTANCE_KM, days=DEFAULT_DAYS):
+    """ returns the dataframe (LINK_COLUMNS) of the pairs of an earthquake of quakes (link_id, date_time,
+    epicenter_latitude, epicenter_longitude) and an event of hazards at most distance_km and days apart"""
+    quakes = quakes.dropna(subset=['epicenter_latitude', 'epicenter_longitude'])
+    quake_days = to_days(quakes['date_time'])
+    valid = ~np.isnan(quake_days)
+    empty = pd.DataFrame(columns=LINK_COLUMNS)
+    if not valid.any() or not len(hazards):
+        return empty
+    quake_ids, quake_days = quakes['link_id'].to_numpy()[valid].astype(np.int64), quake_days[valid]
+    quake_points = unit_vectors(quakes['epicenter_latitude'].to_numpy()[valid],
+                                quakes['epicenter_longitude'].to_numpy()[valid])
+
+    # the events of the time window of the chunk
+    first = np.searchsorted(hazards.days, quake_days.min() - days, side='left')
+    last = np.searchsorted(hazards.days, quake_days.max() + days, side='right')
+    if first == last:
+        return empty
+    event_points = hazards.points[first:last]
+
+    # two points closer than the cell size are in the same cell or in two cells next to each other
+    cell = max(chord(distance_km), 1e-6)
+    size = int(2 / cell) + 3
+    event_cells = np.floor((event_points + 1) / cell).astype(np.int64) + 1
+    expanded = cell_keys((event_cells[:, None, :] + NEIGHBOURS[None, :, :]).reshape(-1, 3), size)
+    expanded_events = np.repeat(np.arange(last - first), len(NEIGHBOURS))
+    order = np.argsort(expanded, kind='stable')
+    expanded, expanded_events = expanded[order], expanded_events[order]
+    quake_keys = cell_keys(np.floor((quake_points + 1) / cell).astype(np.int64) + 1, size)
+    starts = np.searchsorted(expanded, quake_keys, side='left')
+    counts = np.searchsorted(expanded, quake_keys, side='right') - starts
+    if not counts.sum():
+        return empty
+    pair_quakes = np.repeat(np.arange(len(quake_keys)), counts)
+    pair_events = expanded_events[np.arange(counts.sum()) + np.repeat(starts - np.cumsum(counts) + counts, counts)]
+
+    apart = quake_days[pair_quakes] - hazards.days[first:last][pair_events]
+    chords = np.linalg.norm(quake_points[pair_quakes] - event_points[pair_events], axis=1)
+    distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chords / 2, 1.0))
+    close = (np.abs(apart) <= days) & (distances <= distance_km)
+    return pd.DataFrame({'link_id': quake_ids[pair_quakes[close]], 'hazard_table': hazards.table,
+                         'eonet_id': hazards.ids[first:last][pair_events[close]],
+                         'distance_km': distances[close].round(3), 'days_apart': apart[close].round(4)},
+                        columns=LINK_COLUMNS)
+
+
+def read_events(backend, table):
+    """ returns the dataframe (eonet_id, date_time, latitude, longitude) of the events of table of a storage backend"""
+    if backend.name == 'parquet':
+        df = backend.read_table(table)
+        return df.reindex(columns=['eonet_id', 'date_time', 'latitude', 'longitude'])
+    query = f'SELECT eonet_id, date_time, latitude, longitude FROM {table} WHERE latitude IS NOT NULL'
+    if backend.name == 'sqlite':
+        return pd.read_sql_query(query, backend.connection)
+    with backend.pool.connection() as connection, connection.cursor() as cursor:
+        cursor.execute(query)
+        return pd.DataFrame(cursor.fetchall(), columns=['eonet_id', 'date_time', 'latitude', 'longitude'])
+
+
+def read_quakes(backend, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ yields the earthquakes with coordinates of a storage backend in date order, as dataframes (link_id, date_time,
+    epicenter_latitude, epicenter_longitude) of chunk_size rows. The databases are read one page at a time, after the
+    last (date_time, link_id) of the previous page. The parquet backend reads its table at once."""
+    columns = ['link_id', 'date_time', 'epicenter_latitude', 'epicenter_longitude']
+    if backend.name == 'parquet':
+        df = backend.read_table('earthquakes')
+        if not len(df):
+            return
+        df = df.reindex(columns=columns).dropna(subset=columns[1:]).sort_values(['date_time', 'link_id'])
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size]
+        return
+    mark = '?' if backend.name == 'sqlite' else '%s'
+    query = (f"SELECT {', '.join(columns)} FROM earthquakes WHERE date_time IS NOT NULL AND "
+             f"epicenter_latitude IS NOT NULL AND epicenter_longitude IS NOT NULL {{after}} "
+             f"ORDER BY date_time, link_id LIMIT {int(chunk_size)}")
+    last = None
+    while True:
+        after = f'AND (date_time, link_id) > ({mark}, {mark})' if last else ''
+        if backend.name == 'sqlite':
+            rows = backend.connection.execute(query.format(after=after), last or ()).fetchall()
+        else:
+            with backend.pool.connection() as connection, connection.cursor() as cursor:
+                cursor.execute(query.format(after=after), last)
+                rows = [tuple(row[column] for column in columns) for row in cursor.fetchall()]
+        if not rows:
+            return
+        yield pd.DataFrame(rows, columns=columns)
+        last = (rows[-1][1], rows[-1][0])
+
+
+def join_storage(backend, tables=HAZARD_TABLES, distance_km=DEFAULT_DISTANCE_KM, days=DEFAULT_DAYS,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+    """ joins the earthquakes stored in a backend (see storage) with the events of tables, and writes the pairs to its
+    eq_hazard_links table after each chunk of earthquakes. Returns the number of pairs written."""
+    hazards = [Hazards(table, read_events(backend, table)) for table in tables]
+    logger.info(f'join the earthquakes with {", ".join(f"{len(h)} {h.table}" for h in hazards)} events, '
+                f'within {distance_km} km and {days} days')
+    written = 0
+    for quakes in read_quakes(backend, chunk_size):
+        links = pd.concat([join_chunk(quakes, events, distance_km, days) for events in hazards], ignore_index=True)
+        if len(links):
+            written += backend.write_hazard_links(links)
+    logger.info(f'wrote {written} earthquake and hazard pairs')
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='link the stored earthquakes to the volcano and fire events near them')
+    parser.add_argument('--backend', choices=storage.BACKENDS, default=storage.DEFAULT_BACKEND)
+    parser.add_argument('--storage_path', help='sqlite file or parquet folder')
+    parser.add_argument('--db_config', help='json file of the database settings (see db_pool)')
+    parser.add_argument('--distance_km', type=float, default=DEFAULT_DISTANCE_KM)
+    parser.add_argument('--days', type=float, default=DEFAULT_DAYS)
+    parser.add_argument('--tables', nargs='+', choices=HAZARD_TABLES, default=list(HAZARD_TABLES))
+    parser.add_argument('--chunk_size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+    pool = db_pool.ConnectionPool(settings=db_pool.load_settings(args.db_config)) if args.backend == 'mysql' else None
+    with storage.make_storage(args.backend, args.storage_path, pool=pool) as backend:
+        written = join_storage(backend, args.tables, args.distance_km, args.days, args.chunk_size)
+    print(f'{written} earthquake and hazard pairs written')
+
+
+if __name__ == '__main__':
+    main()
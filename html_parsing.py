@@ -0,0 +1,114 @@
+import re
+import logging
+import pandas as pd
+import lxml.html
+from bs4 import BeautifulSoup, SoupStrainer
+import metrics
+
+logger = logging.getLogger(__name__)
+
+### this file stores the parsers of the html pages of the website. There are three backends:
+### - html.parser: BeautifulSoup with the pure python html.parser, and pd.read_html for the detailed pages
+### - lxml: BeautifulSoup with the lxml parser, and pd.read_html for the detailed pages
+### - targeted: lxml parsing only the tags the scraper needs (the rows of earthquakes and the "show more" script) and a
+###   direct extraction of the fields of the first table of the detailed pages, without building a dataframe
+
+BACKENDS = ('html.parser', 'lxml', 'targeted')
+DEFAULT_BACKEND = 'html.parser'
+QUAKE_ROW_CLASS = re.compile(r'q\d')
+WHITESPACE = re.compile(r'[\r\n]+|\s{2,}')  # the whitespace pd.read_html replaces by a single space
+NA_VALUES = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>', 'N/A',
+             'NA', 'NULL', 'NaN', 'n/a', 'nan', 'null', 'None'}  # the cells pd.read_html reads as NaN
+
+_backend = DEFAULT_BACKEND
+
+
+def quake_page_tags(name, attrs):
+    """ returns True for the tags of a main page the scraper uses: the rows of earthquakes (tr with a class q0 to q9)
+    and the div table-wrap that holds the script with the "show more" url"""
+    classes = attrs.get('class') or ''
+    if isinstance(classes, str):
+        classes = classes.split()
+    if name == 'tr':
+        return any(QUAKE_ROW_CLASS.match(css_class) for css_class in classes)
+    return name == 'div' and 'table-wrap' in classes
+
+
+QUAKE_PAGE_STRAINER = SoupStrainer(quake_page_tags)
+
+
+def set_backend(backend):
+    """ selects the backend used by make_soup and detail_record"""
+    global _backend
+    if backend not in BACKENDS:
+        raise ValueError(f'unknown html parser {backend}, expected one of {BACKENDS}')
+    _backend = backend
+    logger.info(f'parse html pages with the {backend} backend')
+
+
+def get_backend():
+    return _backend
+
+
+def make_soup(content, backend=None):
+    """ returns the beautiful soup of a main page or a "show more" page with the selected backend. The targeted
+    backend only keeps the rows of earthquakes and the div table-wrap."""
+    backend = backend or _backend
+    with metrics.timer('parse_seconds', page='main', parser=backend):
+        if backend == 'html.parser':
+            return BeautifulSoup(content, 'html.parser')
+        if backend == 'lxml':
+            return BeautifulSoup(content, 'lxml')
+        return BeautifulSoup(content, 'lxml', parse_only=QUAKE_PAGE_STRAINER)
+
+
+def detail_record_read_html(html):
+    """ parses the first table of a detailed page with pd.read_html. The table holds the name of each field in its
+    first column and the value in its second column, it returns them as a dictionary {field: value}."""
+    dfs = pd.read_html(html)  # this creates dataframe directly from the table in h
+    # df[0] this is the table that we need.
+    table = dfs[0]
+    return dict(zip(table.iloc[:, 0], table.iloc[:, 1]))
+
+
+def cell_text(cell):
+    """ returns the text of a cell like pd.read_html reads it: whitespace collapsed and NaN for the empty cells"""
+    text = WHITESPACE.sub(' ', cell.text_content().strip())
+    return float('nan') if text in NA_VALUES else text
+
+
+def first_table(tree):
+    """ returns the first table of the page with some text, that is not hidden, or None"""
+    for table in tree.iter('table'):
+        if 'display:none' in table.get('style', '').replace(' ', ''):
+            continue
+        if table.text_content().strip():
+            return table
+    return None
+
+
+def detail_record_lxml(html):
+    """ extracts the {field: value} dictionary of the first table of a detailed page directly with lxml, like
+    detail_record_read_html but without building dataframes. The rows with less than two cells are skipped."""
+    tree = lxml.html.fromstring(html)
+    table = first_table(tree)
+    if table is None:
+        raise ValueError('No tables found')
+    for element in table.xpath('.//*[@style]'):
+        if 'display:none' in element.get('style', '').replace(' ', ''):
+            element.getparent().remove(element)
+    record = {}
+    for row in table.iter('tr'):
+        cells = row.xpath('./td|./th')
+        if len(cells) >= 2:
+            record[cell_text(cells[0])] = cell_text(cells[1])
+    return record
+
+
+def detail_record(html, backend=None):
+    """ returns the {field: value} dictionary of a detailed page with the selected backend"""
+    backend = backend or _backend
+    with metrics.timer('parse_seconds', page='detail', parser=backend):
+        if backend == 'targeted':
+            return detail_record_lxml(html)
+        return detail_record_read_html(html)
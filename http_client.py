@@ -0,0 +1,143 @@
+import threading
+import time
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import metrics
+from response_cache import url_class
+
+logger = logging.getLogger(__name__)
+
+### this file stores the http client shared by all the fetchers of the project (website pages and API).
+### It keeps a pool of keep-alive connections per host, negotiates compressed responses, sets timeouts and retries
+### the requests that fail with 429 or 5xx with an exponential backoff. An error status left once the retries are
+### spent raises requests.HTTPError, the callers never get an error page as if it was the page they asked for.
+
+DEFAULT_TIMEOUT = (5, 30)  # seconds to connect, seconds to read
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5  # the retries wait 0.5s, 1s, 2s, ...
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+USER_AGENT = 'DM_EQ-scraper'
+
+
+def accept_encoding():
+    """ returns the compressions the client can decode. brotli is only asked for when a brotli module is installed,
+    urllib3 can not decode it otherwise"""
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        try:
+            import brotlicffi  # noqa: F401
+        except ImportError:
+            return 'gzip, deflate'
+    return 'gzip, deflate, br'
+
+
+class HttpClient:
+    """ This class wraps a requests session configured with connection pooling, keep-alive, compression, timeouts
+    and retries. It is safe to share it between the threads of the fetcher."""
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff_factor=DEFAULT_BACKOFF):
+        self.timeout = timeout
+        retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=frozenset(['GET', 'HEAD']), respect_retry_after_header=True,
+                      raise_on_status=False)
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        self.session.headers.update({'User-Agent': USER_AGENT,
+                                     'Accept-Encoding': accept_encoding(),
+                                     'Connection': 'keep-alive'})
+
+    def get(self, url, **kwargs):
+        """ sends a GET request through the pool, with the default timeout unless another one is given. When the
+        metrics are enabled it records the latency, status and size of the response by class of url (see
+        response_cache.url_class). This is the only place the requests reach the network, the responses replayed by
+        the response cache are counted by the cache (http_cache_total). A 4xx or 5xx status (after the retries of
+        RETRY_STATUSES) raises requests.HTTPError."""
+        kwargs.setdefault('timeout', self.timeout)
+        if not metrics.enabled():
+            response = self.session.get(url, **kwargs)
+            response.raise_for_status()
+            return response
+        kind = url_class(url)
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, **kwargs)
+        except Exception:
+            metrics.inc('http_errors_total', url_class=kind)
+            raise
+        metrics.observe('http_request_seconds', time.perf_counter() - start, url_class=kind)
+        metrics.inc('http_requests_total', url_class=kind, status=response.status_code)
+        metrics.inc('http_response_bytes_total', len(response.content), url_class=kind)
+        response.raise_for_status()
+        return response
+
+    def stats(self):
+        """ returns for each host the number of requests sent, of connections opened and of requests that reused an
+        open connection. Hosts whose pool was evicted (more hosts than pool_size) are not counted anymore."""
+        pools = self.adapter.poolmanager.pools
+        stats = {}
+        for key in pools.keys():
+            pool = pools[key]
+            host = stats.setdefault(pool.host, {'requests': 0, 'connections': 0, 'reused': 0})
+            host['requests'] += pool.num_requests
+            host['connections'] += pool.num_connections
+            host['reused'] += pool.num_requests - pool.num_connections
+        return stats
+
+    def close(self):
+        """ closes all the connections of the pool"""
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+_cache = None
+
+
+def configure(**settings):
+    """ replaces the shared client by a new one built with the given settings (see HttpClient)"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = HttpClient(**settings)
+        logger.info(f'configured http client with {settings}')
+    return _client
+
+
+def get_client():
+    """ returns the shared client, it is created with the default settings on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def enable_cache(cache):
+    """ makes get go through the given response cache (a response_cache.ResponseCache), None disables it"""
+    global _cache
+    _cache = cache
+
+
+def get(url, **kwargs):
+    """ sends a GET request with the shared client, through the response cache when one is enabled. The requests sent
+    to the network are recorded in the metrics by HttpClient.get."""
+    if _cache is not None:
+        return _cache.get(get_client(), url, **kwargs)
+    return get_client().get(url, **kwargs)
+
+
+def connection_stats():
+    """ returns the connection reuse counters of the shared client, see HttpClient.stats"""
+    return get_client().stats()
+
+
+def cache_stats():
+    """ returns the counters of the response cache, or None when there is no cache"""
+    return _cache.stats() if _cache is not None else None
@@ -0,0 +1,147 @@
+import json
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+### this file stores the journal of the resumable runs of the scraper (--resume). A run is a job identified by its
+### arguments (dates, magnitude, n_rows). The journal records the archive days already crawled with the earthquakes
+### they listed, the detailed records already downloaded and the earthquakes already committed to the database, in a
+### sqlite file. When a job is killed, the next --resume run with the same arguments reuses all of it: the days and
+### the detailed pages are not downloaded again and the committed earthquakes are not written again. Each day and each
+### earthquake is a separate unit of work, recording it twice is harmless.
+
+DEFAULT_JOURNAL_FILE = 'scraper_journal.sqlite'
+DEFAULT_CHECKPOINT_EVERY = 100  # detailed records written to the journal between two commits of the journal
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs(id INTEGER PRIMARY KEY AUTOINCREMENT, params TEXT, started REAL, finished REAL);
+CREATE TABLE IF NOT EXISTS days(job_id INTEGER, url TEXT, ids TEXT, n_listed INTEGER, done_at REAL,
+                                PRIMARY KEY (job_id, url));
+CREATE TABLE IF NOT EXISTS quakes(job_id INTEGER, url TEXT, eq_id TEXT, record TEXT, fetched_at REAL,
+                                  committed_at REAL, PRIMARY KEY (job_id, url));
+CREATE INDEX IF NOT EXISTS quakes_eq_id ON quakes(job_id, eq_id);
+"""
+
+
+def job_params(args):
+    """ returns the arguments that identify a job: two runs with the same dates, magnitude range and number of rows
+    do the same work"""
+    dates = [day.strftime('%Y-%m-%d') for day in args.date] if args.date else None
+    magnitude = list(args.magnitude) if args.magnitude else None
+    return json.dumps({'date': dates, 'magnitude': magnitude, 'n_rows': args.n_rows}, sort_keys=True)
+
+
+class Journal:
+    """ This class is the journal of one job, see the top of the file. The days and the committed batches are written
+    to the file at once, the detailed records every checkpoint_every records (a crash loses at most the last ones,
+    they are downloaded again). It can be used by the threads of the fetcher."""
+    def __init__(self, path=DEFAULT_JOURNAL_FILE, params='{}', checkpoint_every=DEFAULT_CHECKPOINT_EVERY):
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(SCHEMA)
+        job = self._db.execute('SELECT id FROM jobs WHERE params = ? AND finished IS NULL ORDER BY id DESC LIMIT 1',
+                               (params,)).fetchone()
+        self.resumed = job is not None
+        if job:
+            self.job_id = job[0]
+        else:
+            self.job_id = self._db.execute('INSERT INTO jobs (params, started) VALUES (?, ?)',
+                                           (params, time.time())).lastrowid
+        self._db.commit()
+        logger.info(f'{"resume" if self.resumed else "start"} job {self.job_id} in journal {path}: {self.stats()}')
+
+    def get_day(self, url):
+        """ returns the ({earthquake id: url}, number of earthquakes listed) recorded for an archive day, or None if
+        the day was not crawled yet"""
+        with self._lock:
+            day = self._db.execute('SELECT ids, n_listed FROM days WHERE job_id = ? AND url = ?',
+                                   (self.job_id, url)).fetchone()
+        return (json.loads(day[0]), day[1]) if day else None
+
+    def record_day(self, url, id_to_url, n_listed):
+        """ records that an archive day was crawled, with its earthquakes"""
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO days VALUES (?, ?, ?, ?, ?)',
+                             (self.job_id, url, json.dumps(id_to_url), n_listed, time.time()))
+            self._db.commit()
+
+    def get_record(self, url):
+        """ returns the detailed record of the earthquake of url if it was already downloaded, None otherwise"""
+        with self._lock:
+            record = self._db.execute('SELECT record FROM quakes WHERE job_id = ? AND url = ? AND record IS NOT NULL',
+                                      (self.job_id, url)).fetchone()
+        return json.loads(record[0]) if record else None
+
+    def record_fetch(self, url, record):
+        """ records the detailed record downloaded from url, the journal is committed every checkpoint_every
+        records"""
+        with self._lock:
+            self._db.execute("""INSERT INTO quakes (job_id, url, record, fetched_at) VALUES (?, ?, ?, ?)
+                                ON CONFLICT(job_id, url) DO UPDATE SET record = excluded.record,
+                                fetched_at = excluded.fetched_at""",
+                             (self.job_id, url, json.dumps(record), time.time()))
+            self._pending += 1
+            if self._pending >= self.checkpoint_every:
+                self._db.commit()
+                self._pending = 0
+
+    def fetcher(self, fetch):
+        """ returns a function url -> record that returns the record of the journal when there is one, and otherwise
+        downloads it with fetch and records it"""
+        def journaled_fetch(url):
+            record = self.get_record(url)
+            if record is None:
+                record = fetch(url)
+                self.record_fetch(url, record)
+            return record
+        return journaled_fetch
+
+    def committed_ids(self):
+        """ returns the set of the ids of the earthquakes already committed to the database by this job"""
+        with self._lock:
+            return {row[0] for row in self._db.execute(
+                'SELECT eq_id FROM quakes WHERE job_id = ? AND committed_at IS NOT NULL', (self.job_id,))}
+
+    def record_batch(self, eq_ids, urls):
+        """ records that the earthquakes eq_ids (downloaded from urls) were committed to the database, and commits the
+        journal. The detailed records are not needed anymore and are dropped."""
+        now = time.time()
+        with self._lock:
+            self._db.executemany("""INSERT INTO quakes (job_id, url, eq_id, committed_at) VALUES (?, ?, ?, ?)
+                                    ON CONFLICT(job_id, url) DO UPDATE SET eq_id = excluded.eq_id, record = NULL,
+                                    committed_at = excluded.committed_at""",
+                                 [(self.job_id, url, eq_id, now) for eq_id, url in zip(eq_ids, urls)])
+            self._db.commit()
+            self._pending = 0
+
+    def checkpoint(self):
+        """ commits the records written since the last commit"""
+        with self._lock:
+            self._db.commit()
+            self._pending = 0
+
+    def finish(self):
+        """ marks the job as done, the next --resume run with the same arguments starts a new job"""
+        with self._lock:
+            self._db.execute('UPDATE jobs SET finished = ? WHERE id = ?', (time.time(), self.job_id))
+            self._db.commit()
+        logger.info(f'job {self.job_id} finished: {self.stats()}')
+
+    def stats(self):
+        """ returns the number of days crawled, detailed records downloaded and earthquakes committed by the job"""
+        with self._lock:
+            days = self._db.execute('SELECT COUNT(*) FROM days WHERE job_id = ?', (self.job_id,)).fetchone()[0]
+            fetched, committed = self._db.execute(
+                'SELECT COUNT(record), COUNT(committed_at) FROM quakes WHERE job_id = ?', (self.job_id,)).fetchone()
+        return {'days': days, 'fetched': fetched, 'committed': committed}
+
+    def close(self):
+        self.checkpoint()
+        self._db.close()
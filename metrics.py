@@ -0,0 +1,343 @@
+import bisect
+import json
+import os
+import threading
+import time
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+### this file stores the metrics of the scraper: counters, gauges and histograms with labels, recorded by the http
+### client, the cache, the parsers, convert and the database writers. They are off by default and every call is then a
+### no-op. Once enabled (scraper --metrics_out) they are exported at the end of the run as a Prometheus text file or a
+### json summary.
+
+# seconds, for the latency of the requests and the time of parsing and converting
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# number of rows, for the rows written in each commit
+ROW_BUCKETS = (1, 5, 10, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+# bucket of each histogram that does not use TIME_BUCKETS
+BUCKETS = {'db_rows_per_commit': ROW_BUCKETS}
+HELP = {'http_request_seconds': 'latency of the http requests sent to the network by url class',
+        'http_requests_total': 'http requests sent to the network by url class and status code',
+        'http_errors_total': 'http requests that raised an error, by url class',
+        'http_response_bytes_total': 'bytes downloaded by url class, the responses replayed by the cache not included',
+        'http_cache_total': 'lookups of the response cache by result',
+        'parse_seconds': 'time to parse a page by page kind and parser',
+        'convert_column_seconds': 'time to convert each column of the detailed table',
+        'parser_cache_total': 'cells of the detailed table by cached parser and result (hit or miss)',
+        'db_round_trips_total': 'statements sent to the database by kind',
+        'db_commits_total': 'transactions committed by table',
+        'db_rows_per_commit': 'rows written in each transaction by table',
+        'stage_seconds': 'duration of each stage of the run',
+        'run_seconds': 'duration of the run',
+        'daemon_polls_total': 'polls of the daemon mode by task and result',
+        'daemon_poll_seconds': 'duration of each poll of the daemon mode by task',
+        'daemon_last_success_timestamp': 'unix time of the last successful poll of each task of the daemon mode',
+        'daemon_items_written_total': 'new or changed quakes and events written by the daemon mode'}
+
+
+def label_key(labels):
+    """ returns the labels as a sorted tuple, to be used as a dictionary key"""
+    return tuple(sorted(labels.items()))
+
+
+def format_value(value):
+    """ returns a value of a counter or gauge as Prometheus text, the integers without exponent"""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def escape_label(value):
+    """ returns a label value escaped for the Prometheus text format: backslash, double quote and line feed"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(key, extra=()):
+    """ returns the labels of a key in the Prometheus format: {name="value",...}"""
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+
+
+class Histogram:
+    """ counts the observed values in buckets (each bucket counts the values lower or equal to its bound), with their
+    sum, minimum and maximum"""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None or value < self.min else self.min
+        self.max = value if self.max is None or value > self.max else self.max
+
+    def merge(self, other):
+        """ adds the values observed by other (a histogram with the same buckets)"""
+        self.counts = [count + other_count for count, other_count in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        self.min = other.min if self.min is None or (other.min is not None and other.min < self.min) else self.min
+        self.max = other.max if self.max is None or (other.max is not None and other.max > self.max) else self.max
+
+    def quantile(self, q):
+        """ returns an estimate of the quantile q: the bound of the bucket holding it (the maximum for the last
+        bucket)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {'count': self.count, 'sum': round(self.sum, 6),
+                'mean': round(self.sum / self.count, 6) if self.count else None,
+                'min': self.min, 'p50': self.quantile(0.5), 'p95': self.quantile(0.95), 'max': self.max}
+
+
+class Timer:
+    """ context manager that observes the seconds spent in its block in a histogram"""
+    __slots__ = ('registry', 'name', 'labels', 'start')
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+class NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class NullMetrics:
+    """ the metrics when they are disabled: every call does nothing"""
+    enabled = False
+
+    def inc(self, name, value=1, **labels):
+        pass
+
+    def set(self, name, value, **labels):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def timer(self, name, **labels):
+        return NULL_TIMER
+
+    def state(self):
+        return None
+
+    def merge(self, state):
+        pass
+
+
+class Metrics:
+    """ This class records the metrics of a run. The counters (inc) and gauges (set) keep one value per name and labels,
+    the histograms (observe, timer) the distribution of the values. It can be used by several threads."""
+    enabled = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.gauges = {}
+        self.histograms = {}
+        self.started = time.time()
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self.counters[name, label_key(labels)] += value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[name, label_key(labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = name, label_key(labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(BUCKETS.get(name, TIME_BUCKETS))
+            histogram.observe(value)
+
+    def timer(self, name, **labels):
+        return Timer(self, name, labels)
+
+    def state(self):
+        """ returns the counters, gauges and histograms as plain dictionaries, that can be pickled to another process
+        and merged in its registry (see merge)"""
+        with self._lock:
+            return dict(self.counters), dict(self.gauges), dict(self.histograms)
+
+    def merge(self, state):
+        """ adds the counters and histograms of a state (see state) recorded by another registry, its gauges replace
+        the ones of this registry"""
+        if state is None:
+            return
+        counters, gauges, histograms = state
+        with self._lock:
+            for key, value in counters.items():
+                self.counters[key] += value
+            self.gauges.update(gauges)
+            for key, histogram in histograms.items():
+                if key in self.histograms:
+                    self.histograms[key].merge(histogram)
+                else:
+                    self.histograms[key] = histogram
+
+    def to_prometheus(self):
+        """ returns the metrics in the Prometheus text format"""
+        lines = []
+        with self._lock:
+            for kind, values in (('counter', self.counters), ('gauge', self.gauges)):
+                for name in sorted({name for name, _ in values}):
+                    lines.append(f'# HELP {name} {HELP.get(name, name)}')
+                    lines.append(f'# TYPE {name} {kind}')
+                    lines.extend(f'{name}{format_labels(key)} {format_value(value)}'
+                                 for (metric, key), value in sorted(values.items()) if metric == name)
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f'# HELP {name} {HELP.get(name, name)}')
+                lines.append(f'# TYPE {name} histogram')
+                for (metric, key), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{format_labels(key, [("le", bound)])} {cumulative}')
+                    lines.append(f'{name}_sum{format_labels(key)} {format_value(histogram.sum)}')
+                    lines.append(f'{name}_count{format_labels(key)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self):
+        """ returns a summary of the metrics: the counters and gauges, and the count, mean and quantiles of the
+        histograms"""
+        summary = {'counters': defaultdict(list), 'gauges': defaultdict(list), 'histograms': defaultdict(list)}
+        with self._lock:
+            for (name, key), value in sorted(self.counters.items()):
+                summary['counters'][name].append({'labels': dict(key), 'value': value})
+            for (name, key), value in sorted(self.gauges.items()):
+                summary['gauges'][name].append({'labels': dict(key), 'value': value})
+            for (name, key), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                summary['histograms'][name].append({'labels': dict(key), **histogram.summary()})
+        return {kind: dict(values) for kind, values in summary.items()}
+
+
+_registry = NullMetrics()
+
+
+def enable():
+    """ starts recording the metrics, returns the new registry"""
+    global _registry
+    _registry = Metrics()
+    return _registry
+
+
+def disable():
+    global _registry
+    _registry = NullMetrics()
+
+
+def get_registry():
+    return _registry
+
+
+def enabled():
+    return _registry.enabled
+
+
+def inc(name, value=1, **labels):
+    """ adds value to the counter name with the given labels"""
+    _registry.inc(name, value, **labels)
+
+
+def set_gauge(name, value, **labels):
+    """ sets the gauge name with the given labels to value"""
+    _registry.set(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    """ adds value to the histogram name with the given labels"""
+    _registry.observe(name, value, **labels)
+
+
+def timer(name, **labels):
+    """ returns a context manager that adds the seconds spent in its block to the histogram name"""
+    return _registry.timer(name, **labels)
+
+
+def merge(state):
+    """ adds the metrics recorded by another process (see Metrics.state) to the current registry"""
+    _registry.merge(state)
+
+
+class CountingCursor:
+    """ wraps a database cursor and counts the statements it sends in db_round_trips_total"""
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, args=None):
+        inc('db_round_trips_total', kind='execute')
+        return self._cursor.execute(query, args)
+
+    def executemany(self, query, args):
+        inc('db_round_trips_total', kind='executemany')
+        return self._cursor.executemany(query, args)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._cursor.__exit__(*exc_info)
+
+
+def count_round_trips(cursor):
+    """ returns the cursor wrapped in a CountingCursor when the metrics are enabled, the cursor itself otherwise"""
+    return CountingCursor(cursor) if _registry.enabled else cursor
+
+
+def write(path):
+    """ writes the metrics to path: a json summary if it ends with .json, the Prometheus text format otherwise. The
+    file is replaced atomically."""
+    if not _registry.enabled:
+        return
+    _registry.set('run_seconds', time.time() - _registry.started)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        if path.endswith('.json'):
+            json.dump(_registry.to_dict(), file, indent=2)
+        else:
+            file.write(_registry.to_prometheus())
+    os.replace(tmp_path, path)  # a scraper of the file (node exporter) never reads it half written
+    logger.info(f'metrics written to {path}')
@@ -0,0 +1,90 @@
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import cell_parsers
+import html_parsing
+import metrics
+from cleaning_converting import convert
+from records import QuakeBatch
+
+logger = logging.getLogger(__name__)
+
+### this file stores the process pool mode of the scraper. Parsing the detailed pages and converting them is CPU bound
+### and runs on a single core under the GIL, so the raw html pages are split in shards that are parsed and converted by
+### a pool of processes. The workers are started once for the whole run (pandas is imported once per worker, not once
+### per shard). The shards are sent to the pool as soon as their pages are downloaded. The workers send back compact
+### QuakeBatch shards (see records), much smaller to pickle than dataframes of objects, merged in the order of the
+### pages, with the metrics and the counters of the cell parsers of the shard, merged in the ones of the main process.
+
+DEFAULT_SHARD_SIZE = 100
+
+
+def init_worker(backend, cache_size=cell_parsers.DEFAULT_CACHE_SIZE, with_metrics=False):
+    """ runs once in each worker when the pool starts: selects the same html parser and size of the caches of the cell
+    parsers as the main process, and records the metrics when the main process does. The modules of the project (and
+    pandas) are already imported when this file is loaded."""
+    html_parsing.set_backend(backend)
+    cell_parsers.set_cache_size(cache_size)
+    if with_metrics:
+        metrics.enable()
+
+
+def parse_and_convert(shard):
+    """ parses and converts a shard (ids, html pages) of detailed pages, returns the converted QuakeBatch"""
+    ids, pages = shard
+    table = pd.DataFrame.from_records([html_parsing.detail_record(page) for page in pages])
+    table['eq_id'] = list(ids)
+    return QuakeBatch.from_frame(convert(table))
+
+
+def convert_shard(shard):
+    """ the task of the workers: returns the QuakeBatch of parse_and_convert, the metrics recorded for the shard (see
+    metrics.Metrics.state) and the cells counted by the cell parsers for the shard (see cell_parsers.counts)"""
+    registry = metrics.enable() if metrics.enabled() else None  # a new registry per shard, only its metrics are sent
+    before = cell_parsers.counts()
+    batch = parse_and_convert(shard)
+    parser_counts = {name: (cells - before[name][0], parsed - before[name][1])
+                     for name, (cells, parsed) in cell_parsers.counts().items()}
+    return batch, registry.state() if registry else None, parser_counts
+
+
+def shards(ids, pages, shard_size):
+    """ yields the (ids, pages) of consecutive shards of shard_size pages. pages can be an iterator (see
+    fetcher.imap_ordered), each shard is yielded as soon as its last page is there."""
+    ids = list(ids)
+    start, shard = 0, []
+    for page in pages:
+        shard.append(page)
+        if len(shard) == shard_size:
+            yield ids[start:start + shard_size], shard
+            start, shard = start + shard_size, []
+    if shard:
+        yield ids[start:start + len(shard)], shard
+
+
+def make_pool(processes=None):
+    """ starts a pool of processes (os.cpu_count() by default) that parse with the current html parser"""
+    return ProcessPoolExecutor(max_workers=processes or os.cpu_count(), initializer=init_worker,
+                               initargs=(html_parsing.get_backend(), cell_parsers.get_cache_size(), metrics.enabled()))
+
+
+def parse_and_convert_all(ids, pages, processes=None, shard_size=DEFAULT_SHARD_SIZE, pool=None):
+    """ parses and converts all the detailed pages with a pool of processes and returns one converted QuakeBatch with
+    the earthquakes in the order of the pages (at least one page). pages can be an iterator yielding the pages as they
+    are downloaded, each shard is sent to the pool once its pages are there, while the next ones are downloaded. The
+    metrics and the counters of the cell parsers of the workers are merged in the ones of this process. A pool made
+    by make_pool can be given to reuse its workers, otherwise one is started with the given number of processes and
+    stopped at the end."""
+    if pool is None:
+        with make_pool(processes) as pool:
+            return parse_and_convert_all(ids, pages, processes, shard_size, pool)
+    futures = [pool.submit(convert_shard, shard) for shard in shards(ids, pages, shard_size)]
+    batches = []
+    for future in futures:
+        batch, worker_metrics, parser_counts = future.result()
+        metrics.merge(worker_metrics)
+        cell_parsers.add_counts(parser_counts)
+        batches.append(batch)
+    logger.info(f'parsed and converted {sum(len(batch) for batch in batches)} pages in {len(batches)} shards')
+    return QuakeBatch.concat(batches)
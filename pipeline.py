@@ -0,0 +1,132 @@
+import itertools
+import queue
+import threading
+import logging
+from collections import deque
+from tqdm import tqdm
+import db_pool
+import fetcher
+import storage
+import uptade_database
+from cleaning_converting import convert
+from records import QuakeBatch
+
+logger = logging.getLogger(__name__)
+
+### this file stores the streaming mode of the scraper. The detailed pages flow through convert and into the database
+### in micro-batches of fixed size: the pages are downloaded by the fetcher threads while a writer thread converts and
+### commits the previous batch. The queue between them is bounded, so when the database is slower than the downloads
+### the downloads wait, and the memory used does not depend on the length of the date range. With a pool of database
+### connections (see db_pool) several batches are written at the same time.
+
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_PENDING_BATCHES = 2
+
+
+def batched(iterable, size):
+    """ yields lists of size items of the iterable, the last one can be shorter"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def write_batch(ids, records, build, connection):
+    """ builds the table of a batch of detailed records, converts it and writes it to the database in one
+    transaction, connection can also be a storage backend (see storage). Returns the converted QuakeBatch (see
+    records)."""
+    data = QuakeBatch.from_frame(convert(build(records, ids)))
+    if isinstance(connection, storage.Storage):
+        connection.write_earthquakes(data)
+    else:
+        uptade_database.upsert_earthquakes(data, connection, chunk_size=len(ids))
+    return data
+
+
+def run_pipeline(ids, urls, fetch, build, connection, batch_size=DEFAULT_BATCH_SIZE, workers=1, rate=None,
+                 max_pending_batches=DEFAULT_PENDING_BATCHES, on_batch_written=None, writers=1):
+    """ This function downloads the detailed pages of urls with fetch (url -> record) and writes them to the database
+    in batches of batch_size earthquakes, each batch is built with build(records, ids), converted and committed.
+    At most max_pending_batches batches wait for the writer. on_batch_written is called with each converted
+    QuakeBatch after its commit. If a batch fails the downloads stop and the error is raised, the previous batches
+    stay committed. connection can also be a db_pool.ConnectionPool, then up to writers batches are written in parallel
+    (see run_parallel_pipeline). Returns the number of earthquakes written."""
+    if isinstance(connection, db_pool.ConnectionPool):
+        return run_parallel_pipeline(ids, urls, fetch, build, connection, batch_size, workers, rate, writers,
+                                     max_pending_batches, on_batch_written)
+    pending = queue.Queue(maxsize=max_pending_batches)
+    errors = []
+    written = []
+
+    def writer():
+        while True:
+            batch = pending.get()
+            if batch is None:
+                return
+            if errors:
+                continue  # keep emptying the queue so that the producer is never blocked
+            batch_ids, batch_records = batch
+            try:
+                data = write_batch(batch_ids, batch_records, build, connection)
+                written.append(len(batch_ids))
+                logger.info(f'committed batch {len(written)} of {len(batch_ids)} earthquakes')
+                if on_batch_written:
+                    on_batch_written(data)
+            except Exception as error:
+                logger.error(f'failed to write batch {len(written) + 1}: {error}')
+                errors.append(error)
+
+    writer_thread = threading.Thread(target=writer, name='pipeline-writer', daemon=True)
+    writer_thread.start()
+    records = fetcher.imap_ordered(fetch, urls, workers=workers, rate=rate)
+    try:
+        for batch in batched(zip(ids, tqdm(records, total=len(urls))), batch_size):
+            if errors:
+                break
+            batch_ids, batch_records = zip(*batch)
+            pending.put((list(batch_ids), list(batch_records)))
+    finally:
+        records.close()
+        pending.put(None)
+        writer_thread.join()
+    if errors:
+        raise errors[0]
+    logger.info(f'streamed {sum(written)} earthquakes in {len(written)} batches')
+    return sum(written)
+
+
+def run_parallel_pipeline(ids, urls, fetch, build, pool, batch_size=DEFAULT_BATCH_SIZE, workers=1, rate=None,
+                          writers=1, max_pending_batches=DEFAULT_PENDING_BATCHES, on_batch_written=None):
+    """ the same as run_pipeline, the batches are written by a db_pool.WriterPool of writers connections of pool.
+    The batches are independent (the earthquakes are upserted on their link id), so they are committed in any order,
+    on_batch_written is called in the order of the batches from this thread. At most writers + max_pending_batches
+    batches are in memory. Returns the number of earthquakes written."""
+    written = []
+    pending = deque()
+
+    def finish(future):
+        data = future.result()
+        written.append(len(data))
+        logger.info(f'committed batch {len(written)} of {len(data)} earthquakes')
+        if on_batch_written:
+            on_batch_written(data)
+
+    records = fetcher.imap_ordered(fetch, urls, workers=workers, rate=rate)
+    with db_pool.WriterPool(pool, lambda batch, connection: write_batch(*batch, build, connection),
+                            workers=writers) as writer_pool:
+        try:
+            for batch in batched(zip(ids, tqdm(records, total=len(urls))), batch_size):
+                batch_ids, batch_records = zip(*batch)
+                pending.append(writer_pool.submit((list(batch_ids), list(batch_records))))
+                while len(pending) > writer_pool.workers + max_pending_batches - 1 or (pending and pending[0].done()):
+                    finish(pending.popleft())
+            while pending:
+                finish(pending.popleft())
+        finally:
+            records.close()
+            for future in pending:
+                future.cancel()
+    logger.info(f'streamed {sum(written)} earthquakes in {len(written)} batches with {writer_pool.workers} writers')
+    return sum(written)
@@ -0,0 +1,238 @@
+import logging
+import sys
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+### this file stores the compact in memory form of the earthquakes, exchanged between convert and the database
+### writers. A converted dataframe keeps every cell as a python object once its missing values are replaced by None
+### (tuples for the coordinates, a list of tuples for the cities), about 2 kB per earthquake. A QuakeBatch keeps one
+### typed numpy array per column instead: float32 for the measures (the database columns are FLOAT), small integers
+### for the intensity and the number of reports, a category for the data source (a few agencies). The cities
+### of all the earthquakes are flattened in arrays (distance, population, index of the name) with the offsets of the
+### cities of each earthquake, and every city name is stored once.
+
+# the columns of the earthquakes table, in the order of the rows of QuakeBatch.earthquake_rows
+COLUMNS = ('link_id', 'date_time', 'local_time_at_epicenter', 'status', 'magnitude', 'depth',
+           'epicenter_latitude', 'epicenter_longitude', 'antipode_latitude', 'antipode_longitude',
+           'shaking_intensity', 'felt', 'primary_data_source', 'nearest_volcano', 'estimated_seismic_energy')
+FLOAT_COLUMNS = ('magnitude', 'depth', 'epicenter_latitude', 'epicenter_longitude', 'antipode_latitude',
+                 'antipode_longitude', 'estimated_seismic_energy')
+MISSING = -1  # the shaking intensity or number of reports of an earthquake without it
+
+
+def float_list(values):
+    """ returns the float32 array as python floats with the digits they were parsed from (4.7 and not
+    4.699999809265137), None for NaN"""
+    floats = values.astype(str).astype(np.float64)
+    return [None if value != value else value for value in floats.tolist()]
+
+
+def int_list(values):
+    """ returns the integer array as python ints, None for MISSING"""
+    return [None if value == MISSING else value for value in values.tolist()]
+
+
+def nullable_ints(values):
+    """ returns the integer array as int64, or as a pandas Int64 array when some values are MISSING"""
+    missing = values == MISSING
+    if not missing.any():
+        return values.astype(np.int64)
+    return pd.arrays.IntegerArray(values.astype(np.int64), mask=missing)
+
+
+def text_list(values):
+    """ returns the texts of an object array or of a pandas Categorical as python strings, None for the missing
+    values"""
+    return [None if value != value else value for value in np.asarray(values, dtype=object).tolist()]
+
+
+def coordinate_arrays(cells):
+    """ returns the float32 arrays of the latitudes and longitudes of a column of (latitude, longitude) tuples, NaN
+    when the cell or the value is missing"""
+    lats = np.full(len(cells), np.nan, dtype=np.float32)
+    lons = np.full(len(cells), np.nan, dtype=np.float32)
+    for position, cell in enumerate(cells):
+        if isinstance(cell, tuple):
+            lats[position] = np.nan if cell[0] is None else cell[0]
+            lons[position] = np.nan if cell[1] is None else cell[1]
+    return lats, lons
+
+
+def int_array(values, dtype):
+    """ returns the column as an integer array of dtype, MISSING for the missing values"""
+    values = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce')
+    return values.fillna(MISSING).to_numpy().astype(dtype)
+
+
+class QuakeBatch:
+    """ This class holds a batch of converted earthquakes as typed columns. It is built from the output of
+    cleaning_converting.convert with from_frame, sliced like a list (batch[start:stop]) and written by the storage
+    backends from earthquake_rows (one tuple of python values per earthquake, None for the missing values) and
+    city_rows."""
+    __slots__ = ('eq_ids', 'link_ids', 'date_time', 'local_time', 'status', 'floats', 'shaking_intensity', 'felt',
+                 'source', 'volcano', 'city_offsets', 'city_distance', 'city_population', 'city_codes', 'city_names')
+
+    def __init__(self, eq_ids, link_ids, date_time, local_time, status, floats, shaking_intensity, felt, source,
+                 volcano, city_offsets, city_distance, city_population, city_codes, city_names):
+        self.eq_ids = eq_ids
+        self.link_ids = link_ids
+        self.date_time = date_time
+        self.local_time = local_time
+        self.status = status
+        self.floats = floats
+        self.shaking_intensity = shaking_intensity
+        self.felt = felt
+        self.source = source
+        self.volcano = volcano
+        self.city_offsets = city_offsets
+        self.city_distance = city_distance
+        self.city_population = city_population
+        self.city_codes = city_codes
+        self.city_names = city_names
+
+    @classmethod
+    def from_frame(cls, df):
+        """ builds the batch of a dataframe converted by cleaning_converting.convert (before or after its missing
+        values are replaced by None)"""
+        eq_ids = np.array(df['eq_id'], dtype=object)
+        link_ids = pd.Series(eq_ids, dtype=object).str.extract(r'(\d+)', expand=False).astype(np.int64).to_numpy()
+        epicenter = coordinate_arrays(df['Epicenter latitude / longitude'].tolist())
+        antipode = coordinate_arrays(df['Antipode'].tolist())
+        floats = {'magnitude': pd.to_numeric(df['Magnitude'], errors='coerce').to_numpy(np.float32),
+                  'depth': pd.to_numeric(df['Depth'], errors='coerce').to_numpy(np.float32),
+                  'epicenter_latitude': epicenter[0], 'epicenter_longitude': epicenter[1],
+                  'antipode_latitude': antipode[0], 'antipode_longitude': antipode[1],
+                  'estimated_seismic_energy': pd.to_numeric(df['Estimated seismic energy released'],
+                                                            errors='coerce').to_numpy(np.float32)}
+
+        offsets = np.zeros(len(df) + 1, dtype=np.int32)
+        distances, names, populations = [], [], []
+        for position, cities in enumerate(df['Nearby towns and cities'].tolist()):
+            if isinstance(cities, list):
+                for distance, name, population in cities:
+                    distances.append(distance)
+                    names.append(name)
+                    populations.append(population)
+            offsets[position + 1] = len(distances)
+        codes, unique_names = pd.factorize(pd.Series(names, dtype=object))
+        return cls(eq_ids=eq_ids, link_ids=link_ids,
+                   date_time=pd.to_datetime(pd.Series(df['Date & time'], dtype=object)).to_numpy('datetime64[s]'),
+                   local_time=np.array(df['Local time at epicenter'], dtype=object),
+                   status=np.array(df['Status'], dtype=bool), floats=floats,
+                   shaking_intensity=int_array(df['Shaking intensity'], np.int8),
+                   felt=int_array(df['Felt'], np.int32),
+                   source=pd.Categorical(df['Primary data source']),
+                   volcano=np.array(df['Nearest volcano'], dtype=object),
+                   city_offsets=offsets, city_distance=np.array(distances, dtype=np.int32),
+                   city_population=np.array(populations, dtype=np.int32), city_codes=codes.astype(np.int32),
+                   city_names=np.asarray(unique_names, dtype=object))
+
+    @classmethod
+    def of(cls, data):
+        """ returns data when it is a batch, the batch of the converted dataframe data otherwise"""
+        return data if isinstance(data, cls) else cls.from_frame(data)
+
+    @classmethod
+    def concat(cls, batches):
+        """ returns one batch of the earthquakes of all the batches (at least one), in order"""
+        batches = list(batches)
+        if len(batches) == 1:
+            return batches[0]
+        unique_names = pd.Index(np.concatenate([batch.city_names for batch in batches]), dtype=object).unique()
+        codes, offsets, first = [], [np.zeros(1, dtype=np.int32)], 0
+        for batch in batches:
+            codes.append(unique_names.get_indexer(batch.city_names)[batch.city_codes].astype(np.int32))
+            offsets.append(batch.city_offsets[1:] + first)
+            first += len(batch.city_codes)
+
+        def joined(name):
+            return np.concatenate([getattr(batch, name) for batch in batches])
+
+        return cls(eq_ids=joined('eq_ids'), link_ids=joined('link_ids'), date_time=joined('date_time'),
+                   local_time=joined('local_time'), status=joined('status'),
+                   floats={column: np.concatenate([batch.floats[column] for batch in batches])
+                           for column in FLOAT_COLUMNS},
+                   shaking_intensity=joined('shaking_intensity'), felt=joined('felt'),
+                   source=pd.Categorical(pd.api.types.union_categoricals([batch.source for batch in batches])),
+                   volcano=joined('volcano'),
+                   city_offsets=np.concatenate(offsets), city_distance=joined('city_distance'),
+                   city_population=joined('city_population'), city_codes=np.concatenate(codes),
+                   city_names=np.asarray(unique_names, dtype=object))
+
+    def __len__(self):
+        return len(self.link_ids)
+
+    def __getitem__(self, rows):
+        """ returns the batch of the earthquakes of the slice rows, the city names are shared with this batch"""
+        if not isinstance(rows, slice) or rows.step not in (None, 1):
+            raise TypeError('a QuakeBatch can only be sliced with start:stop')
+        start, stop, _ = rows.indices(len(self))
+        stop = max(start, stop)
+        first, last = self.city_offsets[start], self.city_offsets[stop]
+        return QuakeBatch(eq_ids=self.eq_ids[start:stop], link_ids=self.link_ids[start:stop],
+                          date_time=self.date_time[start:stop], local_time=self.local_time[start:stop],
+                          status=self.status[start:stop],
+                          floats={column: values[start:stop] for column, values in self.floats.items()},
+                          shaking_intensity=self.shaking_intensity[start:stop], felt=self.felt[start:stop],
+                          source=self.source[start:stop], volcano=self.volcano[start:stop],
+                          city_offsets=self.city_offsets[start:stop + 1] - first,
+                          city_distance=self.city_distance[first:last],
+                          city_population=self.city_population[first:last], city_codes=self.city_codes[first:last],
+                          city_names=self.city_names)
+
+    def statuses(self):
+        """ returns {eq_id: confirmed} of the earthquakes of the batch (see state_store.ScrapeState.record_quakes)"""
+        return dict(zip(self.eq_ids.tolist(), self.status.tolist()))
+
+    def earthquake_rows(self):
+        """ returns the values of the earthquakes table (COLUMNS) of each earthquake, as tuples of python values"""
+        columns = {'link_id': self.link_ids.tolist(),
+                   'date_time': self.date_time.tolist(),
+                   'local_time_at_epicenter': text_list(self.local_time),
+                   'status': self.status.astype(np.int8).tolist(),
+                   'shaking_intensity': int_list(self.shaking_intensity), 'felt': int_list(self.felt),
+                   'primary_data_source': text_list(self.source), 'nearest_volcano': text_list(self.volcano)}
+        columns.update({column: float_list(values) for column, values in self.floats.items()})
+        return list(zip(*[columns[column] for column in COLUMNS]))
+
+    def city_rows(self):
+        """ returns the (link_id, city_name, population, distance) of the nearby cities of all the earthquakes"""
+        link_ids = np.repeat(self.link_ids, np.diff(self.city_offsets))
+        return list(zip(link_ids.tolist(), self.city_names[self.city_codes].tolist(), self.city_population.tolist(),
+                        self.city_distance.tolist()))
+
+    def cities_by_link_id(self):
+        """ returns {link_id: list of (distance, city name, population)} of the earthquakes with nearby cities, the
+        form of the cities of the converted dataframe"""
+        cities = {}
+        for link_id, name, population, distance in self.city_rows():
+            cities.setdefault(link_id, []).append((distance, name, population))
+        return cities
+
+    def to_table(self):
+        """ returns the dataframe of the earthquakes table (COLUMNS), with float64 measures"""
+        table = pd.DataFrame({'link_id': self.link_ids, 'date_time': self.date_time.astype('datetime64[ns]'),
+                              'local_time_at_epicenter': self.local_time, 'status': self.status.astype(np.int64)})
+        for column in FLOAT_COLUMNS[:6]:
+            table[column] = self.float64(column)
+        table['shaking_intensity'] = nullable_ints(self.shaking_intensity)
+        table['felt'] = nullable_ints(self.felt)
+        table['primary_data_source'] = np.asarray(self.source, dtype=object)
+        table['nearest_volcano'] = self.volcano
+        table['estimated_seismic_energy'] = self.float64('estimated_seismic_energy')
+        return table[list(COLUMNS)]
+
+    def float64(self, column):
+        """ returns the float32 column as float64 with the digits it was parsed from (see float_list)"""
+        return self.floats[column].astype(str).astype(np.float64)
+
+    def memory_usage(self):
+        """ returns the number of bytes of the batch: its arrays and the python strings they point to"""
+        arrays = [self.eq_ids, self.link_ids, self.date_time, self.local_time, self.status, self.shaking_intensity,
+                  self.felt, self.source.codes, self.volcano, self.city_offsets, self.city_distance,
+                  self.city_population, self.city_codes, self.city_names, *self.floats.values()]
+        strings = [*self.eq_ids.tolist(), *self.local_time.tolist(), *self.source.categories,
+                   *self.volcano.tolist(), *self.city_names.tolist()]
+        return sum(array.nbytes for array in arrays) + sum(sys.getsizeof(value) for value in strings)
@@ -0,0 +1,217 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+import requests
+from requests.structures import CaseInsensitiveDict
+import metrics
+from state_store import day_of_url, CLOSE_AFTER_DAYS
+
+logger = logging.getLogger(__name__)
+
+### this file stores the local cache of the http responses of the scraper. The bodies are stored once per content
+### (the file name is the sha256 of the body) and an sqlite index maps every url to its body, its validators
+### (ETag / Last-Modified) and the time it was stored. Each class of url has its own time to live, the stale
+### responses are revalidated with a conditional request and the least recently used ones are evicted when the cache
+### is full. In offline mode the cache replays the stored responses without using the network.
+
+DEFAULT_CACHE_DIR = '.http_cache'
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# seconds before a response has to be revalidated, None means it never expires
+DEFAULT_TTLS = {'today': 5 * 60,
+                'archive': None,  # the archive days older than CLOSE_AFTER_DAYS never change
+                'archive_recent': 60 * 60,
+                'detail': 60 * 60,
+                'api': 10 * 60,
+                'other': 10 * 60}
+
+
+class CacheMiss(Exception):
+    """ raised in offline mode when a url is not in the cache"""
+
+
+def url_class(url):
+    """ returns the class of a url of the scraper: today, archive (a closed archive day), archive_recent, detail (a
+    detailed page of an earthquake), api or other (like the "show more" pages)"""
+    parts = urlsplit(url)
+    if parts.path.endswith('today.html'):
+        return 'today'
+    day = day_of_url(parts.path)
+    if day is not None:
+        return 'archive' if datetime.now() - day >= timedelta(days=CLOSE_AFTER_DAYS) else 'archive_recent'
+    if 'volcanodiscovery.com' in parts.netloc:
+        return 'detail'
+    if 'eonet' in parts.netloc:
+        return 'api'
+    return 'other'
+
+
+class ResponseCache:
+    """ This class is an on-disk cache of http responses, see the top of the file. It is safe to share between the
+    threads of the fetcher."""
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, ttls=None, offline=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.offline = offline
+        self.counters = {'hits': 0, 'misses': 0, 'revalidated': 0, 'stored': 0, 'evicted': 0}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, 'objects'), exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'), check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, digest TEXT, size INT,
+                            etag TEXT, last_modified TEXT, content_type TEXT, encoding TEXT,
+                            stored_at REAL, last_used REAL)""")
+        self._db.commit()
+        self._bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM responses "
+                                       "GROUP BY digest)").fetchone()[0]
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+        metrics.inc('http_cache_total', result=counter)
+
+    def _object_path(self, digest):
+        return os.path.join(self.cache_dir, 'objects', digest[:2], digest)
+
+    def _lookup(self, url):
+        """ returns the index entry of url as a dictionary, or None"""
+        with self._lock:
+            cursor = self._db.execute("""SELECT digest, size, etag, last_modified, content_type, encoding, stored_at
+                                         FROM responses WHERE url = ?""", (url,))
+            result = cursor.fetchone()
+        if result is None:
+            return None
+        keys = ('digest', 'size', 'etag', 'last_modified', 'content_type', 'encoding', 'stored_at')
+        return dict(zip(keys, result))
+
+    def _is_fresh(self, url, entry):
+        ttl = self.ttls[url_class(url)]
+        return ttl is None or time.time() - entry['stored_at'] < ttl
+
+    def _touch(self, url, revalidated=False):
+        with self._lock:
+            now = time.time()
+            if revalidated:
+                self._db.execute("UPDATE responses SET stored_at = ?, last_used = ? WHERE url = ?", (now, now, url))
+            else:
+                self._db.execute("UPDATE responses SET last_used = ? WHERE url = ?", (now, url))
+            self._db.commit()
+
+    def _replay(self, url, entry):
+        """ builds a requests response from a cached entry, or returns None if its body was removed"""
+        try:
+            with open(self._object_path(entry['digest']), 'rb') as body_file:
+                body = body_file.read()
+        except FileNotFoundError:
+            return None
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response._content = body
+        response.encoding = entry['encoding']
+        response.headers = CaseInsensitiveDict({'Content-Type': entry['content_type'] or '', 'X-Cache': 'HIT'})
+        return response
+
+    def _store(self, url, response):
+        body = response.content
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._object_path(digest)
+        new_body = not os.path.exists(path)
+        if new_body:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as body_file:
+                body_file.write(body)
+            os.replace(tmp_path, path)
+        now = time.time()
+        with self._lock:
+            if new_body:
+                self._bytes += len(body)
+            previous = self._db.execute("SELECT digest, size FROM responses WHERE url = ?", (url,)).fetchone()
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             (url, digest, len(body), response.headers.get('ETag'),
+                              response.headers.get('Last-Modified'), response.headers.get('Content-Type'),
+                              response.encoding, now, now))
+            if previous and previous[0] != digest:
+                self._remove_orphan(*previous)
+            self._db.commit()
+            self.counters['stored'] += 1
+        if self._bytes > self.max_bytes:
+            self.evict()
+
+    def _remove_orphan(self, digest, size):
+        """ removes the body of digest when no url refers to it anymore (the page of its url changed), called with the
+        lock held"""
+        if self._db.execute("SELECT 1 FROM responses WHERE digest = ? LIMIT 1", (digest,)).fetchone():
+            return
+        try:
+            os.remove(self._object_path(digest))
+            self._bytes -= size
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """ removes the least recently used responses until the bodies stored take at most max_bytes"""
+        with self._lock:
+            bodies = self._db.execute("""SELECT digest, MAX(size), MAX(last_used) FROM responses
+                                         GROUP BY digest ORDER BY MAX(last_used)""").fetchall()
+            total = sum(size for _, size, _ in bodies)
+            for digest, size, _ in bodies:
+                if total <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM responses WHERE digest = ?", (digest,))
+                try:
+                    os.remove(self._object_path(digest))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.counters['evicted'] += 1
+            self._db.commit()
+            self._bytes = total
+
+    def get(self, client, url, **kwargs):
+        """ returns the response of url from the cache when it is fresh, otherwise downloads it with client (an
+        HttpClient), sending the ETag / Last-Modified of the cached response so that the website can answer 304 Not
+        Modified. Only the 200 responses are stored."""
+        entry = self._lookup(url)
+        if entry and (self.offline or self._is_fresh(url, entry)):
+            response = self._replay(url, entry)
+            if response is not None:
+                self._touch(url)
+                self._count('hits')
+                return response
+            entry = None
+        if self.offline:
+            raise CacheMiss(f'{url} is not in the cache {self.cache_dir} (offline replay)')
+
+        self._count('misses')
+        headers = dict(kwargs.pop('headers', None) or {})
+        if entry and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        response = client.get(url, headers=headers, **kwargs)
+        if entry and response.status_code == 304:
+            cached = self._replay(url, entry)
+            if cached is not None:
+                self._touch(url, revalidated=True)
+                self._count('revalidated')
+                return cached
+            response = client.get(url, **kwargs)
+        if response.status_code == 200:
+            self._store(url, response)
+        return response
+
+    def stats(self):
+        """ returns the counters of the cache and the number of urls and bytes it stores"""
+        with self._lock:
+            urls, = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()
+            return dict(self.counters, urls=urls, bytes=self._bytes)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
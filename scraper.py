@@ -2,110 +2,45 @@
 """This is the project of Ella, Emuna and Salomé
 on the earthquake website
 "https://www.allquakes.com/earthquakes/today.html" """
-import argparse
 import re
-import sys
-import requests
+import threading
 import pandas as pd
 from tqdm import tqdm
-from bs4 import BeautifulSoup
 from cleaning_converting import convert
+from records import QuakeBatch
 from datetime import datetime, date, timedelta
 import uptade_database
+import db_pool
+import storage
+import metrics
 import API_scraper_v1
+import fetcher
+import http_client
+import state_store
+import journal
+import daemon
+import cli
+import response_cache
+import html_parsing
+import cell_parsers
+import pipeline
+import parallel_convert
 import logging
 
 MAIN_URL = 'https://www.volcanodiscovery.com/'
 LINK = 'https://www.allquakes.com/earthquakes/archive/'
-
-HELP_MESSAGE = """This is a CLI to scrape specific information about earthquakes.
-the program will scrape all the relevant information (by date, magnitude) and will update the information
-in the database.
-
-Usage:
-scraper.py [-h] [--date DATE]
-            [--magnitude MAGNITUDE]
-            [--n_rows NUMBER]
-
-options:
-  -h, --help            show this help message and exit
-  --date START_DATE END_DATE(optional) 
-  --magnitude FROM_MAGNITUDE TO_MAGNITUDE(optional)
-  --n_rows NUMBER
-
-Examples:
-1. scraper.py --date 12/11/2022 14/11/2022 -> will scrape all earthquakes from 12/11/2022 to 14/11/2022
-2. scraper.py --date 12/11/2022 --magnitude 3.6 8.1 ->
-    will scrape all earthquakes from 12/11/2022 until today that have magnitude between 3.6 to 8.1
-3. scraper.py --date 12/11/2022 --magnitude 3.6  ->
-    will srcape all earthquakes from 12/11/2022 until today
-    that have magnitude above 3.6
-4. scraper.py --magnitude 7 --n_rows 100 -> will scrape all earthquakes that have magnitude above 7
-    limited to 100 first earthquakes
-"""
-
-logging.basicConfig(filename='scraper.log',
-                    format='%(asctime)s-%(levelname)s-FILE:%(filename)s-FUNC:%(funcName)s-LINE:%(lineno)d-%(message)s',
-                    level=logging.INFO)
+TODAY_URL = 'https://www.allquakes.com/earthquakes/today.html'
+# the command line is in cli, kept here for the code that used them from scraper
+HELP_MESSAGE, DateAction, MagnitudeAction = cli.HELP_MESSAGE, cli.DateAction, cli.MagnitudeAction
 
 logger = logging.getLogger(__name__)
 
 
-class DateAction(argparse.Action):
-    """ This class is used to select the dates of wanted earthquakes to scrape. It is used from the command line or in
-    configuration in the IDE"""
-    def __call__(self, parser, namespace, values, option_string=None):
-        if not values:
-            setattr(namespace, self.dest, None)
-            return
-
-        if len(values) > 2:
-            raise ValueError(f'expected start and end date values. got {len(values)} args: {values}\n')
-        # expected at most 2 values, got {len(values)}
-        try:
-            start_date = datetime.strptime(values[0], '%d/%m/%Y')
-        except ValueError as e:
-            raise ValueError(f'Could not convert {values[0]} to date.\n {e}')
-
-        end_date = start_date
-
-        if len(values) == 2:
-            try:
-                end_date = datetime.strptime(values[1], '%d/%m/%Y')
-            except ValueError as e:
-                raise ValueError(f'Could not convert {values[1]} to date.\n {e}')
-
-        if end_date < start_date:
-            raise ValueError(f'Start date {start_date} must be before end date {end_date}\n')
-        setattr(namespace, self.dest, (start_date, end_date))
-
-
-class MagnitudeAction(argparse.Action):
-    """ This class is used to select the wanted magnitude of earthquakes to scrop. It is used the command line or in
-    configuration from the IDE"""
-    def __call__(self, parser, namespace, values, option_string=None):
-        if not values:
-            setattr(namespace, self.dest, None)
-            return
-        if len(values) > 2:
-            raise ValueError(f'expected at most 2 values for magnitude range. got {len(values)} args: {values}\n')
-        try:
-            from_magnitude = float(values[0])
-            to_magnitude = float(values[1]) if len(values) == 2 else None
-        except ValueError:
-            raise ValueError(f'magnitude expected to be decimal number, got {values}')
-        if to_magnitude and from_magnitude > to_magnitude:
-            raise ValueError(f'{from_magnitude} must be less than {to_magnitude}')
-        if from_magnitude < 0 or (to_magnitude and to_magnitude < 0):
-            raise ValueError(f'magnitude must be positive, got {from_magnitude}, {to_magnitude}')
-        setattr(namespace, self.dest, (from_magnitude, to_magnitude))
-
-
 def create_soup_from_link(link):
     """ Finds all the html information from the url link passed in the input. Returns a beautifull soup object
      containing the page content. """
-    page = requests.get(link)  # asking permission from the website to fetch data, If response is 200 it's ok
-    my_soup = BeautifulSoup(page.content, "html.parser")  # creating a bs object that takes page.content as an input
+    page = http_client.get(link)  # asking permission from the website to fetch data, If response is 200 it's ok
+    my_soup = html_parsing.make_soup(page.content)  # creating a bs object that takes page.content as an input
     return my_soup
 
 
@@ -142,7 +77,7 @@ def get_all_dates(args):
     try:
         if not args.date:
             logger.info('scrape earthquakes from the last 48 hours')
-            return ["https://www.allquakes.com/earthquakes/today.html"]
+            return [TODAY_URL]
         elif len(args.date) == 2:
             today = datetime.now()
             start_date = args.date[0]
@@ -197,107 +132,356 @@ def get_eq(soup):
     return soup.find_all('tr', {'class': re.compile(r'q\d')})
 
 
-def scrapper_main_pages_by_dates(args):
+def crawl_day(url, args, stop=None):
+    """ This function scrapes one main page and its "show more" page. It returns the dictionary {earthquake id: url}
+    of the earthquakes selected by magnitude and the number of earthquakes listed on the page. If the stop event is
+    set while the main page is downloaded, the "show more" page is not downloaded and it returns None."""
+    soup = create_soup_from_link(url)
+    if stop is not None and stop.is_set():
+        logger.info(f'crawl of {url} cancelled')
+        return None
+    quakes = get_eq(soup)
+    show_more_soup = extract_show_more_soup(soup)
+    logger.info(f'press "show more" to see all quakes from url {url}')
+    quakes_show_more = get_eq(show_more_soup)
+    table_eq_dirty = quakes + quakes_show_more
+    return extract_ids_filter_by_mag(table_eq_dirty, args), len(table_eq_dirty)
+
+
+def scrapper_main_pages_by_dates(args, state=None, job=None):
 
     """ This function scrapes all main pages in range of dates requested by the client.
     It scrapes all the earthquakes, including the "show more" earthquakes,
     and returns the earthquakes ID and URl for the more detailed page.
+    The days are crawled by args.day_workers threads but they are gathered in date order, so the --n_rows cut is the
+    same as with a single thread. Once it is reached the days not started yet are cancelled and the running ones
+    stop after their current page.
+    With an incremental state (see state_store), the closed archive days are not scraped again and the earthquakes
+    that are already final in the database are not returned.
+    With a journal (see journal, --resume), the days crawled by the job before are read from the journal instead of
+    being downloaded again, and the new ones are recorded as soon as they are crawled.
     """
 
     url_by_dates = get_all_dates(args)
+    if state:
+        closed = [url for url in url_by_dates if state.is_day_closed(url, args.magnitude)]
+        for url in closed:
+            logger.info(f'skip closed day {url}, all its quakes are already final in the database')
+        url_by_dates = [url for url in url_by_dates if url not in closed]
+
+    stop = threading.Event()
+
+    def crawl(url):
+        if job:
+            done = job.get_day(url)
+            if done:
+                logger.info(f'day {url} already crawled by job {job.job_id}')
+                return done
+        result = crawl_day(url, args, stop)
+        if job and result is not None:
+            job.record_day(url, *result)
+        return result
+
+    days = fetcher.imap_ordered(crawl, url_by_dates, workers=args.day_workers, rate=args.rate)
     dict_id_url = {}
-    for url in url_by_dates:
-        soup = create_soup_from_link(url)
-        quakes = get_eq(soup)
-        show_more_soup = extract_show_more_soup(soup)
-        logger.info(f'press "show more" to see all quakes from url {url}')
-        quakes_show_more = get_eq(show_more_soup)
-        table_eq_dirty = quakes + quakes_show_more
+    try:
+        for url, (id_to_url, n_listed) in zip(url_by_dates, days):
+            if state:
+                state.record_day(url, id_to_url, n_listed, args.magnitude)
+                id_to_url = {eq_id: link for eq_id, link in id_to_url.items() if not state.is_final(eq_id)}
+                logger.info(f'{len(id_to_url)} quakes of {url} are new or not final yet')
+            dict_id_url.update(id_to_url)
+
+            if args.n_rows and len(dict_id_url) >= args.n_rows:
+                ids, urls = list(dict_id_url.keys()), list(dict_id_url.values())
+                return ids[:args.n_rows], urls[:args.n_rows]
+    finally:
+        stop.set()
+        days.close()
 
-        dict_id_url.update(extract_ids_filter_by_mag(table_eq_dirty, args))
+    return list(dict_id_url.keys()), list(dict_id_url.values())
 
-        if args.n_rows and len(dict_id_url) >= args.n_rows:
-            ids, urls = list(dict_id_url.keys()), list(dict_id_url.values())
-            return ids[:args.n_rows], urls[:args.n_rows]
 
-    return list(dict_id_url.keys()), list(dict_id_url.values())
+def quake_signature(quake):
+    """ returns the magnitude, region and depth of a row of a main page, they change when the earthquake is revised"""
+    return '|'.join(cell.get_text(' ', strip=True) for cell in quake.find_all('td')[1:4])
+
+
+def poll_today(args, backend, state, seen):
+    """ one poll of the daemon mode (see daemon): scrapes today.html and its "show more" page, and downloads and
+    writes only the earthquakes that are new, whose row changed since the last poll, or that are not confirmed yet
+    and were written more than --refresh_interval seconds ago. The state records their status, the earthquakes that
+    left today.html are dropped from it (see state_store.ScrapeState.prune). Returns the number of earthquakes
+    written."""
+    soup = create_soup_from_link(TODAY_URL)
+    quakes = get_eq(soup) + get_eq(extract_show_more_soup(soup))
+    id_to_url = extract_ids_filter_by_mag(quakes, args)
+    signatures = {quake.get('id'): quake_signature(quake) for quake in quakes if quake.get('id') in id_to_url}
+    changed = seen.changed(signatures, state.is_final)
+    state.prune(signatures)
+    logger.info(f'today.html lists {len(signatures)} quakes, {len(changed)} new or changed')
+    if not changed:
+        return 0
+    try:
+        load_earthquakes(args, changed, [MAIN_URL + id_to_url[eq_id] for eq_id in changed], backend, state)
+    except Exception:
+        seen.forget(changed)
+        raise
+    seen.mark_written(changed)
+    state.save()
+    metrics.inc('daemon_items_written_total', len(changed), kind='quake')
+    return len(changed)
+
+
+def poll_events(args, backend, seen):
+    """ one poll of the daemon mode (see daemon): gets the EONET events of the last --events_days days and writes
+    only the events that are new or changed since the last poll. Returns the number of events written."""
+    start = date.today() - timedelta(days=args.events_days)
+    dict_of_df = API_scraper_v1.main(start=start, workers=max(args.workers, API_scraper_v1.DEFAULT_WORKERS))
+    dict_of_df = {event_type: df for event_type, df in dict_of_df.items()
+                  if event_type in uptade_database.EVENT_TABLE_BY_TYPE}
+    signatures = {(event_type, event_id): repr(row) for event_type, df in dict_of_df.items()
+                  for event_id, row in zip(df['id'], df.itertuples(index=False))}
+    changed = set(seen.changed(signatures))
+    logger.info(f'EONET returned {len(signatures)} events, {len(changed)} new or changed')
+    if not changed:
+        return 0
+    new_events = {event_type: df[[(event_type, event_id) in changed for event_id in df['id']]]
+                  for event_type, df in dict_of_df.items()}
+    try:
+        backend.write_all_events(new_events)
+    except Exception:
+        seen.forget(changed)
+        raise
+    seen.mark_written(changed)
+    metrics.inc('daemon_items_written_total', len(changed), kind='event')
+    return len(changed)
+
+
+def run_daemon(args, backend, state):
+    """ runs the daemon mode until SIGTERM or SIGINT: today.html is polled every --quakes_interval seconds and EONET
+    every --events_interval seconds, with the http session and the storage backend kept open between the polls"""
+    seen_quakes = daemon.SeenItems(refresh=args.refresh_interval)
+    seen_events = daemon.SeenItems()
+    service = daemon.Daemon([daemon.Task('quakes', args.quakes_interval,
+                                         lambda: poll_today(args, backend, state, seen_quakes)),
+                             daemon.Task('events', args.events_interval,
+                                         lambda: poll_events(args, backend, seen_events))],
+                            jitter=args.jitter)
+    service.install_signal_handlers()
+    service.run(after_poll=(lambda: metrics.write(args.metrics_out)) if args.metrics_out else None)
+
+
+def parse_detail_record(html):
+    """ this function parses the html of a detailed page. The first table of the page holds the name of each field in
+    its first column and the value in its second column, it returns them as a dictionary {field: value}.
+    The parser is selected with html_parsing.set_backend."""
+    return html_parsing.detail_record(html)
+
+
+def fetch_detail_page(url):
+    """ this function downloads the detailed page of one earthquake and returns its html"""
+    return http_client.get(url).text
+
+
+def scrape_detail_record(url):
+    """ this function downloads the detailed page of one earthquake and returns its fields as a dictionary"""
+    return parse_detail_record(fetch_detail_page(url))
+
+
+def build_detailed_table(records, id_list):
+    """ this function builds the dataframe of all the earthquakes detailed at once from the list of records returned
+    by scrape_detail_record. The columns are the union of the fields of all the records, in order of appearance."""
+    table_detailed_all_earthquakes = pd.DataFrame.from_records(records)
+    table_detailed_all_earthquakes["eq_id"] = list(id_list)
+    return table_detailed_all_earthquakes
 
 
 def scraping_with_pandas_p2(url):
     """ this function is used to scrape the detailed pages of each earthquake.
     It returns a pandas dataframe of the available data from the second page."""
-    page = requests.get(url)
-    dfs = pd.read_html(page.text)  # this creates dataframe directly from the table in h
-    # df[0] this is the table that we need.
-    table_detailed = dfs[0].transpose()
-    table_detailed.columns = table_detailed.iloc[0]
-    table_detailed = table_detailed.drop(table_detailed.index[0])
-    return table_detailed
-
-
-def scraping_with_pandas_all_earthquakes(id_list, url_list):
-    """ this returns a pandas dataframe of all the earthquakes detailed (every p2)"""
-    table_detailed_all_earthquakes = pd.DataFrame()
-    for idx, link in enumerate(tqdm(url_list, total=len(url_list))):
-        table_detailed = scraping_with_pandas_p2(link)
+    return pd.DataFrame.from_records([scrape_detail_record(url)])
+
+
+def scraping_with_pandas_all_earthquakes(id_list, url_list, workers=1, rate=None, fetch=scrape_detail_record):
+    """ this returns a pandas dataframe of all the earthquakes detailed (every p2).
+    The detailed pages are downloaded by `workers` threads with at most `rate` requests per second to each host,
+    the rows keep the order of url_list. The records are collected first and the dataframe is built once at the end,
+    so the time and memory grow linearly with the number of earthquakes. fetch returns the record of a url."""
+    records = []
+    pages = fetcher.imap_ordered(fetch, url_list, workers=workers, rate=rate)
+    for idx, record in enumerate(tqdm(pages, total=len(url_list))):
         logger.info(f'scraped all information for quake num {idx}')
-        table_detailed_all_earthquakes = pd.concat([table_detailed_all_earthquakes, table_detailed])
-    table_detailed_all_earthquakes["eq_id"] = id_list
+        records.append(record)
+    table_detailed_all_earthquakes = build_detailed_table(records, id_list)
     logger.info('successfully create dataframe with all earthquakes')
     return table_detailed_all_earthquakes
 
 
-def main():
+def load_earthquakes(args, ids, url_list, backend, state=None, job=None):
+    """ This function downloads the detailed pages of the earthquakes, converts them and writes them to the database.
+    By default every page is downloaded, then all are converted and written, with --processes the pages are parsed
+    and converted by a pool of processes as they are downloaded (see parallel_convert). With --stream the pages flow through
+    convert and into the database in batches of --batch_size earthquakes (see pipeline), each batch is committed
+    and recorded in the incremental state as soon as it is written. The earthquakes are written to the storage
+    backend (see storage), with the mysql backend --db_writers batches or chunks are written at the same time through
+    its pool of connections. The converted earthquakes are kept as a compact QuakeBatch (see records) until written.
+    With a journal (see journal, --resume) the detailed records are read from the journal when they were downloaded
+    by the job before and recorded in it otherwise (except with --processes), and the earthquakes are recorded as
+    committed once written: after each batch with --stream, after each chunk committed by the backend otherwise."""
+    url_of_id = dict(zip(ids, url_list))
+    fetch = job.fetcher(scrape_detail_record) if job else scrape_detail_record
+    if args.stream:
+        target = backend.pool if isinstance(backend, storage.MySQLStorage) else backend
+
+        def on_batch_written(data):
+            if target is not backend:  # written through the pool, not by the backend
+                backend.notify(data)
+            if state:
+                state.record_quakes(data.statuses())
+                state.save()
+            if job:
+                job.record_batch(data.eq_ids.tolist(), [url_of_id[eq_id] for eq_id in data.eq_ids])
+
+        pipeline.run_pipeline(ids, url_list, fetch, build_detailed_table, target,
+                              batch_size=args.batch_size, workers=args.workers, rate=args.rate,
+                              on_batch_written=on_batch_written, writers=args.db_writers)
+        return
+
+    if args.processes > 1:
+        pages = fetcher.imap_ordered(fetch_detail_page, url_list, workers=args.workers, rate=args.rate)
+        try:
+            data = parallel_convert.parse_and_convert_all(ids, pages, args.processes)
+        finally:
+            pages.close()
+    else:
+        data = QuakeBatch.from_frame(convert(scraping_with_pandas_all_earthquakes(
+            ids, url_list, workers=args.workers, rate=args.rate, fetch=fetch)))
+    logger.info(f'{len(data)} earthquakes converted, {data.memory_usage() / len(data):.0f} bytes per earthquake')
+
+    def on_commit(chunk):
+        job.record_batch(chunk.eq_ids.tolist(), [url_of_id[eq_id] for eq_id in chunk.eq_ids])
+
+    backend.write_earthquakes(data, on_commit=on_commit if job else None)
+    if state:
+        state.record_quakes(data.statuses())
+
+
+def open_backend(args):
+    """ returns the pool of database connections (None except for the mysql backend) and the storage backend selected
+    by the arguments, with the city cache preloaded when --preload_cities is given"""
+    pool = None
+    if args.backend == 'mysql':
+        pool = db_pool.ConnectionPool(size=args.db_writers, settings=db_pool.load_settings(args.db_config))
+    backend = storage.make_storage(args.backend, args.storage_path, chunk_size=args.chunk_size,
+                                   writers=args.db_writers, pool=pool)
+    logger.info(f'connect to {args.backend} storage')
+    if args.preload_cities and pool:
+        with pool.connection() as connection:
+            uptade_database.city_cache.preload(connection)
+    return pool, backend
+
+
+def apply_defaults(args):
+    """ sets the options that cli leaves to None to the defaults of the modules using them"""
+    defaults = {'timeout': http_client.DEFAULT_TIMEOUT[1], 'retries': http_client.DEFAULT_RETRIES,
+                'chunk_size': uptade_database.DEFAULT_CHUNK_SIZE, 'batch_size': pipeline.DEFAULT_BATCH_SIZE,
+                'cache_size': response_cache.DEFAULT_MAX_BYTES / 1024 / 1024,
+                'parser_cache_size': cell_parsers.DEFAULT_CACHE_SIZE}
+    for name, value in defaults.items():
+        if getattr(args, name, None) is None:
+            setattr(args, name, value)
+    return args
+
+
+def scrape(args, state=None, job=None):
+    """ scrapes the earthquakes selected by the arguments and the natural events of the API into the storage backend,
+    the incremental state and the journal of the job are updated as the earthquakes are written"""
+    with metrics.timer('stage_seconds', stage='crawl'):
+        ids, urls = scrapper_main_pages_by_dates(args, state, job)
+    logger.info('Select all quakes for scraping by arguments done.')
+    if job:
+        committed = job.committed_ids()
+        if committed:
+            kept = [(eq_id, url) for eq_id, url in zip(ids, urls) if eq_id not in committed]
+            logger.info(f'{len(ids) - len(kept)} quakes already written by job {job.job_id}, {len(kept)} left')
+            ids, urls = [eq_id for eq_id, _ in kept], [url for _, url in kept]
+
+    pool, backend = open_backend(args)
+    with backend:  # the connections are closed when a stage fails too
+        if ids:
+            with metrics.timer('stage_seconds', stage='earthquakes'):
+                load_earthquakes(args, ids, [MAIN_URL + link for link in urls], backend, state, job)
+            logger.info('database updated with all new earthquakes')
+        else:
+            logger.info('no new earthquakes to scrape')
+        if state:
+            state.close_days()
+            state.save()
+
+        ### scrapping with the API, second par of the scrapping progam.
+        # This part of the code calls another file name : API_scraper_v1, please see inside for further information
+
+        with metrics.timer('stage_seconds', stage='api'):
+            dict_of_df = API_scraper_v1.main(workers=max(args.workers, API_scraper_v1.DEFAULT_WORKERS))
+        logger.info('API scrapping done')
+        logger.info(f'http connections per host: {http_client.connection_stats()}')
+        logger.info(f'http cache: {http_client.cache_stats()}')
+        logger.info(f'cell parser caches: {cell_parsers.stats()}')
+        print('API scrapping done')
+
+        with metrics.timer('stage_seconds', stage='events'):
+            backend.write_all_events(dict_of_df)
+
+    if job:
+        job.finish()
+    logger.info('database updated successfully, connections closed')
+
+
+def run(args):
     """ This is the main function of the program : it scrapes the earthquakes website. It scraps the individual
      earthquake information and print to the stdout the data as list.
      This main function uses the mainscrapper_p1 and the pandas scaper for page 2
      """
-
-    parser = argparse.ArgumentParser(add_help=HELP_MESSAGE)
-    parser.add_argument('--date', nargs='+', action=DateAction)
-    parser.add_argument('--magnitude', nargs='+', action=MagnitudeAction)
-    parser.add_argument('--n_rows', type=int, action='store')
-
+    apply_defaults(args)
+    if args.metrics_out:
+        metrics.enable()
     try:
-        args = parser.parse_args()
-        logger.info(f'Parse user args successfully. args are: date = {args.date},'
-                    f'magnitude = {args.magnitude}, num of rows = {args.n_rows}')
-    except Exception as e:
-        print(f'Wrong arguments passed:\n{e}\nUsage instructions:\n {HELP_MESSAGE}')
-        logger.error(f'Wrong arguments passed:\n{e}')
-        sys.exit()
-
-    ids, urls = scrapper_main_pages_by_dates(args)
-    logger.info('Select all quakes for scraping by arguments done.')
-    url_list = [MAIN_URL + link for link in urls]
-    data = convert(scraping_with_pandas_all_earthquakes(ids, url_list))
-    logger.info('convert pandas dataframe columns to sql dtype')
-    data = data.astype(object).where(pd.notnull(data), None)
-
-    connection = uptade_database.get_connection()
-    logger.info('connect to database')
-    for _, row in data.iterrows():
-        logger.debug(f'updating row num {_} from date {row["Date & time"]}')
-        uptade_database.update_database(row, connection)
-    logger.info('database updated with all new earthquakes')
-
-    ### scrapping with the API, second par of the scrapping progam.
-    # This part of the code calls another file name : API_scraper_v1, please see inside for further information
-
-    dict_of_df = API_scraper_v1.main()
-    logger.info('API scrapping done')
-    print('API scrapping done')
-
-    uptade_database.update_fire(dict_of_df['Fire'], connection)
-    logger.info('database updated with fire data')
-    iceberg = dict_of_df['Fire'].astype(object).where(pd.notnull(dict_of_df['Fire']), None)
-    uptade_database.update_iceberg(iceberg, connection)
-    logger.info('database updated with iceberg data')
-    uptade_database.update_volcano(dict_of_df['Volcano'], connection)
-    logger.info('database updated with volcano data')
-
-    connection.close()
-    logger.info('database updated successfully, connection closed')
+        html_parsing.set_backend(args.parser)
+        cell_parsers.set_cache_size(args.parser_cache_size)
+        http_client.configure(pool_size=max(http_client.DEFAULT_POOL_SIZE, args.workers, args.day_workers),
+                              timeout=(http_client.DEFAULT_TIMEOUT[0], args.timeout), retries=args.retries)
+        if args.cache_dir or args.offline:
+            http_client.enable_cache(response_cache.ResponseCache(args.cache_dir or response_cache.DEFAULT_CACHE_DIR,
+                                                                  max_bytes=int(args.cache_size * 1024 * 1024),
+                                                                  offline=args.offline))
+
+        if args.daemon:
+            pool, backend = open_backend(args)
+            try:
+                run_daemon(args, backend, state_store.ScrapeState.load(args.state_file))
+            finally:
+                backend.close()
+                logger.info(f'cell parser caches: {cell_parsers.stats()}')
+                logger.info('daemon stopped, connections closed')
+            return
+
+        state = state_store.ScrapeState.load(args.state_file) if args.incremental else None
+        job = journal.Journal(args.journal_file, journal.job_params(args)) if args.resume else None
+        try:
+            scrape(args, state, job)
+        finally:  # the journal is closed when the run fails too, its job is left unfinished to be resumed
+            if job:
+                job.close()
+    finally:
+        if args.metrics_out:  # also when the run failed, the metrics tell where
+            metrics.write(args.metrics_out)
+
+
+def main(argv=None):
+    """ parses the arguments (see cli) and runs the scraper"""
+    cli.setup_logging()
+    run(cli.parse_args(argv))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,272 @@
+import csv
+import math
+import logging
+import numpy as np
+import uptade_database
+
+logger = logging.getLogger(__name__)
+
+### this file stores the spatial index of the stored earthquakes: "quakes within R km of a point", "quakes in a
+### bounding box" and "quakes near a city". SpatialIndex keeps the epicenters in memory, sorted by the cell of a
+### latitude/longitude grid, so a query only reads the cells around it and computes the haversine distance of those
+### points. It is built from the database (mysql or sqlite) or a parquet snapshot, and follows the new earthquakes when
+### it listens to a storage backend (see SpatialIndex.attach and storage.Storage.add_listener). The mysql schema also
+### has a POINT column with a SPATIAL INDEX (earthquake.sql), radius_query returns the SQL using it.
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+HALF_CIRCUMFERENCE_KM = math.pi * EARTH_RADIUS_KM
+DEFAULT_CELL_DEGREES = 1.0
+DEFAULT_MERGE_EVERY = 50000  # points added since the last build that are merged into the sorted arrays
+DEFAULT_FETCH_SIZE = 100000  # rows read from the database at a time to build the index
+SELECT_EPICENTERS = """SELECT link_id, epicenter_latitude, epicenter_longitude FROM earthquakes
+                       WHERE epicenter_latitude IS NOT NULL AND epicenter_longitude IS NOT NULL"""
+
+
+def haversine_km(lat, lon, lats, lons):
+    """ returns the great circle distances in km between the point (lat, lon) and the arrays of points (lats, lons),
+    in degrees"""
+    lat, lon = math.radians(lat), math.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat) / 2) ** 2 + math.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def radius_query(lat, lon, radius_km):
+    """ returns the mysql query (and its parameters) of the link ids and distances in km of the earthquakes within
+    radius_km of (lat, lon). The MBRContains on the bounding box of the circle uses the SPATIAL INDEX on epicenter,
+    ST_Distance_Sphere keeps the exact circle."""
+    south, west, north, east = bounding_box(lat, lon, radius_km)
+    polygon = (f'POLYGON(({south} {west}, {north} {west}, {north} {east}, {south} {east}, {south} {west}))'
+               if west <= east else None)
+    query = """SELECT link_id, ST_Distance_Sphere(epicenter, ST_SRID(POINT(%s, %s), 4326)) / 1000 AS distance
+               FROM earthquakes WHERE epicenter_latitude IS NOT NULL {box}
+               HAVING distance <= %s ORDER BY distance"""
+    if polygon is None:  # the box crosses the date line, only the distance is used
+        return query.format(box=''), (lon, lat, radius_km)
+    return (query.format(box='AND MBRContains(ST_GeomFromText(%s, 4326), epicenter)'),
+            (lon, lat, polygon, radius_km))
+
+
+def bounding_box(lat, lon, radius_km):
+    """ returns the (south, west, north, east) box in degrees around the circle of radius_km around (lat, lon). west is
+    greater than east when the box crosses the date line, the box covers all the longitudes near the poles."""
+    dlat = radius_km / KM_PER_DEGREE
+    south, north = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    widest = max(abs(south), abs(north))
+    if widest >= 90 or radius_km >= HALF_CIRCUMFERENCE_KM:
+        return south, -180.0, north, 180.0
+    dlon = math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(widest))))
+    if dlon >= 180:
+        return south, -180.0, north, 180.0
+    west, east = lon - dlon, lon + dlon
+    west = west + 360 if west < -180 else west
+    east = east - 360 if east > 180 else east
+    return south, west, north, east
+
+
+def load_cities(path):
+    """ returns {city name: (latitude, longitude)} from a csv file with the columns city_name, latitude and longitude
+    (the database only stores the distance between the earthquakes and the cities, not where the cities are)"""
+    with open(path, newline='', encoding='utf-8') as file:
+        return {row['city_name']: (float(row['latitude']), float(row['longitude'])) for row in csv.DictReader(file)}
+
+
+class SpatialIndex:
+    """ This class is the in memory spatial index of the epicenters, keyed by the link id of the earthquakes.
+    The points are sorted by the cell of a grid of cell_degrees degrees, a query reads the contiguous ranges of the
+    cells around it with searchsorted and then filters them with the exact distance. add inserts or moves earthquakes:
+    the new points wait in a dictionary (read by every query) until merge_every of them are merged into the sorted
+    arrays. cities ({name: (lat, lon)}) is used by near_city."""
+    def __init__(self, cell_degrees=DEFAULT_CELL_DEGREES, merge_every=DEFAULT_MERGE_EVERY, cities=None):
+        self.cell_degrees = cell_degrees
+        self.merge_every = merge_every
+        self.cities = dict(cities or {})
+        self.n_rows = int(math.ceil(180 / cell_degrees))
+        self.n_cols = int(math.ceil(360 / cell_degrees))
+        self.ids = np.empty(0, dtype=np.int64)
+        self.lats = np.empty(0)
+        self.lons = np.empty(0)
+        self.keys = np.empty(0, dtype=np.int64)
+        self.alive = np.empty(0, dtype=bool)
+        self.pending = {}
+
+    def __len__(self):
+        return int(self.alive.sum()) + len(self.pending)
+
+    def cell_rows(self, lats):
+        return np.clip(((np.asarray(lats) + 90) / self.cell_degrees).astype(np.int64), 0, self.n_rows - 1)
+
+    def cell_cols(self, lons):
+        return np.clip(((np.asarray(lons) + 180) / self.cell_degrees).astype(np.int64), 0, self.n_cols - 1)
+
+    def build(self, ids, lats, lons):
+        """ replaces the content of the index with the points (ids, lats, lons)"""
+        self.pending = {}
+        self._set_arrays(np.asarray(ids, dtype=np.int64), np.asarray(lats, dtype=float),
+                         np.asarray(lons, dtype=float))
+        logger.info(f'built a spatial index of {len(self.ids)} earthquakes')
+        return self
+
+    def _set_arrays(self, ids, lats, lons):
+        keep = ~(np.isnan(lats) | np.isnan(lons))
+        ids, lats, lons = ids[keep], lats[keep], lons[keep]
+        keys = self.cell_rows(lats) * self.n_cols + self.cell_cols(lons)
+        order = np.argsort(keys, kind='stable')
+        self.ids, self.lats, self.lons, self.keys = ids[order], lats[order], lons[order], keys[order]
+        self.alive = np.ones(len(ids), dtype=bool)
+
+    def add(self, ids, lats, lons):
+        """ inserts the earthquakes, or moves them if they are already in the index"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            return
+        if len(self.ids):
+            self.alive &= ~np.isin(self.ids, ids)
+        self.pending.update(zip(ids.tolist(), zip(np.asarray(lats, dtype=float).tolist(),
+                                                  np.asarray(lons, dtype=float).tolist())))
+        if len(self.pending) >= self.merge_every:
+            self.merge()
+
+    def add_table(self, df):
+        """ adds the earthquakes of a converted dataframe (eq_id and 'Epicenter latitude / longitude', as written by
+        the storage backends) or of a table of the database (link_id, epicenter_latitude, epicenter_longitude)"""
+        if 'link_id' in df:
+            self.add(df['link_id'], df['epicenter_latitude'].astype(float), df['epicenter_longitude'].astype(float))
+            return
+        points = [(uptade_database.get_link_id(eq_id), coordinates[0], coordinates[1])
+                  for eq_id, coordinates in zip(df['eq_id'], df['Epicenter latitude / longitude'])
+                  if coordinates is not None and coordinates[0] is not None and coordinates[1] is not None]
+        if points:
+            ids, lats, lons = zip(*points)
+            self.add(ids, lats, lons)
+
+    def merge(self):
+        """ merges the pending points into the sorted arrays"""
+        if not self.pending:
+            return
+        ids = np.fromiter(self.pending.keys(), dtype=np.int64, count=len(self.pending))
+        points = np.array(list(self.pending.values()), dtype=float).reshape(-1, 2)
+        self._set_arrays(np.concatenate([self.ids[self.alive], ids]),
+                         np.concatenate([self.lats[self.alive], points[:, 0]]),
+                         np.concatenate([self.lons[self.alive], points[:, 1]]))
+        self.pending = {}
+
+    def _candidates(self, south, west, north, east):
+        """ returns the positions in the sorted arrays of the points of the cells covering the box (west > east when
+        it crosses the date line)"""
+        rows = np.arange(self.cell_rows(south), self.cell_rows(north) + 1)
+        if west <= east:
+            col_ranges = [(self.cell_cols(west), self.cell_cols(east))]
+        else:
+            col_ranges = [(self.cell_cols(west), self.n_cols - 1), (0, self.cell_cols(east))]
+        starts, ends = [], []
+        for first, last in col_ranges:
+            starts.append(np.searchsorted(self.keys, rows * self.n_cols + first, side='left'))
+            ends.append(np.searchsorted(self.keys, rows * self.n_cols + last, side='right'))
+        starts, ends = np.concatenate(starts), np.concatenate(ends)
+        lengths = ends - starts
+        if not lengths.sum():
+            return np.empty(0, dtype=np.int64)
+        # the positions start..end-1 of every range, without a python loop
+        offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        positions = np.arange(lengths.sum()) + offsets
+        return positions[self.alive[positions]]
+
+    def _points(self, south, west, north, east):
+        """ returns the ids, latitudes and longitudes of the indexed and pending points of the cells of the box"""
+        positions = self._candidates(south, west, north, east)
+        ids, lats, lons = self.ids[positions], self.lats[positions], self.lons[positions]
+        if self.pending:
+            pending_ids = np.fromiter(self.pending.keys(), dtype=np.int64, count=len(self.pending))
+            points = np.array(list(self.pending.values()), dtype=float).reshape(-1, 2)
+            ids = np.concatenate([ids, pending_ids])
+            lats, lons = np.concatenate([lats, points[:, 0]]), np.concatenate([lons, points[:, 1]])
+        return ids, lats, lons
+
+    def within(self, lat, lon, radius_km):
+        """ returns the ids and distances in km of the earthquakes within radius_km of (lat, lon), nearest first"""
+        ids, lats, lons = self._points(*bounding_box(lat, lon, radius_km))
+        distances = haversine_km(lat, lon, lats, lons)
+        inside = distances <= radius_km
+        ids, distances = ids[inside], distances[inside]
+        order = np.argsort(distances, kind='stable')
+        return ids[order], distances[order]
+
+    def in_box(self, south, west, north, east):
+        """ returns the ids of the earthquakes in the box, in degrees. west is greater than east for a box crossing the
+        date line."""
+        ids, lats, lons = self._points(south, west, north, east)
+        inside_lon = (lons >= west) & (lons <= east) if west <= east else (lons >= west) | (lons <= east)
+        return ids[(lats >= south) & (lats <= north) & inside_lon]
+
+    def nearest(self, lat, lon, k=10):
+        """ returns the ids and distances in km of the k earthquakes nearest to (lat, lon)"""
+        radius = self.cell_degrees * KM_PER_DEGREE
+        while True:
+            ids, distances = self.within(lat, lon, radius)
+            if len(ids) >= k or radius >= HALF_CIRCUMFERENCE_KM:
+                return ids[:k], distances[:k]
+            radius *= 2
+
+    def near_city(self, city, radius_km):
+        """ returns the ids and distances in km of the earthquakes within radius_km of a city of self.cities"""
+        if city not in self.cities:
+            raise KeyError(f'no coordinates for the city {city}, add them to the cities of the index')
+        return self.within(*self.cities[city], radius_km)
+
+    def listen(self, df):
+        """ the listener of a storage backend (storage.Storage.add_listener): adds the earthquakes it wrote"""
+        self.add_table(df)
+
+    @classmethod
+    def from_connection(cls, connection, fetch_size=DEFAULT_FETCH_SIZE, **kwargs):
+        """ builds the index from the earthquakes table of a database connection: a pymysql connection (DictCursor)
+        or a sqlite3 connection (SQLiteStorage.connection), read fetch_size rows at a time"""
+        ids, lats, lons = [], [], []
+        cursor = connection.cursor()
+        try:
+            cursor.execute(SELECT_EPICENTERS)
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                if isinstance(rows[0], dict):
+                    rows = [(row['link_id'], row['epicenter_latitude'], row['epicenter_longitude']) for row in rows]
+                part = np.array(rows, dtype=float).reshape(-1, 3)
+                ids.append(part[:, 0].astype(np.int64))
+                lats.append(part[:, 1])
+                lons.append(part[:, 2])
+        finally:
+            cursor.close()
+        if not ids:
+            return cls(**kwargs)
+        return cls(**kwargs).build(np.concatenate(ids), np.concatenate(lats), np.concatenate(lons))
+
+    @classmethod
+    def from_parquet(cls, parquet_storage, **kwargs):
+        """ builds the index from the earthquakes table of a storage.ParquetStorage"""
+        df = parquet_storage.read_table('earthquakes')
+        if not len(df):
+            return cls(**kwargs)
+        return cls(**kwargs).build(df['link_id'].to_numpy(), df['epicenter_latitude'].astype(float).to_numpy(),
+                                   df['epicenter_longitude'].astype(float).to_numpy())
+
+    @classmethod
+    def from_storage(cls, backend, **kwargs):
+        """ builds the index from any storage backend (see storage)"""
+        if backend.name == 'parquet':
+            return cls.from_parquet(backend, **kwargs)
+        if backend.name == 'sqlite':
+            return cls.from_connection(backend.connection, **kwargs)
+        with backend.pool.connection() as connection:
+            return cls.from_connection(connection, **kwargs)
+
+    @classmethod
+    def attach(cls, backend, **kwargs):
+        """ builds the index from a storage backend and registers it as a listener of the backend, so that it also holds
+        the earthquakes written through the backend from now on (the batches of --stream included)"""
+        index = cls.from_storage(backend, **kwargs)
+        backend.add_listener(index.listen)
+        logger.info(f'spatial index of {len(index)} earthquakes attached to the {backend.name} storage')
+        return index
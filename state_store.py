@@ -0,0 +1,121 @@
+import json
+import os
+import re
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+### this file stores the local state of the incremental mode of the scraper: the status of every earthquake already
+### written to the database and, for every archive day, the earthquakes it listed. It lets the scraper skip the
+### detailed pages of the earthquakes that are final and the archive days that are closed. The status of an earthquake
+### is only kept while its day can still be scraped (the day is open or it is listed on today.html), so the state does
+### not grow with every day scraped or every poll of the daemon.
+
+DEFAULT_STATE_FILE = 'scraper_state.json'
+CLOSE_AFTER_DAYS = 2  # an archive day can still change during the 2 days after it
+DAY_URL_REGEX = re.compile(r'(\d{4}-[a-z]{3}-\d{2})\.html$', re.IGNORECASE)
+
+
+def day_of_url(url):
+    """ returns the date of an archive day url, or None for the pages that are not an archive day (today.html)"""
+    match = DAY_URL_REGEX.search(url)
+    if not match:
+        return None
+    return datetime.strptime(match.group(1), '%Y-%b-%d')
+
+
+def magnitude_covers(stored, requested):
+    """ returns True if the earthquakes selected with the stored magnitude range include all the earthquakes selected
+    with the requested one. A range is None (no filter) or (from_magnitude, to_magnitude or None)."""
+    if stored is None:
+        return True
+    if requested is None:
+        return False
+    if requested[0] < stored[0]:
+        return False
+    return stored[1] is None or (requested[1] is not None and requested[1] <= stored[1])
+
+
+class ScrapeState:
+    """ This class holds the state of the incremental scraping and saves it in a json file.
+    quakes: {eq_id: True if the status of the earthquake is confirmed (final), False otherwise}
+    days: {day url: {'ids': eq_ids listed that day (emptied when the day is closed),
+                     'high_water_mark': number of earthquakes listed that day,
+                     'magnitude': magnitude range used to select the ids, 'complete': True if the day is closed}}"""
+    def __init__(self, path=DEFAULT_STATE_FILE, quakes=None, days=None):
+        self.path = path
+        self.quakes = quakes or {}
+        self.days = days or {}
+
+    @classmethod
+    def load(cls, path=DEFAULT_STATE_FILE):
+        """ loads the state saved in path, or returns an empty state if there is no such file"""
+        if not os.path.exists(path):
+            logger.info(f'no state file {path}, start a new incremental state')
+            return cls(path)
+        with open(path) as state_file:
+            state = json.load(state_file)
+        logger.info(f'loaded incremental state from {path}: {len(state["quakes"])} quakes, {len(state["days"])} days')
+        return cls(path, state['quakes'], state['days'])
+
+    def save(self):
+        """ saves the state, the file is replaced atomically so that a crash can not leave it half written"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as state_file:
+            json.dump({'quakes': self.quakes, 'days': self.days}, state_file)
+        os.replace(tmp_path, self.path)
+        logger.info(f'saved incremental state to {self.path}')
+
+    def is_final(self, eq_id):
+        """ returns True if the earthquake is already in the database with a confirmed status"""
+        return self.quakes.get(eq_id) is True
+
+    def is_day_closed(self, url, magnitude=None):
+        """ returns True if the archive day was already scraped completely with a magnitude range covering the
+        requested one, so it does not need to be scraped again"""
+        day = self.days.get(url)
+        return bool(day and day['complete'] and magnitude_covers(day['magnitude'], magnitude))
+
+    def record_day(self, url, eq_ids, n_listed, magnitude=None):
+        """ records the earthquakes selected from an archive day and the number of earthquakes listed that day"""
+        previous = self.days.get(url)
+        if previous and n_listed > previous['high_water_mark']:
+            logger.info(f'{n_listed - previous["high_water_mark"]} new earthquakes listed on {url}')
+        self.days[url] = {'ids': list(eq_ids), 'high_water_mark': n_listed,
+                          'magnitude': list(magnitude) if magnitude else None, 'complete': False}
+
+    def record_quakes(self, statuses):
+        """ records the status of the earthquakes written to the database, statuses is {eq_id: confirmed}"""
+        self.quakes.update({eq_id: bool(confirmed) for eq_id, confirmed in statuses.items()})
+
+    def forget_quakes(self, eq_ids):
+        """ drops the status of the earthquakes"""
+        for eq_id in eq_ids:
+            self.quakes.pop(eq_id, None)
+
+    def prune(self, listed):
+        """ drops the status of the earthquakes that are neither in listed nor listed by an archive day still open.
+        The daemon calls it with the earthquakes of today.html, the ones that left the page are not polled anymore.
+        Returns the number of earthquakes dropped."""
+        keep = set(listed)
+        for day in self.days.values():
+            if not day['complete']:
+                keep.update(day['ids'])
+        dropped = [eq_id for eq_id in self.quakes if eq_id not in keep]
+        self.forget_quakes(dropped)
+        return len(dropped)
+
+    def close_days(self, today=None):
+        """ marks as complete the archive days older than CLOSE_AFTER_DAYS whose earthquakes are all final. A closed
+        day is not scraped again, so the status of its earthquakes is dropped with its list of ids."""
+        today = today or datetime.now()
+        for url, day in self.days.items():
+            date = day_of_url(url)
+            if day['complete'] or date is None or today - date < timedelta(days=CLOSE_AFTER_DAYS):
+                continue
+            if all(self.is_final(eq_id) for eq_id in day['ids']):
+                day['complete'] = True
+                self.forget_quakes(day['ids'])
+                day['ids'] = []
+                logger.info(f'archive day {url} is closed')
@@ -0,0 +1,361 @@
+import abc
+import os
+import sqlite3
+import threading
+import logging
+from datetime import date, datetime
+import pandas as pd
+import db_pool
+import metrics
+import records
+import uptade_database
+
+logger = logging.getLogger(__name__)
+
+### this file stores the storage backends of the scraper. The converted earthquakes and the natural events of the API
+### are written through a Storage: MySQLStorage writes to the project database (see uptade_database), SQLiteStorage to
+### a local sqlite file and ParquetStorage to a folder of parquet files, to run full loads without the remote database
+### (tests, benchmarks) and to feed analytics without querying it.
+
+BACKENDS = ('mysql', 'sqlite', 'parquet')
+DEFAULT_BACKEND = 'mysql'
+DEFAULT_SQLITE_FILE = 'earthquakes.db'
+DEFAULT_PARQUET_DIR = 'earthquakes_parquet'
+# sqlite accepts at most 999 variables in a statement in old versions
+SQLITE_MAX_VARIABLES = 999
+# the arrow type of each column of the parquet tables, the files of a table must share their schema: a column that is
+# all null in a file would be of type null otherwise, and the folder could not be read anymore
+PARQUET_EVENT_TYPES = {'latitude': 'double', 'longitude': 'double', 'magnitude_value': 'double', 'date_time': 'date32'}
+PARQUET_TYPES = {'earthquakes': {'link_id': 'int64', 'date_time': 'timestamp[ns]', 'local_time_at_epicenter': 'string',
+                                 'status': 'int64', 'magnitude': 'double', 'depth': 'double',
+                                 'epicenter_latitude': 'double', 'epicenter_longitude': 'double',
+                                 'antipode_latitude': 'double', 'antipode_longitude': 'double',
+                                 'shaking_intensity': 'int64', 'felt': 'int64', 'primary_data_source': 'string',
+                                 'nearest_volcano': 'string', 'estimated_seismic_energy': 'double'},
+                 'eq_cities': {'link_id': 'int64', 'city_name': 'string', 'population': 'int64', 'distance': 'int64'},
+                 'eq_hazard_links': {'link_id': 'int64', 'hazard_table': 'string', 'eonet_id': 'int64',
+                                     'distance_km': 'double', 'days_apart': 'double'},
+                 **{table: {'eonet_id': 'int64', **{column: PARQUET_EVENT_TYPES.get(column, 'string')
+                                                    for column in columns}}
+                    for table, columns in uptade_database.EVENT_TABLES.items()}}
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS earthquakes(id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                       link_id INTEGER UNIQUE,
+                                       date_time TEXT,
+                                       local_time_at_epicenter TEXT,
+                                       status INTEGER,
+                                       magnitude REAL,
+                                       depth REAL,
+                                       epicenter_latitude REAL,
+                                       epicenter_longitude REAL,
+                                       antipode_latitude REAL,
+                                       antipode_longitude REAL,
+                                       shaking_intensity INTEGER,
+                                       felt INTEGER,
+                                       primary_data_source TEXT,
+                                       nearest_volcano TEXT,
+                                       estimated_seismic_energy TEXT);
+CREATE TABLE IF NOT EXISTS cities(id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                  city_name TEXT UNIQUE,
+                                  population INTEGER);
+CREATE TABLE IF NOT EXISTS eq_cities(id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                     eq_id INTEGER,
+                                     city_id INTEGER,
+                                     distance REAL,
+                                     UNIQUE (eq_id, city_id));
+CREATE TABLE IF NOT EXISTS fire(id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                eonet_id INTEGER UNIQUE,
+                                fire_name TEXT,
+                                latitude REAL,
+                                longitude REAL,
+                                date_time TEXT);
+CREATE TABLE IF NOT EXISTS iceberg(id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                   eonet_id INTEGER UNIQUE,
+                                   iceberg_name TEXT,
+                                   magnitude_value REAL,
+                                   magnitude_unit TEXT,
+                                   date_time TEXT);
+CREATE TABLE IF NOT EXISTS volcano(id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                   eonet_id INTEGER UNIQUE,
+                                   volcano_name TEXT,
+                                   latitude REAL,
+                                   longitude REAL,
+                                   date_time TEXT);
+CREATE TABLE IF NOT EXISTS eq_hazard_links(id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                           link_id INTEGER,
+                                           hazard_table TEXT,
+                                           eonet_id INTEGER,
+                                           distance_km REAL,
+                                           days_apart REAL,
+                                           UNIQUE (link_id, hazard_table, eonet_id));
+"""
+
+
+def sqlite_value(value):
+    """ returns the value as stored by sqlite: the dates and datetimes as ISO text"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat(sep=' ') if isinstance(value, datetime) else value.isoformat()
+    return value
+
+
+class Storage(abc.ABC):
+    """ This class is the interface of the storage backends, a backend that does not implement all the write methods can
+    not be created. write_earthquakes writes a records.QuakeBatch or a converted dataframe of earthquakes (the output of
+    cleaning_converting.convert) and write_events writes a dataframe of natural events of the API to one of the tables
+    of uptade_database.EVENT_TABLES. Both return the number of rows written and replace the rows already stored with the
+    same id. write_earthquakes calls on_commit with each chunk (a QuakeBatch) once it is committed, so that a journal
+    can record the earthquakes stored before a crash. The listeners (add_listener) are called with the table
+    (uptade_database.EARTHQUAKE_COLUMNS) of each batch of earthquakes once it is written, to keep derived data up to
+    date (see spatial_index)."""
+    name = None
+    listeners = ()
+
+    def add_listener(self, callback):
+        """ calls callback(df) after each dataframe of earthquakes written"""
+        self.listeners = list(self.listeners) + [callback]
+
+    def notify(self, batch):
+        if not self.listeners:
+            return
+        table = batch.to_table()
+        for callback in self.listeners:
+            callback(table)
+
+    @abc.abstractmethod
+    def write_earthquakes(self, df, on_commit=None):
+        pass
+
+    @abc.abstractmethod
+    def write_events(self, df, table):
+        pass
+
+    @abc.abstractmethod
+    def write_hazard_links(self, df):
+        """ writes the pairs of earthquakes and events found by hazard_join (uptade_database.HAZARD_LINK_COLUMNS)"""
+
+    def write_all_events(self, dict_of_df):
+        """ writes every kind of event of uptade_database.EVENT_TABLE_BY_TYPE found in the dictionary returned by
+        API_scraper_v1.main to its table"""
+        for event_type, table in uptade_database.EVENT_TABLE_BY_TYPE.items():
+            if event_type in dict_of_df:
+                self.write_events(dict_of_df[event_type], table)
+                logger.info(f'{self.name} storage updated with {event_type} data')
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class MySQLStorage(Storage):
+    """ the project MySQL database, written through a db_pool.ConnectionPool: the chunks of earthquakes are written by
+    writers connections at the same time (see uptade_database.upsert_earthquakes_parallel)"""
+    name = 'mysql'
+
+    def __init__(self, pool=None, chunk_size=uptade_database.DEFAULT_CHUNK_SIZE, writers=1):
+        self.pool = pool or db_pool.ConnectionPool(size=writers)
+        self.chunk_size = chunk_size
+        self.writers = writers
+
+    def write_earthquakes(self, df, on_commit=None):
+        batch = records.QuakeBatch.of(df)
+        written = uptade_database.upsert_earthquakes_parallel(batch, self.pool, chunk_size=self.chunk_size,
+                                                              writers=self.writers, on_commit=on_commit)
+        self.notify(batch)
+        return written
+
+    def write_events(self, df, table):
+        with self.pool.connection() as connection:
+            return uptade_database.upsert_events(df, connection, table, chunk_size=self.chunk_size)
+
+    def write_hazard_links(self, df):
+        with self.pool.connection() as connection:
+            return uptade_database.upsert_hazard_links(df, connection, chunk_size=self.chunk_size)
+
+    def close(self):
+        self.pool.close()
+
+
+class SQLiteStorage(Storage):
+    """ a local sqlite database with the same tables as earthquake.sql. It runs in WAL mode and writes chunk_size
+    earthquakes per transaction. The connection is shared by the threads of the scraper (one writer at a time)."""
+    name = 'sqlite'
+
+    def __init__(self, path=DEFAULT_SQLITE_FILE, chunk_size=uptade_database.DEFAULT_CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SQLITE_SCHEMA)
+
+    def select_ids(self, table, key, names):
+        """ returns {key: id} of the rows of table with the given keys, in as few queries as sqlite allows"""
+        ids = {}
+        names = list(names)
+        for start in range(0, len(names), SQLITE_MAX_VARIABLES):
+            part = names[start:start + SQLITE_MAX_VARIABLES]
+            ids.update(self.connection.execute(f"select {key}, id from {table} where {key} in "
+                                               f"({', '.join(['?'] * len(part))})", part).fetchall())
+        return ids
+
+    def write_earthquakes(self, df, on_commit=None):
+        columns = uptade_database.EARTHQUAKE_COLUMNS
+        upsert = f"""INSERT INTO earthquakes ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})
+                     ON CONFLICT(link_id) DO UPDATE SET
+                     {', '.join(f'{column} = excluded.{column}' for column in columns[1:])}"""
+        batch = records.QuakeBatch.of(df)
+        with self._lock:
+            for start in range(0, len(batch), self.chunk_size):
+                chunk = batch[start:start + self.chunk_size]
+                values = [tuple(map(sqlite_value, row)) for row in chunk.earthquake_rows()]
+                cities = chunk.city_rows()
+                with self.connection:
+                    self.connection.executemany(upsert, values)
+                    if cities:
+                        self.connection.executemany("INSERT OR IGNORE INTO cities (city_name, population) "
+                                                    "VALUES (?, ?)", [(city[1], city[2]) for city in cities])
+                        eq_ids = self.select_ids('earthquakes', 'link_id', {city[0] for city in cities})
+                        city_ids = self.select_ids('cities', 'city_name', {city[1] for city in cities})
+                        self.connection.executemany("""INSERT INTO eq_cities (eq_id, city_id, distance)
+                                                       VALUES (?, ?, ?) ON CONFLICT(eq_id, city_id)
+                                                       DO UPDATE SET distance = excluded.distance""",
+                                                    [(eq_ids[city[0]], city_ids[city[1]], city[3])
+                                                     for city in cities])
+                metrics.inc('db_commits_total', table='earthquakes', backend=self.name)
+                metrics.observe('db_rows_per_commit', len(chunk), table='earthquakes', backend=self.name)
+                if on_commit:
+                    on_commit(chunk)
+        logger.info(f'wrote {len(batch)} earthquakes to {self.path}')
+        self.notify(batch)
+        return len(batch)
+
+    def write_events(self, df, table):
+        columns = uptade_database.EVENT_TABLES[table]
+        table_columns = ['eonet_id'] + list(columns)
+        rows = uptade_database.event_rows(df, columns) if len(df) else []
+        with self._lock, self.connection:
+            self.connection.executemany(f"""INSERT INTO {table} ({', '.join(table_columns)})
+                                            VALUES ({', '.join(['?'] * len(table_columns))})
+                                            ON CONFLICT(eonet_id) DO UPDATE SET
+                                            {', '.join(f'{column} = excluded.{column}' for column in columns)}""",
+                                        [tuple(map(sqlite_value, row)) for row in rows])
+        metrics.inc('db_commits_total', table=table, backend=self.name)
+        metrics.observe('db_rows_per_commit', len(rows), table=table, backend=self.name)
+        logger.info(f'wrote {len(rows)} events to the {table} table of {self.path}')
+        return len(rows)
+
+    def write_hazard_links(self, df):
+        columns = uptade_database.HAZARD_LINK_COLUMNS
+        rows = list(df[list(columns)].itertuples(index=False, name=None))
+        with self._lock:
+            for start in range(0, len(rows), self.chunk_size):
+                with self.connection:
+                    self.connection.executemany(f"""INSERT INTO eq_hazard_links ({', '.join(columns)})
+                                                    VALUES ({', '.join(['?'] * len(columns))})
+                                                    ON CONFLICT(link_id, hazard_table, eonet_id) DO UPDATE SET
+                                                    distance_km = excluded.distance_km,
+                                                    days_apart = excluded.days_apart""",
+                                                [(int(link_id), table, int(eonet_id), float(distance), float(apart))
+                                                 for link_id, table, eonet_id, distance, apart
+                                                 in rows[start:start + self.chunk_size]])
+                metrics.inc('db_commits_total', table='eq_hazard_links', backend=self.name)
+        logger.info(f'wrote {len(rows)} links between earthquakes and events to {self.path}')
+        return len(rows)
+
+    def close(self):
+        self.connection.close()
+
+
+class ParquetStorage(Storage):
+    """ a folder of parquet files, one sub folder per table (earthquakes, eq_cities and the tables of the events).
+    Each write adds a new file to the folder of the table, the files are never rewritten: read_table keeps the last
+    version of each row. pyarrow is only needed (and imported) when this backend is used."""
+    name = 'parquet'
+
+    def __init__(self, directory=DEFAULT_PARQUET_DIR):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as error:
+            raise ImportError('the parquet storage needs pyarrow: pip install pyarrow') from error
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.directory = directory
+        self.run_id = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        self._parts = 0
+        self._lock = threading.Lock()
+
+    def write_table(self, table, df):
+        """ writes the dataframe as a new file of the folder of table"""
+        with self._lock:
+            self._parts += 1
+            part = self._parts
+        os.makedirs(os.path.join(self.directory, table), exist_ok=True)
+        path = os.path.join(self.directory, table, f'part-{self.run_id}-{part:05d}.parquet')
+        self.pq.write_table(self.pa.Table.from_pandas(df, schema=self.schema(table), preserve_index=False), path)
+        return path
+
+    def schema(self, table):
+        """ returns the arrow schema of table (see PARQUET_TYPES)"""
+        return self.pa.schema([(column, self.pa.type_for_alias(type_name))
+                               for column, type_name in PARQUET_TYPES[table].items()])
+
+    def write_earthquakes(self, df, on_commit=None):
+        if not len(df):
+            return 0
+        batch = records.QuakeBatch.of(df)
+        self.write_table('earthquakes', batch.to_table())
+        cities = batch.city_rows()
+        if cities:
+            self.write_table('eq_cities', pd.DataFrame(cities, columns=['link_id', 'city_name', 'population',
+                                                                        'distance']))
+        logger.info(f'wrote {len(batch)} earthquakes to {self.directory}')
+        if on_commit:
+            on_commit(batch)
+        self.notify(batch)
+        return len(batch)
+
+    def write_events(self, df, table):
+        columns = uptade_database.EVENT_TABLES[table]
+        rows = uptade_database.event_rows(df, columns) if len(df) else []
+        if rows:
+            self.write_table(table, pd.DataFrame(rows, columns=['eonet_id'] + list(columns)))
+        logger.info(f'wrote {len(rows)} events to {self.directory}/{table}')
+        return len(rows)
+
+    def write_hazard_links(self, df):
+        if len(df):
+            self.write_table('eq_hazard_links', df[list(uptade_database.HAZARD_LINK_COLUMNS)])
+        return len(df)
+
+    def read_table(self, table):
+        """ returns the dataframe of all the rows of table, only the last version of each earthquake or event is
+        kept"""
+        path = os.path.join(self.directory, table)
+        if not os.path.isdir(path):
+            return pd.DataFrame()
+        df = self.pq.read_table(path, schema=self.schema(table)).to_pandas()
+        key = {'earthquakes': ['link_id'], 'eq_cities': ['link_id', 'city_name'],
+               'eq_hazard_links': ['link_id', 'hazard_table', 'eonet_id']}.get(table, ['eonet_id'])
+        return df.drop_duplicates(key, keep='last').reset_index(drop=True)
+
+
+def make_storage(backend=DEFAULT_BACKEND, path=None, chunk_size=uptade_database.DEFAULT_CHUNK_SIZE, writers=1,
+                 pool=None):
+    """ returns the storage backend of the given name. path is the sqlite file or the parquet folder, pool the
+    db_pool.ConnectionPool of the mysql backend (one is opened with the settings of db_pool.load_settings by
+    default)."""
+    if backend == 'mysql':
+        return MySQLStorage(pool, chunk_size=chunk_size, writers=writers)
+    if backend == 'sqlite':
+        return SQLiteStorage(path or DEFAULT_SQLITE_FILE, chunk_size=chunk_size)
+    if backend == 'parquet':
+        return ParquetStorage(path or DEFAULT_PARQUET_DIR)
+    raise ValueError(f'unknown storage backend {backend}, expected one of {BACKENDS}')
@@ -0,0 +1,12 @@
+import pytest
+import http_client
+from benchmarks.fixture_server import FixtureServer, SyntheticSite, patch_urls
+
+
+@pytest.fixture
+def site():
+    """ a local server of 3 synthetic archive days of 20 earthquakes each, the scraper pointed at it"""
+    http_client.enable_cache(None)
+    with FixtureServer(SyntheticSite(n_days=3, quakes_per_day=20, events_per_category=5)) as server:
+        with patch_urls(server.base_url):
+            yield server
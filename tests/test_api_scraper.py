@@ -0,0 +1,16 @@
+""" tests of the EONET scraper against the local server"""
+import API_scraper_v1
+
+
+def test_each_category_is_fetched_and_routed_once(site, monkeypatch):
+    urls = []
+    get_category_events = API_scraper_v1.get_category_events
+    monkeypatch.setattr(API_scraper_v1, 'get_category_events',
+                        lambda url: urls.append(url) or get_category_events(url))
+    dict_of_df = API_scraper_v1.main()
+    categories = [url.split('category=')[1] for url in urls]
+    assert sorted(categories) == sorted(set(API_scraper_v1.CATEGORIES.values()))
+    assert sorted(dict_of_df) == sorted(API_scraper_v1.CATEGORIES)
+    assert len(dict_of_df['Iceberg']) == 5
+    ids = [eonet_id for df in dict_of_df.values() for eonet_id in df['id']]
+    assert len(ids) == len(set(ids))
@@ -0,0 +1,67 @@
+""" tests of cleaning_converting.convert against convert_rowwise, the first version that parses the cells one by one
+(frozen in benchmarks.reference_convert)"""
+import numpy as np
+import pandas as pd
+import pytest
+from benchmarks.bench_convert import check_parity
+from benchmarks.synthetic import detail_record, detail_records, quake_ids
+from benchmarks.reference_convert import convert_rowwise
+from cleaning_converting import convert
+from scraper import build_detailed_table
+
+
+def edge_records():
+    """ records with the cells that can be missing on the website: unknown magnitude, no felt reports, no energy, no
+    nearby cities, and all of them at once"""
+    edits = [{'Magnitude': 'unknown'},
+             {'Felt': np.nan},
+             {'Estimated seismic energy released': np.nan},
+             {'Nearby towns and cities': np.nan},
+             {'Magnitude': 'unknown', 'Felt': np.nan, 'Estimated seismic energy released': np.nan,
+              'Nearby towns and cities': np.nan}]
+    return [{**detail_record(1000 + index), **edit} for index, edit in enumerate(edits)]
+
+
+def both_versions(records):
+    table = build_detailed_table(records, quake_ids(len(records)))
+    with pd.option_context('mode.chained_assignment', None):
+        return convert_rowwise(table.copy()), convert(table.copy())
+
+
+@pytest.mark.parametrize('records', [detail_records(500), edge_records(), detail_records(50) + edge_records()],
+                         ids=['synthetic', 'edge', 'mixed'])
+def test_parity_with_rowwise(records):
+    rowwise, vectorized = both_versions(records)
+    check_parity(rowwise, vectorized)
+
+
+def test_edge_values():
+    _, converted = both_versions(edge_records())
+    assert np.isnan(converted['Magnitude'][0])
+    assert converted['Felt'][1] == 0
+    assert np.isnan(converted['Estimated seismic energy released'][2])
+    assert converted['Nearby towns and cities'][3] is np.nan
+    assert isinstance(converted['Nearby towns and cities'][0], list)
+
+
+def test_unknown_intensity_raises():
+    records = detail_records(3)
+    records[1] = {**records[1], 'Shaking intensity': 'Apocalyptic shaking'}
+    table = build_detailed_table(records, quake_ids(3))
+    with pytest.raises(KeyError, match='Apocalyptic shaking'):
+        convert(table.copy())
+
+
+def test_cells_that_do_not_match_are_nan():
+    records = detail_records(3)
+    records[0] = {**records[0], 'Antipode': 'unknown', 'Estimated seismic energy released': 'unknown'}
+    records[1] = {**records[1], 'Epicenter latitude / longitude': 'somewhere at sea'}
+    table = build_detailed_table(records, quake_ids(3))
+    with pd.option_context('mode.chained_assignment', None):
+        converted = convert(table.copy())
+    assert np.isnan(converted['Antipode'][0]).all()
+    assert np.isnan(converted['Estimated seismic energy released'][0])
+    assert np.isnan(converted['Epicenter latitude / longitude'][1]).all()
+    assert not np.isnan(converted['Epicenter latitude / longitude'][0]).any()
+    assert not np.isnan(converted['Antipode'][1]).any()
+    assert not np.isnan(converted['Estimated seismic energy released'][2])
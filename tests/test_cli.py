@@ -0,0 +1,15 @@
+""" tests of the validation of the arguments of the scraper"""
+import pytest
+import cli
+
+
+@pytest.mark.parametrize('argv', [['--stream', '--processes', '2'], ['--workers', '0'], ['--rate', '0'],
+                                  ['--preload_cities', '--backend', 'sqlite']])
+def test_rejected_arguments(argv):
+    with pytest.raises(SystemExit):
+        cli.parse_args(argv)
+
+
+@pytest.mark.parametrize('argv', [['--stream'], ['--processes', '4'], ['--stream', '--processes', '1']])
+def test_accepted_arguments(argv):
+    cli.parse_args(argv)
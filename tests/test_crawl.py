@@ -0,0 +1,30 @@
+""" tests of the crawl of the archive days of a date range against the local site"""
+import pytest
+import cli
+import scraper
+from benchmarks.synthetic import quake_ids
+
+DATES = ['--date', '01/11/2022', '03/11/2022']
+
+
+def crawl(argv):
+    return scraper.scrapper_main_pages_by_dates(cli.parse_args(DATES + argv))
+
+
+@pytest.mark.parametrize('day_workers', ['1', '3'])
+def test_days_in_date_order(site, day_workers):
+    ids, urls = crawl(['--day_workers', day_workers])
+    assert ids == quake_ids(60)
+    assert urls == [f'earthquakes/quake-info/{eq_id.split("-")[-1]}.html' for eq_id in ids]
+
+
+@pytest.mark.parametrize('n_rows, days', [(10, 1), (25, 2)])
+def test_n_rows_stops_the_remaining_days(site, n_rows, days):
+    ids, _ = crawl(['--n_rows', str(n_rows)])
+    assert ids == quake_ids(n_rows)
+    assert site.requests == 2 * days  # the archive page and the "show more" page of each day crawled
+
+
+def test_n_rows_with_day_workers(site):
+    ids, _ = crawl(['--n_rows', '25', '--day_workers', '3'])
+    assert ids == quake_ids(25)
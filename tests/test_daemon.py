@@ -0,0 +1,106 @@
+""" tests of the daemon mode (--daemon): what SeenItems sends to be written again, and the polls of Daemon"""
+import pytest
+import cli
+import daemon
+import scraper
+import state_store
+import storage
+
+
+def test_new_items_are_changed_unless_final():
+    seen = daemon.SeenItems()
+    assert seen.changed({'a': '4.1', 'b': '3.0'}, is_final=lambda key: key == 'b') == ['a']
+
+
+def test_unchanged_items_are_not_written_again():
+    seen = daemon.SeenItems()
+    seen.changed({'a': '4.1'}, now=100)
+    seen.mark_written(['a'], now=100)
+    assert seen.changed({'a': '4.1'}, now=200) == []
+
+
+def test_changed_signature():
+    seen = daemon.SeenItems()
+    seen.changed({'a': '4.1', 'b': '3.0'})
+    assert seen.changed({'a': '4.3', 'b': '3.0'}, is_final=lambda key: True) == ['a']
+
+
+def test_refresh_due_only_for_items_not_final():
+    seen = daemon.SeenItems(refresh=60)
+    seen.changed({'a': '4.1', 'b': '3.0'}, now=100)
+    seen.mark_written(['a', 'b'], now=100)
+    final = {'b'}.__contains__
+    assert seen.changed({'a': '4.1', 'b': '3.0'}, final, now=150) == []
+    assert seen.changed({'a': '4.1', 'b': '3.0'}, final, now=161) == ['a']
+    seen.mark_written(['a'], now=161)
+    assert seen.changed({'a': '4.1', 'b': '3.0'}, final, now=200) == []
+
+
+def test_items_gone_from_the_poll_are_dropped():
+    seen = daemon.SeenItems()
+    seen.changed({'a': '4.1'})
+    seen.mark_written(['a'])
+    seen.changed({'b': '3.0'})
+    assert 'a' not in seen.signatures and 'a' not in seen.written
+    assert seen.changed({'a': '4.1', 'b': '3.0'}) == ['a']
+
+
+def test_forget_after_a_failed_write():
+    seen = daemon.SeenItems()
+    assert seen.changed({'a': '4.1', 'b': '3.0'}) == ['a', 'b']
+    seen.forget(['a', 'b'])
+    assert seen.changed({'a': '4.1', 'b': '3.0'}) == ['a', 'b']
+
+
+class FailingStorage(storage.SQLiteStorage):
+    """ a sqlite backend whose first write of earthquakes fails"""
+    failures = 1
+
+    def write_earthquakes(self, df, on_commit=None):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('database unreachable')
+        return super().write_earthquakes(df, on_commit)
+
+
+def test_poll_today_tries_again_after_a_failed_write(site, tmp_path):
+    args = scraper.apply_defaults(cli.parse_args(['--daemon', '--backend', 'sqlite']))
+    state = state_store.ScrapeState(str(tmp_path / 'state.json'))
+    seen = daemon.SeenItems(refresh=args.refresh_interval)
+    with FailingStorage(str(tmp_path / 'quakes.db')) as backend:
+        with pytest.raises(ConnectionError):
+            scraper.poll_today(args, backend, state, seen)
+        assert seen.signatures == {}
+        assert scraper.poll_today(args, backend, state, seen) == 20
+        assert scraper.poll_today(args, backend, state, seen) == 0
+
+
+def test_daemon_runs_the_tasks_until_max_polls():
+    calls = []
+    tasks = [daemon.Task('quakes', 0.01, lambda: calls.append('quakes')),
+             daemon.Task('events', 10, lambda: calls.append('events'))]
+    assert daemon.Daemon(tasks, jitter=0).run(max_polls=5) == 5
+    assert calls[:2] == ['quakes', 'events']  # all the tasks once at the start
+    assert calls[2:] == ['quakes'] * 3
+
+
+def test_failed_poll_backs_off_without_stopping():
+    def fail():
+        raise RuntimeError('website down')
+
+    task = daemon.Task('quakes', 0.01, fail)
+    assert daemon.Daemon([task], jitter=0).run(max_polls=3) == 3
+    assert task.failures == 3
+    assert task.delay(0) == pytest.approx(0.01 * daemon.ERROR_BACKOFF ** 3)
+
+
+def test_stop():
+    service = daemon.Daemon([daemon.Task('quakes', 0.01, lambda: service.stop())])
+    assert service.run(max_polls=10) == 1
+
+
+@pytest.mark.parametrize('argv', [['--refresh_interval', '-1'], ['--refresh_interval', '0'],
+                                  ['--events_days', '-2'], ['--daemon', '--date', '12/11/2022']])
+def test_invalid_daemon_options(argv):
+    with pytest.raises(SystemExit):
+        cli.parse_args(argv)
@@ -0,0 +1,212 @@
+""" tests of db_pool with sqlite3 connections and fake connections in place of MySQL"""
+import json
+import sqlite3
+import threading
+import time
+import pytest
+import db_pool
+
+
+class FakeConnection:
+    """ a connection that answers ping like pymysql, until it is dropped"""
+    def __init__(self):
+        self.pings = 0
+        self.dropped = False
+        self.closed = False
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+        if self.dropped:
+            raise ConnectionError('server has gone away')
+
+    def close(self):
+        self.closed = True
+
+
+class Deadlock(Exception):
+    """ the error of a transaction rolled back by MySQL, args[0] is the error code"""
+
+
+def sqlite_connect():
+    return sqlite3.connect(':memory:', check_same_thread=False)
+
+
+@pytest.fixture
+def no_settings(tmp_path, monkeypatch):
+    """ no config file and no DM_EQ_DB_ variable"""
+    monkeypatch.chdir(tmp_path)
+    for name in list(db_pool.SETTING_NAMES) + ['config']:
+        monkeypatch.delenv(db_pool.ENV_PREFIX + name.upper(), raising=False)
+
+
+def test_settings_are_required(no_settings):
+    with pytest.raises(ValueError, match='host, user, password, database'):
+        db_pool.load_settings()
+    with pytest.raises(ValueError, match='DM_EQ_DB_HOST'):
+        db_pool.ConnectionPool()
+
+
+def test_settings_from_config_and_environment(no_settings, tmp_path, monkeypatch):
+    config = tmp_path / 'db.json'
+    config.write_text(json.dumps({'host': 'db.local', 'user': 'me', 'password': 'secret', 'database': 'quakes'}))
+    monkeypatch.setenv('DM_EQ_DB_HOST', 'localhost')
+    monkeypatch.setenv('DM_EQ_DB_PORT', '3307')
+    assert db_pool.load_settings(str(config)) == {'host': 'localhost', 'port': 3307, 'user': 'me',
+                                                  'password': 'secret', 'database': 'quakes'}
+
+
+def test_settings_from_environment_only(no_settings, monkeypatch):
+    for name, value in {'host': 'localhost', 'user': 'root', 'password': '', 'database': 'quakes'}.items():
+        monkeypatch.setenv(db_pool.ENV_PREFIX + name.upper(), value)
+    assert db_pool.load_settings()['port'] == 3306
+
+
+def test_connections_are_reused():
+    with db_pool.ConnectionPool(connect=sqlite_connect, size=2) as pool:
+        with pool.connection() as first:
+            first.execute('create table quakes (id integer)')
+        with pool.connection() as second:
+            second.execute('select * from quakes')
+        assert second is first
+        assert pool.stats()['created'] == 1
+        assert pool.stats()['checkouts'] == 2
+
+
+def test_ping_on_checkout():
+    pool = db_pool.ConnectionPool(connect=FakeConnection, size=1)
+    with pool.connection() as connection:
+        pass
+    assert connection.pings == 0  # a new connection is not checked
+    with pool.connection():
+        pass
+    assert connection.pings == 1
+    unchecked = db_pool.ConnectionPool(connect=FakeConnection, size=1, ping=False)
+    with unchecked.connection() as connection:
+        pass
+    with unchecked.connection():
+        pass
+    assert connection.pings == 0
+
+
+def test_reconnect_after_dropped_connection():
+    pool = db_pool.ConnectionPool(connect=sqlite_connect, size=1)
+    with pool.connection() as first:
+        pass
+    first.close()  # dropped while it was idle in the pool
+    with pool.connection() as second:
+        assert second.execute('select 1').fetchone() == (1,)
+    assert second is not first
+    assert pool.stats()['reconnects'] == 1
+    assert pool.stats()['open'] == 1
+
+
+def test_broken_connection_is_not_reused():
+    pool = db_pool.ConnectionPool(connect=FakeConnection, size=1)
+    with pytest.raises(ConnectionError):
+        with pool.connection() as first:
+            first.dropped = True
+            raise ConnectionError('lost connection during query')
+    assert first.closed
+    with pool.connection() as second:
+        assert second is not first
+    assert pool.stats()['reconnects'] == 0
+
+
+def test_acquire_timeout_when_all_connections_are_used():
+    pool = db_pool.ConnectionPool(connect=FakeConnection, size=1)
+    connection = pool.acquire()
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.05)
+    pool.release(connection)
+    pool.release(pool.acquire(timeout=0.05))
+
+
+def test_invalid_size_and_closed_pool():
+    with pytest.raises(ValueError):
+        db_pool.ConnectionPool(connect=FakeConnection, size=0)
+    pool = db_pool.ConnectionPool(connect=FakeConnection, size=1)
+    pool.close()
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+
+
+def test_writer_pool_writes_in_parallel_with_one_connection_each():
+    pool = db_pool.ConnectionPool(connect=sqlite_connect, size=3)
+    lock = threading.Lock()
+    in_use = set()
+    most = []
+
+    def write(batch, connection):
+        with lock:
+            assert connection not in in_use
+            in_use.add(connection)
+            most.append(len(in_use))
+        time.sleep(0.01)
+        with lock:
+            in_use.discard(connection)
+        return batch * 2
+
+    with db_pool.WriterPool(pool, write) as writers:
+        assert writers.map(range(12)) == [batch * 2 for batch in range(12)]
+    assert 1 < max(most) <= 3
+    assert pool.stats()['created'] <= 3
+
+
+def test_writer_pool_retries_deadlocks():
+    attempts = []
+
+    def write(batch, connection):
+        attempts.append(batch)
+        if len(attempts) < 3:
+            raise Deadlock(1213, 'Deadlock found when trying to get lock')
+        return 'written'
+
+    with db_pool.WriterPool(db_pool.ConnectionPool(connect=FakeConnection, size=1), write, retries=3) as writers:
+        assert writers.submit('batch').result() == 'written'
+    assert attempts == ['batch'] * 3
+
+
+def test_writer_pool_gives_up():
+    attempts = []
+
+    def deadlock(batch, connection):
+        attempts.append(batch)
+        raise Deadlock(1205, 'Lock wait timeout exceeded')
+
+    def fail(batch, connection):
+        attempts.append(batch)
+        raise ValueError('not a transient error')
+
+    pool = db_pool.ConnectionPool(connect=FakeConnection, size=1)
+    with db_pool.WriterPool(pool, deadlock, retries=2) as writers:
+        with pytest.raises(Deadlock):
+            writers.submit('batch').result()
+    assert len(attempts) == 3
+    attempts.clear()
+    with db_pool.WriterPool(pool, fail, retries=2) as writers:
+        with pytest.raises(ValueError):
+            writers.map(['batch'])
+    assert len(attempts) == 1
+
+
+def test_writer_pool_reports_each_batch_written():
+    written = []
+    deadlocks = []
+
+    def write(batch, connection):
+        if batch == 2 and not deadlocks:
+            deadlocks.append(batch)
+            raise Deadlock(1213, 'Deadlock found when trying to get lock')
+        return batch
+
+    def fail(batch, connection):
+        raise ValueError('not written')
+
+    pool = db_pool.ConnectionPool(connect=FakeConnection, size=2)
+    with db_pool.WriterPool(pool, write, on_written=written.append) as writers:
+        writers.map(range(5))
+    assert sorted(written) == [0, 1, 2, 3, 4]  # once each, the batch rolled back is reported when written again
+    with db_pool.WriterPool(pool, fail, on_written=written.append) as writers:
+        with pytest.raises(ValueError):
+            writers.map([5])
+    assert 5 not in written
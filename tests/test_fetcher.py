@@ -0,0 +1,110 @@
+""" tests of fetcher against a stub http server on localhost"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+import fetcher
+from http_client import HttpClient
+
+DELAY = 0.05  # seconds each response takes
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.arrivals.append(time.monotonic())
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        # the later pages answer first, so that the order of the results is not the order of the responses
+        number = int(self.path.rsplit('/', 1)[-1])
+        time.sleep(DELAY * (1 + (number % 3 == 0)))
+        with server.lock:
+            server.in_flight -= 1
+        body = self.path.encode('utf-8')
+        # /status/<code>/<number> answers with that status
+        self.send_response(int(self.path.split('/')[2]) if self.path.startswith('/status/') else 200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.arrivals = []
+    server.in_flight = 0
+    server.max_in_flight = 0
+    server.base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client():
+    client = HttpClient(pool_size=20)
+    yield client
+    client.close()
+
+
+def page_urls(server, n):
+    return [f'{server.base_url}/page/{number}' for number in range(n)]
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_results_in_input_order(stub_server, client, workers):
+    urls = page_urls(stub_server, 12)
+    pages = fetcher.fetch_in_order(lambda url: client.get(url).text, urls, workers=workers)
+    assert pages == [url[len(stub_server.base_url):] for url in urls]
+
+
+def test_at_most_workers_requests_in_flight(stub_server, client):
+    urls = page_urls(stub_server, 24)
+    pages = list(fetcher.imap_ordered(lambda url: client.get(url).text, urls, workers=3))
+    assert len(pages) == 24
+    assert stub_server.max_in_flight == 3
+
+
+def test_rate_per_host(stub_server, client):
+    rate = 20
+    urls = page_urls(stub_server, 10)
+    fetcher.fetch_in_order(lambda url: client.get(url).text, urls, workers=5, rate=rate)
+    arrivals = sorted(stub_server.arrivals)
+    # the n-th request can not be sent before (n - 1) / rate seconds, with some slack for the scheduling
+    assert arrivals[-1] - arrivals[0] >= (len(urls) - 1) / rate * 0.9
+    gaps = [later - earlier for earlier, later in zip(arrivals, arrivals[1:])]
+    assert min(gaps) >= 1 / rate * 0.5
+
+
+def test_rate_is_per_host():
+    limiter = fetcher.HostRateLimiter(rate=2)
+    start = time.monotonic()
+    for host in ('a', 'b', 'c', 'd'):
+        limiter.wait(f'http://{host}/page')
+    assert time.monotonic() - start < 0.2
+
+
+def test_invalid_rate():
+    with pytest.raises(ValueError):
+        fetcher.HostRateLimiter(rate=0)
+
+
+@pytest.mark.parametrize('status, attempts', [(503, 3), (404, 1)])
+def test_error_status_raises_once_retries_are_spent(stub_server, status, attempts):
+    client = HttpClient(retries=2, backoff_factor=0)
+    with pytest.raises(requests.HTTPError):
+        client.get(f'{stub_server.base_url}/status/{status}/1')
+    client.close()
+    assert len(stub_server.arrivals) == attempts
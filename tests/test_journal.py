@@ -0,0 +1,78 @@
+""" tests of the journal of the resumable runs (--resume)"""
+import sqlite3
+import pytest
+import cli
+import journal
+import records
+import scraper
+import storage
+from benchmarks.synthetic import detail_link, quake_ids
+
+
+@pytest.fixture
+def job_args(tmp_path):
+    args = cli.parse_args(['--backend', 'sqlite', '--storage_path', str(tmp_path / 'quakes.db'), '--chunk_size', '5',
+                           '--resume', '--journal_file', str(tmp_path / 'journal.sqlite')])
+    return scraper.apply_defaults(args)
+
+
+def stored_link_ids(path):
+    with sqlite3.connect(path) as connection:
+        return {row[0] for row in connection.execute('select link_id from earthquakes')}
+
+
+def test_chunks_are_journaled_when_committed(site, job_args, monkeypatch):
+    """ a run that dies partway through writing the earthquakes has journaled the chunks already committed, and
+    --resume writes only the others"""
+    ids = quake_ids(20)
+    urls = [scraper.MAIN_URL + detail_link(eq_id) for eq_id in ids]
+    earthquake_rows = records.QuakeBatch.earthquake_rows
+    chunks = []
+
+    def dying_rows(batch):
+        chunks.append(len(batch))
+        if len(chunks) == 3:
+            raise RuntimeError('killed while writing the third chunk')
+        return earthquake_rows(batch)
+
+    monkeypatch.setattr(records.QuakeBatch, 'earthquake_rows', dying_rows)
+    job = journal.Journal(job_args.journal_file, journal.job_params(job_args))
+    with storage.SQLiteStorage(job_args.storage_path, chunk_size=job_args.chunk_size) as backend:
+        with pytest.raises(RuntimeError):
+            scraper.load_earthquakes(job_args, ids, urls, backend, job=job)
+    job.close()
+    assert stored_link_ids(job_args.storage_path) == {int(eq_id.split('-')[-1]) for eq_id in ids[:10]}
+
+    job = journal.Journal(job_args.journal_file, journal.job_params(job_args))
+    assert job.resumed
+    assert job.committed_ids() == set(ids[:10])
+    left = [(eq_id, url) for eq_id, url in zip(ids, urls) if eq_id not in job.committed_ids()]
+    chunks.clear()
+    monkeypatch.setattr(records.QuakeBatch, 'earthquake_rows',
+                        lambda batch: chunks.append(len(batch)) or earthquake_rows(batch))
+    with storage.SQLiteStorage(job_args.storage_path, chunk_size=job_args.chunk_size) as backend:
+        scraper.load_earthquakes(job_args, [eq_id for eq_id, _ in left], [url for _, url in left], backend, job=job)
+    assert chunks == [5, 5]
+    assert job.committed_ids() == set(ids)
+    assert len(stored_link_ids(job_args.storage_path)) == 20
+    job.close()
+
+
+def test_failed_run_closes_the_backend_and_the_journal(site, job_args, monkeypatch):
+    """ a run that fails after writing the earthquakes closes its storage and its journal, the job is left unfinished
+    to be resumed"""
+    closed = []
+    for cls in (storage.SQLiteStorage, journal.Journal):
+        monkeypatch.setattr(cls, 'close', lambda self, close=cls.close: closed.append(type(self)) or close(self))
+
+    def api_down(**kwargs):
+        raise ConnectionError('EONET is down')
+
+    monkeypatch.setattr(scraper.API_scraper_v1, 'main', api_down)
+    with pytest.raises(ConnectionError):
+        scraper.run(job_args)
+    assert sorted(cls.__name__ for cls in closed) == ['Journal', 'SQLiteStorage']
+    assert len(stored_link_ids(job_args.storage_path)) > 0
+    job = journal.Journal(job_args.journal_file, journal.job_params(job_args))
+    assert job.resumed
+    job.close()
@@ -0,0 +1,29 @@
+""" tests of the export of the metrics"""
+import json
+import pytest
+import metrics
+
+
+@pytest.fixture
+def registry():
+    yield metrics.enable()
+    metrics.disable()
+
+
+def test_label_values_are_escaped(registry, tmp_path):
+    metrics.inc('http_errors_total', url_class='say "hi"\nC:\\pages')
+    path = tmp_path / 'metrics.prom'
+    metrics.write(str(path))
+    lines = path.read_text().splitlines()
+    assert 'http_errors_total{url_class="say \\"hi\\"\\nC:\\\\pages"} 1' in lines
+    assert [file.name for file in tmp_path.iterdir()] == ['metrics.prom']
+
+
+def test_write_replaces_the_file(registry, tmp_path):
+    path = tmp_path / 'metrics.json'
+    path.write_text('previous run')
+    metrics.inc('db_commits_total', table='fire', backend='sqlite')
+    metrics.write(str(path))
+    counters = json.loads(path.read_text())['counters']
+    assert counters['db_commits_total'][0]['value'] == 1
+    assert [file.name for file in tmp_path.iterdir()] == ['metrics.json']
@@ -0,0 +1,33 @@
+""" tests of the process pool mode: the shards are converted in the order of the pages and the metrics of the workers
+are merged in the ones of the main process"""
+import pytest
+import cell_parsers
+import metrics
+import parallel_convert
+from benchmarks.synthetic import detail_page_html, detail_records, quake_ids
+
+
+@pytest.fixture
+def registry():
+    cell_parsers.clear()
+    yield metrics.enable()
+    metrics.disable()
+
+
+def test_shards_of_an_iterator():
+    ids = quake_ids(7)
+    shards = list(parallel_convert.shards(ids, iter(range(7)), 3))
+    assert [len(pages) for _, pages in shards] == [3, 3, 1]
+    assert [eq_id for shard_ids, _ in shards for eq_id in shard_ids] == ids
+
+
+def test_workers_metrics_are_merged(registry):
+    ids = quake_ids(30)
+    pages = (detail_page_html(record) for record in detail_records(30))
+    data = parallel_convert.parse_and_convert_all(ids, pages, processes=2, shard_size=8)
+    assert data.eq_ids.tolist() == ids
+    timings = registry.to_dict()['histograms']['convert_column_seconds']
+    assert {timing['count'] for timing in timings} == {4}
+    assert cell_parsers.stats()['coordinates']['cells'] == 60
+    hits_and_misses = sum(value for (name, _), value in registry.counters.items() if name == 'parser_cache_total')
+    assert hits_and_misses == sum(parser['cells'] for parser in cell_parsers.stats().values())
@@ -0,0 +1,142 @@
+""" tests of the on-disk cache of the http responses against a stub server"""
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+import pytest
+import response_cache
+from http_client import HttpClient
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """ serves server.pages ({path: bytes}) with an ETag, and answers 304 when the ETag sent is still the one of the
+    page"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = self.server.pages[self.path]
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        self.server.requests.append(self.path)
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+    server.daemon_threads = True
+    server.pages = {f'/page/{number}': f'<p>page {number}</p>'.encode() * 20 for number in range(10)}
+    server.requests = []
+    server.url = lambda path: f'http://127.0.0.1:{server.server_address[1]}{path}'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ the time seen by the cache, moved forward by hand"""
+    now = SimpleNamespace(value=1_000_000.0)
+    monkeypatch.setattr(response_cache, 'time', SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+@pytest.fixture
+def client():
+    client = HttpClient()
+    yield client
+    client.close()
+
+
+def object_files(cache_dir):
+    return [name for _, _, names in os.walk(os.path.join(cache_dir, 'objects')) for name in names]
+
+
+def test_fresh_response_is_replayed(server, client, clock, tmp_path):
+    cache = response_cache.ResponseCache(str(tmp_path), ttls={'other': 60})
+    first = cache.get(client, server.url('/page/1'))
+    second = cache.get(client, server.url('/page/1'))
+    assert second.content == first.content == server.pages['/page/1']
+    assert second.headers['X-Cache'] == 'HIT'
+    assert server.requests == ['/page/1']
+    assert cache.stats()['hits'] == 1
+
+
+def test_expired_response_is_revalidated(server, client, clock, tmp_path):
+    cache = response_cache.ResponseCache(str(tmp_path), ttls={'other': 60})
+    cache.get(client, server.url('/page/1'))
+    clock.value += 61
+    assert cache.get(client, server.url('/page/1')).content == server.pages['/page/1']
+    assert server.requests == ['/page/1', '/page/1']
+    assert cache.stats()['revalidated'] == 1
+    cache.get(client, server.url('/page/1'))  # fresh again after the revalidation
+    assert len(server.requests) == 2
+
+
+def test_changed_page_replaces_its_body(server, client, clock, tmp_path):
+    cache = response_cache.ResponseCache(str(tmp_path), ttls={'other': 60})
+    for version in range(5):
+        server.pages['/page/1'] = f'<p>version {version}</p>'.encode() * 20
+        assert cache.get(client, server.url('/page/1')).content == server.pages['/page/1']
+        clock.value += 61
+    assert len(object_files(str(tmp_path))) == 1
+    assert cache.stats()['bytes'] == len(server.pages['/page/1'])
+
+
+def test_body_shared_by_two_urls_is_kept(server, client, clock, tmp_path):
+    server.pages['/page/2'] = server.pages['/page/1']
+    cache = response_cache.ResponseCache(str(tmp_path), ttls={'other': 60})
+    cache.get(client, server.url('/page/1'))
+    cache.get(client, server.url('/page/2'))
+    server.pages['/page/1'] = b'<p>new</p>'
+    clock.value += 61
+    cache.get(client, server.url('/page/1'))
+    assert cache.get(client, server.url('/page/2')).headers['X-Cache'] == 'HIT'
+    assert len(object_files(str(tmp_path))) == 2
+
+
+def test_least_recently_used_are_evicted(server, client, clock, tmp_path):
+    size = len(server.pages['/page/0'])
+    cache = response_cache.ResponseCache(str(tmp_path), max_bytes=3 * size, ttls={'other': None})
+    for number in range(3):
+        cache.get(client, server.url(f'/page/{number}'))
+        clock.value += 1
+    cache.get(client, server.url('/page/0'))  # page 1 is now the least recently used
+    clock.value += 1
+    cache.get(client, server.url('/page/3'))
+    assert cache.stats()['evicted'] == 1
+    assert cache.stats()['bytes'] <= 3 * size
+    assert len(object_files(str(tmp_path))) == 3
+    requests = len(server.requests)
+    for number in (0, 2, 3):
+        cache.get(client, server.url(f'/page/{number}'))
+    assert len(server.requests) == requests
+    cache.get(client, server.url('/page/1'))
+    assert len(server.requests) == requests + 1
+
+
+def test_offline_replay(server, client, clock, tmp_path):
+    cache = response_cache.ResponseCache(str(tmp_path), ttls={'other': 60})
+    cache.get(client, server.url('/page/1'))
+    cache.close()
+    clock.value += 3600
+    offline = response_cache.ResponseCache(str(tmp_path), ttls={'other': 60}, offline=True)
+    assert offline.get(client, server.url('/page/1')).content == server.pages['/page/1']  # even when expired
+    with pytest.raises(response_cache.CacheMiss):
+        offline.get(client, server.url('/page/2'))
+    assert server.requests == ['/page/1']
@@ -0,0 +1,44 @@
+""" tests of the spatial index attached to a storage backend"""
+import pandas as pd
+import cli
+import scraper
+import spatial_index
+import storage
+from benchmarks.synthetic import detail_link, detail_records, quake_ids
+from cleaning_converting import convert
+
+
+def quakes(first, n):
+    table = scraper.build_detailed_table(detail_records(n, seed=first), quake_ids(first + n)[first:])
+    with pd.option_context('mode.chained_assignment', None):
+        return convert(table)
+
+
+def link_id(eq_id):
+    return int(eq_id.split('-')[-1])
+
+
+def test_written_batch_is_queried(tmp_path):
+    with storage.SQLiteStorage(str(tmp_path / 'quakes.db')) as backend:
+        backend.write_earthquakes(quakes(0, 5))
+        index = spatial_index.SpatialIndex.attach(backend)
+        assert len(index) == 5
+        new = quakes(5, 5)
+        backend.write_earthquakes(new.copy())
+        assert len(index) == 10
+        for eq_id, (lat, lon) in zip(new['eq_id'], new['Epicenter latitude / longitude']):
+            ids, distances = index.within(lat, lon, 1)
+            assert link_id(eq_id) in ids.tolist()
+
+
+def test_streamed_batches_are_queried(site, tmp_path):
+    args = scraper.apply_defaults(cli.parse_args(['--backend', 'sqlite', '--storage_path', str(tmp_path / 'quakes.db'),
+                                                  '--stream', '--batch_size', '4']))
+    ids = quake_ids(10)
+    with storage.SQLiteStorage(args.storage_path) as backend:
+        index = spatial_index.SpatialIndex.attach(backend)
+        scraper.load_earthquakes(args, ids, [scraper.MAIN_URL + detail_link(eq_id) for eq_id in ids], backend)
+        assert len(index) == 10
+        stored = spatial_index.SpatialIndex.from_storage(backend)
+    ids, _ = index.nearest(0, 0, k=10)
+    assert sorted(ids.tolist()) == sorted(stored.nearest(0, 0, k=10)[0].tolist())
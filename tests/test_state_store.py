@@ -0,0 +1,29 @@
+""" tests of the incremental state: the status of the earthquakes is dropped once it can not be needed anymore"""
+from datetime import datetime
+from state_store import ScrapeState
+
+DAY = 'https://www.allquakes.com/earthquakes/archive/2021-mar-01.html'
+TODAY = datetime(2021, 3, 10)
+
+
+def test_closed_day_drops_its_quakes(tmp_path):
+    state = ScrapeState(str(tmp_path / 'state.json'))
+    state.record_day(DAY, ['quake-1', 'quake-2'], 2)
+    state.record_quakes({'quake-1': True, 'quake-2': False})
+    state.close_days(TODAY)
+    assert not state.is_day_closed(DAY) and len(state.quakes) == 2
+
+    state.record_quakes({'quake-2': True})
+    state.close_days(TODAY)
+    assert state.is_day_closed(DAY)
+    assert state.quakes == {} and state.days[DAY]['ids'] == []
+    state.save()
+    assert ScrapeState.load(state.path).is_day_closed(DAY)
+
+
+def test_prune_keeps_listed_quakes_and_open_days(tmp_path):
+    state = ScrapeState(str(tmp_path / 'state.json'))
+    state.record_day(DAY, ['quake-1'], 1)
+    state.record_quakes({'quake-1': False, 'quake-2': True, 'quake-3': True})
+    assert state.prune(['quake-3']) == 1
+    assert set(state.quakes) == {'quake-1', 'quake-3'}
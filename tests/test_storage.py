@@ -0,0 +1,54 @@
+""" tests of the parquet storage: the parts of a table written with and without missing values are read back together"""
+import numpy as np
+import pandas as pd
+import pytest
+import hazard_join
+import spatial_index
+import storage
+from benchmarks.synthetic import detail_records, quake_ids
+from cleaning_converting import convert
+from scraper import build_detailed_table
+
+pytest.importorskip('pyarrow')
+
+
+def icebergs(first, magnitudes):
+    return pd.DataFrame({'id': [f'EONET_{first + i}' for i in range(len(magnitudes))],
+                         'title': [f'Iceberg {first + i}' for i in range(len(magnitudes))],
+                         'magnitude_value': magnitudes,
+                         'magnitude_unit': ['NM^2' if magnitude else None for magnitude in magnitudes],
+                         'date': ['2021-03-01T00:00:00Z'] * len(magnitudes),
+                         'coordinates': [[-60.5, -70.25]] * len(magnitudes)})
+
+
+def quakes(first, n, **edit):
+    records = [{**record, **edit} for record in detail_records(n, seed=first)]
+    table = build_detailed_table(records, quake_ids(first + n)[first:])
+    with pd.option_context('mode.chained_assignment', None):
+        return convert(table)
+
+
+def test_parts_with_and_without_nulls(tmp_path):
+    backend = storage.ParquetStorage(str(tmp_path))
+    backend.write_events(icebergs(1, [None, None]), 'iceberg')
+    backend.write_events(icebergs(3, [12.5, None]), 'iceberg')
+    events = backend.read_table('iceberg')
+    assert events['eonet_id'].tolist() == [1, 2, 3, 4]
+    assert np.isnan(events['magnitude_value'][0]) and events['magnitude_value'][2] == 12.5
+
+    backend.write_earthquakes(quakes(0, 3, **{'Magnitude': 'unknown', 'Estimated seismic energy released': np.nan}))
+    backend.write_earthquakes(quakes(3, 3))
+    earthquakes = backend.read_table('earthquakes')
+    assert len(earthquakes) == 6
+    assert earthquakes['magnitude'][:3].isnull().all() and earthquakes['magnitude'][3:].notnull().all()
+
+
+def test_readers_of_the_parquet_tables(tmp_path):
+    backend = storage.ParquetStorage(str(tmp_path))
+    backend.write_earthquakes(quakes(0, 4, **{'Magnitude': 'unknown'}))
+    backend.write_earthquakes(quakes(4, 4))
+    backend.write_events(icebergs(1, [None]), 'iceberg')
+    backend.write_events(icebergs(2, [40.0]), 'iceberg')
+    assert len(spatial_index.SpatialIndex.from_parquet(backend)) == 8
+    assert sum(len(chunk) for chunk in hazard_join.read_quakes(backend)) == 8
+    assert hazard_join.read_events(backend, 'iceberg')['eonet_id'].tolist() == [1, 2]
@@ -1,29 +1,25 @@
-import pymysql
 import pandas as pd
 import re
 import logging
-
-logging.basicConfig(filename='scraper.log',
-                    format='%(asctime)s-%(levelname)s-FILE:%(filename)s-FUNC:%(funcName)s-LINE:%(lineno)d-%(message)s',
-                    level=logging.INFO)
+import threading
+from collections import OrderedDict
+import db_pool
+import metrics
+import records
 
 logger = logging.getLogger(__name__)
 
 
-def get_connection():
-    """This function establishes a connection to the database using the given user and password"""
-    connection = pymysql.connect(host='data-mining-db1.cttpnp4olbpx.us-west-1.rds.amazonaws.com',
-                                 user='ella_emuna_salome',
-                                 password='ella_emuna_salome',
-                                 database='ella_emuna_salome',
-                                 cursorclass=pymysql.cursors.DictCursor)
-    return connection
+def get_connection(config_file=None):
+    """This function establishes a connection to the database, the settings (host, user, password...) come from the
+    environment or the config file, see db_pool.load_settings"""
+    return db_pool.mysql_connect(db_pool.load_settings(config_file))
 
 
 def run_query(connection, query, query_parameters=None):
     """ this is the user function used to execute a query in the sql database
     """
-    with connection.cursor() as cursor:
+    with metrics.count_round_trips(connection.cursor()) as cursor:
         cursor.execute(query, query_parameters)
         result = cursor.fetchone()
     return result
@@ -32,7 +28,7 @@ def run_query(connection, query, query_parameters=None):
 def run_update(connection, query, query_parameters=None):
     """ this function is used to update the databases and save the changes.
     """
-    with connection.cursor() as cursor:
+    with metrics.count_round_trips(connection.cursor()) as cursor:
         result = cursor.execute(query, query_parameters)
         connection.commit()
     return result
@@ -40,7 +36,10 @@ def run_update(connection, query, query_parameters=None):
 
 def update_database(row, connection):
     """ this function is used to update the database with a new earthquake.
-     It checks weather the earthquake ID is already in the database, if not, the databse is updated  """
+     It checks weather the earthquake ID is already in the database, if not, the databse is updated. connection can
+     also be a storage backend (see storage), the row is then written with its write_earthquakes.  """
+    if hasattr(connection, 'write_earthquakes'):
+        return connection.write_earthquakes(pd.DataFrame([row]))
 
     df_id = int(re.findall(r'\d+', row['eq_id'])[0])
     status = int(row['Status'])
@@ -127,90 +126,303 @@ def update_database(row, connection):
                 logging.info(f"Insert connection between earthquake {df_id} and  city {city_name} to table eq_cities")
 
 
-def update_fire(df, connection):
-    """ This function updates the fire table with the data scraped from the API. Before adding the instance to the table
-    it checks if the id is already in the fire table. """
-
-    for _, row in df.iterrows():
-        df_id = int(row['id'].lstrip('EONET_'))
-        db_id = run_query(connection, f"select id from fire where eonet_id = {df_id}")
-        if db_id:
-            db_id = db_id['id']
-            update_fire = """UPDATE fire SET
-                                fire_name = %s,
-                                latitude = %s,
-                                longitude = %s,
-                                date_time = %s
-                                WHERE id = %s"""
-            values = (row['title'], row['coordinates'][0], row['coordinates'][1], row['date'], db_id)
-            run_update(connection, update_fire, values)
-            logger.info(f'Update fire {df_id} into fire table')
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_CITY_CACHE_SIZE = 10000
 
-        else:
-            create_fire = """INSERT INTO fire
-                        (eonet_id ,fire_name, latitude, longitude, date_time)
-                        VALUES
-                        (%s, %s, %s, %s, %s)"""
-            values = (df_id, row['title'], row['coordinates'][0], row['coordinates'][1], row['date'])
-            run_update(connection, create_fire, values)
-            logger.info(f'Insert fire {df_id} into fire table')
+EARTHQUAKE_COLUMNS = records.COLUMNS
 
+UPSERT_EARTHQUAKES = f"""INSERT INTO earthquakes ({', '.join(EARTHQUAKE_COLUMNS)})
+                        VALUES ({', '.join(['%s'] * len(EARTHQUAKE_COLUMNS))})
+                        ON DUPLICATE KEY UPDATE
+                        {', '.join(f'{column} = VALUES({column})' for column in EARTHQUAKE_COLUMNS[1:])}"""
 
-def update_volcano(df, connection):
-    """ This function updates the volcano table with the data scraped from the API. Before adding the instance to the table
-    it checks if the id is already in the volcano table. """
-    for _, row in df.iterrows():
-        df_id = int(row['id'].lstrip('EONET_'))
-        db_id = run_query(connection, f"select id from volcano where eonet_id = {df_id}")
-        if db_id:
-            db_id = db_id['id']
-            update_volcano = """UPDATE volcano SET
-                                volcano_name = %s,
-                                latitude = %s,
-                                longitude = %s,
-                                date_time = %s
-                                WHERE id = %s"""
-            values = (row['title'], row['coordinates'][0], row['coordinates'][1], row['date'], db_id)
-            run_update(connection, update_volcano, values)
-            logger.info(f'Update volcano {df_id} into volcano table')
 
-        else:
-            create_volcano = """INSERT INTO volcano
-                        (eonet_id ,volcano_name, latitude, longitude, date_time)
-                        VALUES
-                        (%s, %s, %s, %s, %s)"""
-            values = (df_id, row['title'], row['coordinates'][0], row['coordinates'][1], row['date'])
-            run_update(connection, create_volcano, values)
-            logger.info(f'Insert volcano {df_id} into volcano table')
+def get_link_id(eq_id):
+    """ returns the id of the earthquake on the website (link_id in the database) from the id of its row, ex: quake-123"""
+    return int(re.findall(r'\d+', eq_id)[0])
 
 
-def update_iceberg(df, connection):
-    """     This function updates the iceberg table with the data scraped from the API. Before adding the instance to the table
-    it checks if the id is already in the iceberg table. """
-
-    for _, row in df.iterrows():
-        df_id = int(row['id'].lstrip('EONET_'))
-        db_id = run_query(connection, f"select id from volcano where eonet_id = {df_id}")
-        if db_id:
-            db_id = db_id['id']
-            update_iceberg = """UPDATE iceberg SET
-                                iceberg_name = %s,
-                                magnitude_value = %s,
-                                magnitude_unit = %s,
-                                date_time = %s
-                                WHERE id = %s"""
-            values = (row['title'], row['magnitude_value'], row['magnitude_unit'], row['date'], db_id)
-            run_update(connection, update_iceberg, values)
-            logger.info(f'Update iceberg {df_id} into iceberg table')
+def get_earthquake_ids(cursor, link_ids):
+    """ returns a dictionary {link_id: id} of the earthquakes of the database with the given link ids, in one query"""
+    if not link_ids:
+        return {}
+    cursor.execute(f"select id, link_id from earthquakes where link_id in ({', '.join(['%s'] * len(link_ids))})",
+                   list(link_ids))
+    return {result['link_id']: result['id'] for result in cursor.fetchall()}
+
+
+def placeholders(values):
+    """ returns the %s placeholders of an IN (...) clause for the given values"""
+    return ', '.join(['%s'] * len(values))
+
+
+class CityCache:
+    """ This class keeps the ids of the cities of the database in memory, so that the same city is not looked up again
+    for every earthquake. It holds at most max_size cities and forgets the least recently used ones first. It counts
+    the hits and misses of the lookups. It can be shared by the threads of a db_pool.WriterPool."""
+    def __init__(self, max_size=DEFAULT_CITY_CACHE_SIZE):
+        self.max_size = max_size
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, city_name):
+        """ returns the id of the city if it is in the cache, None otherwise"""
+        with self._lock:
+            city_id = self._ids.get(city_name)
+            if city_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._ids.move_to_end(city_name)
+            return city_id
 
+    def store(self, city_ids):
+        """ adds the cities of the dictionary {city_name: id} to the cache"""
+        with self._lock:
+            for city_name, city_id in city_ids.items():
+                self._ids[city_name] = city_id
+                self._ids.move_to_end(city_name)
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+
+    def preload(self, connection):
+        """ fills the cache with the cities already in the database, up to max_size cities"""
+        with metrics.count_round_trips(connection.cursor()) as cursor:
+            cursor.execute("select id, city_name from cities limit %s", self.max_size)
+            self.store({result['city_name']: result['id'] for result in cursor.fetchall()})
+        logger.info(f'preloaded {len(self._ids)} cities in the city cache')
+
+    def stats(self):
+        """ returns the number of hits and misses of the cache, its hit rate and its size"""
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._ids)}
+
+
+city_cache = CityCache()
+
+
+def resolve_cities(cursor, populations, cache):
+    """ this function returns the ids {city_name: id} of all the cities of the dictionary {city_name: population}.
+    The cities missing from the cache are selected in one query, the ones missing from the database are inserted
+    together and selected again. The new ids are not stored in the cache, it is done after the commit."""
+    city_ids = {}
+    missing = []
+    for city_name in populations:
+        city_id = cache.get(city_name)
+        if city_id is None:
+            missing.append(city_name)
         else:
-            create_iceberg = """INSERT INTO iceberg
-                        (eonet_id ,iceberg_name, magnitude_value, magnitude_unit, date_time)
-                        VALUES
-                        (%s, %s, %s, %s, %s)"""
-            values = (df_id, row['title'], row['magnitude_value'], row['magnitude_unit'], row['date'])
-            run_update(connection, create_iceberg, values)
-            logger.info(f'Insert iceberg {df_id} into iceberg table')
+            city_ids[city_name] = city_id
+    if not missing:
+        return city_ids
+
+    cursor.execute(f"select id, city_name from cities where city_name in ({placeholders(missing)})", missing)
+    found = {result['city_name']: result['id'] for result in cursor.fetchall()}
+    new_cities = [city_name for city_name in missing if city_name not in found]
+    if new_cities:
+        cursor.executemany("INSERT IGNORE INTO cities (city_name, population) VALUES (%s, %s)",
+                           [(city_name, populations[city_name]) for city_name in new_cities])
+        cursor.execute(f"select id, city_name from cities where city_name in ({placeholders(new_cities)})",
+                       new_cities)
+        found.update({result['city_name']: result['id'] for result in cursor.fetchall()})
+        logger.info(f'Insert {len(new_cities)} cities into cities table')
+
+    for city_name in missing:
+        if city_name not in found:
+            # the collation of the database matched it to a city stored with another spelling (case, accents)
+            cursor.execute("select id from cities where city_name = %s", city_name)
+            found[city_name] = cursor.fetchone()['id']
+        city_ids[city_name] = found[city_name]
+    return city_ids
+
+
+def link_cities(cursor, cities_by_eq, cache):
+    """ this function links the earthquakes to their nearby cities. cities_by_eq is a dictionary {earthquake db id:
+    list of (distance, city name, population)}. The cities are resolved in one batch and the links are inserted with a
+    single multi-row insert, the distance is updated when the link already exists. It does not commit and returns the
+    ids of the cities it resolved."""
+    populations = {}
+    for cities in cities_by_eq.values():
+        for city in cities:
+            populations.setdefault(city[1], int(city[2]))
+    if not populations:
+        return {}
+    city_ids = resolve_cities(cursor, populations, cache)
+    links = [(db_id, city_ids[city[1]], int(city[0])) for db_id, cities in cities_by_eq.items() for city in cities]
+    cursor.executemany("""INSERT INTO eq_cities (eq_id, city_id, distance) VALUES (%s, %s, %s)
+                          ON DUPLICATE KEY UPDATE distance = VALUES(distance)""", links)
+    logger.info(f'Insert {len(links)} connections between earthquakes and cities to table eq_cities')
+    return city_ids
+
+
+def upsert_earthquakes(df, connection, chunk_size=DEFAULT_CHUNK_SIZE, cache=None, on_commit=None):
+    """ this function writes all the earthquakes of the converted dataframe (or records.QuakeBatch) to the database.
+    The rows are sent by chunks of chunk_size with a single multi-row INSERT ... ON DUPLICATE KEY UPDATE (the unique
+    key on link_id makes it an update when the earthquake is already there), then their nearby cities are linked in
+    one batch (see link_cities), using the city cache (the module city_cache by default). Each chunk is one
+    transaction, it is rolled back if any statement fails, on_commit(chunk) is called after each chunk committed.
+    Returns the number of earthquakes written."""
+    cache = city_cache if cache is None else cache
+    batch = records.QuakeBatch.of(df)
+    for start in range(0, len(batch), chunk_size):
+        chunk = batch[start:start + chunk_size]
+        values = chunk.earthquake_rows()
+        try:
+            with metrics.count_round_trips(connection.cursor()) as cursor:
+                cursor.executemany(UPSERT_EARTHQUAKES, values)
+                db_ids = get_earthquake_ids(cursor, chunk.link_ids.tolist())
+                cities_by_eq = {db_ids[link_id]: cities for link_id, cities in chunk.cities_by_link_id().items()}
+                city_ids = link_cities(cursor, cities_by_eq, cache)
+            connection.commit()
+            metrics.inc('db_commits_total', table='earthquakes', backend='mysql')
+            metrics.observe('db_rows_per_commit', len(chunk), table='earthquakes', backend='mysql')
+        except Exception:
+            connection.rollback()
+            logger.error(f'failed to write earthquakes {start} to {start + len(chunk)}, chunk rolled back')
+            raise
+        cache.store(city_ids)
+        logger.info(f'Upsert earthquakes {start} to {start + len(chunk)} into earthquakes table')
+        if on_commit:
+            on_commit(chunk)
+    logger.info(f'city cache: {cache.stats()}')
+    return len(batch)
+
+
+def upsert_earthquakes_parallel(df, pool, chunk_size=DEFAULT_CHUNK_SIZE, writers=None, cache=None, on_commit=None):
+    """ writes the earthquakes of the converted dataframe (or records.QuakeBatch) like upsert_earthquakes, the chunks
+    being written in parallel by writers connections of the db_pool.ConnectionPool pool (all its connections by
+    default). The earthquakes are independent, the cities shared by two chunks are inserted once (INSERT IGNORE).
+    on_commit(chunk) is called by the writer thread of each chunk once it is committed, in any order. Returns the
+    number of earthquakes written."""
+    batch = records.QuakeBatch.of(df)
+    chunks = [batch[start:start + chunk_size] for start in range(0, len(batch), chunk_size)]
+    with db_pool.WriterPool(pool, lambda chunk, connection: upsert_earthquakes(chunk, connection, chunk_size, cache),
+                            workers=writers, on_written=on_commit) as writer_pool:
+        return sum(writer_pool.map(chunks))
+
+
+# the columns of each table of natural events and the column of the events dataframe (see API_scraper_v1) they are
+# filled with. latitude and longitude come from the GeoJSON coordinates [longitude, latitude] of the event.
+EVENT_TABLES = {'fire': {'fire_name': 'title', 'latitude': 'latitude', 'longitude': 'longitude',
+                         'date_time': 'date'},
+                'volcano': {'volcano_name': 'title', 'latitude': 'latitude', 'longitude': 'longitude',
+                            'date_time': 'date'},
+                'iceberg': {'iceberg_name': 'title', 'magnitude_value': 'magnitude_value',
+                            'magnitude_unit': 'magnitude_unit', 'date_time': 'date'}}
+# the table of each kind of event of the dictionary returned by API_scraper_v1.main
+EVENT_TABLE_BY_TYPE = {'Fire': 'fire', 'Volcano': 'volcano', 'Iceberg': 'iceberg'}
+
+
+def event_rows(df, columns):
+    """ returns the rows (eonet_id, values of columns...) of an events dataframe for the given mapping {table column:
+    dataframe column}. The dates are python dates and the missing values are None."""
+    events = pd.DataFrame({'eonet_id': df['id'].str.extract(r'(\d+)', expand=False).astype(int)})
+    if 'coordinates' in df:
+        coordinates = df['coordinates'].tolist()
+        points = [point if isinstance(point, (list, tuple)) and len(point) == 2 else (None, None)
+                  for point in coordinates]
+        events['longitude'] = [point[0] for point in points]
+        events['latitude'] = [point[1] for point in points]
+    for source in columns.values():
+        if source not in events:
+            events[source] = df[source].to_numpy()
+    if 'date' in events:
+        # the date_time columns are DATE, pymysql escapes python dates but not pandas Timestamps
+        events['date'] = pd.to_datetime(events['date'], utc=True).dt.date
+    events = events[['eonet_id'] + list(columns.values())].astype(object)
+    return list(events.where(pd.notnull(events), None).itertuples(index=False, name=None))
+
+
+def upsert_events(df, connection, table, columns=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ this function writes the natural events of df to table. The columns of the table and the columns of df they
+    come from are given by columns, EVENT_TABLES[table] by default. Each chunk of chunk_size events is written with
+    one multi-row INSERT ... ON DUPLICATE KEY UPDATE (the unique key on eonet_id), in one transaction. Returns the
+    number of events written."""
+    columns = columns or EVENT_TABLES[table]
+    table_columns = ['eonet_id'] + list(columns)
+    upsert = f"""INSERT INTO {table} ({', '.join(table_columns)})
+                 VALUES ({placeholders(table_columns)})
+                 ON DUPLICATE KEY UPDATE {', '.join(f'{column} = VALUES({column})' for column in columns)}"""
+    rows = event_rows(df, columns) if len(df) else []
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        try:
+            with metrics.count_round_trips(connection.cursor()) as cursor:
+                cursor.executemany(upsert, chunk)
+                affected = cursor.rowcount
+            connection.commit()
+            metrics.inc('db_commits_total', table=table, backend='mysql')
+            metrics.observe('db_rows_per_commit', len(chunk), table=table, backend='mysql')
+        except Exception:
+            connection.rollback()
+            logger.error(f'failed to write events {start} to {start + len(chunk)} of {table}, chunk rolled back')
+            raise
+        # MySQL counts 1 affected row per event inserted, 2 per event updated and 0 per event unchanged
+        logger.info(f'wrote {len(chunk)} events to {table} table, {affected} rows affected')
+    return len(rows)
+
+
+HAZARD_LINK_COLUMNS = ('link_id', 'hazard_table', 'eonet_id', 'distance_km', 'days_apart')
+
+
+def upsert_hazard_links(df, connection, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ writes the pairs of earthquakes and events found by hazard_join to the eq_hazard_links table, chunk_size pairs
+    per transaction. A pair already linked gets the new distance and days. Returns the number of pairs written."""
+    upsert = f"""INSERT INTO eq_hazard_links ({', '.join(HAZARD_LINK_COLUMNS)})
+                 VALUES ({placeholders(HAZARD_LINK_COLUMNS)})
+                 ON DUPLICATE KEY UPDATE distance_km = VALUES(distance_km), days_apart = VALUES(days_apart)"""
+    rows = [(int(link_id), table, int(eonet_id), float(distance), float(apart))
+            for link_id, table, eonet_id, distance, apart in df[list(HAZARD_LINK_COLUMNS)].itertuples(index=False)]
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        try:
+            with metrics.count_round_trips(connection.cursor()) as cursor:
+                cursor.executemany(upsert, chunk)
+            connection.commit()
+            metrics.inc('db_commits_total', table='eq_hazard_links', backend='mysql')
+            metrics.observe('db_rows_per_commit', len(chunk), table='eq_hazard_links', backend='mysql')
+        except Exception:
+            connection.rollback()
+            logger.error(f'failed to write hazard links {start} to {start + len(chunk)}, chunk rolled back')
+            raise
+    logger.info(f'wrote {len(rows)} links between earthquakes and events')
+    return len(rows)
+
+
+def upsert_all_events(dict_of_df, connection, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ writes every kind of event of EVENT_TABLE_BY_TYPE found in the dictionary returned by API_scraper_v1.main to
+    its table"""
+    for event_type, table in EVENT_TABLE_BY_TYPE.items():
+        if event_type in dict_of_df:
+            upsert_events(dict_of_df[event_type], connection, table, chunk_size=chunk_size)
+            logger.info(f'database updated with {event_type} data')
+
+
+def update_fire(df, connection):
+    """ This function updates the fire table with the data scraped from the API, see upsert_events. connection can
+    also be a storage backend (see storage). """
+    if hasattr(connection, 'write_events'):
+        return connection.write_events(df, 'fire')
+    return upsert_events(df, connection, 'fire')
+
+
+def update_volcano(df, connection):
+    """ This function updates the volcano table with the data scraped from the API, see upsert_events. connection can
+    also be a storage backend (see storage). """
+    if hasattr(connection, 'write_events'):
+        return connection.write_events(df, 'volcano')
+    return upsert_events(df, connection, 'volcano')
+
+
+def update_iceberg(df, connection):
+    """ This function updates the iceberg table with the data scraped from the API, see upsert_events. connection can
+    also be a storage backend (see storage). """
+    if hasattr(connection, 'write_events'):
+        return connection.write_events(df, 'iceberg')
+    return upsert_events(df, connection, 'iceberg')
 
 
 if __name__ == '__main__':